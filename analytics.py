@@ -0,0 +1,278 @@
+"""
+スコア分布分析モジュール
+サーベイの回答を一度だけ読み込んで列ごとの配列に保持し、
+分布・パーセンタイル・ばらつき・好意的回答率を部門別 / 入社年別にまとめて算出する
+（NumPy があればベクトル演算、なければ標準ライブラリの array で代替）
+"""
+import math
+from array import array
+
+import config
+import database as db
+import snapshot
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SCORE_KEYS = db.SCORE_KEYS
+GROUP_FIELDS = ("department", "join_year")
+PERCENTILES = (25, 50, 75, 90)
+Z_95 = 1.96
+
+
+# ─── 読み込み ──────────────────────────────────
+
+def _encode(values: list) -> tuple[list[int], list]:
+    """グループキーを整数コードに変換（ラベルは出現順）"""
+    labels, index, codes = [], {}, []
+    for v in values:
+        if v not in index:
+            index[v] = len(labels)
+            labels.append(v)
+        codes.append(index[v])
+    return codes, labels
+
+
+def build_table(rows) -> dict:
+    """
+    (department, join_year, 各設問スコア...) の行から列指向のテーブルを構築
+    - scores: {設問キー: float配列}
+    - groups: {グループ項目: (int配列のコード, ラベル一覧)}
+    """
+    columns = list(zip(*rows)) if rows else [()] * (len(GROUP_FIELDS) + len(SCORE_KEYS))
+    groups = {}
+    for i, field in enumerate(GROUP_FIELDS):
+        codes, labels = _encode(columns[i])
+        groups[field] = (_int_array(codes), labels)
+    scores = {
+        key: _float_array(columns[len(GROUP_FIELDS) + i])
+        for i, key in enumerate(SCORE_KEYS)
+    }
+    return {"n": len(rows), "scores": scores, "groups": groups}
+
+
+def _float_array(values):
+    return np.asarray(values, dtype=np.float64) if np is not None else array("d", values)
+
+
+def _int_array(values):
+    return np.asarray(values, dtype=np.int32) if np is not None else array("i", values)
+
+
+def load_snapshot_table(snap: dict) -> dict:
+    """スナップショットの列をコピーせずにテーブルとして扱う"""
+    use_np = np is not None
+    return {
+        "n": snap["header"]["rows"],
+        "scores": {key: snapshot.column(snap, key, numpy=use_np) for key in SCORE_KEYS},
+        "groups": {
+            field: (snapshot.column(snap, field, numpy=use_np), snapshot.labels(snap, field))
+            for field in GROUP_FIELDS
+        },
+    }
+
+
+def load_scores(survey_id: int) -> dict:
+    """
+    サーベイの回答を列指向テーブルとして読み込む
+    スナップショットがあればそれを、なければ1クエリでDBから読む（アーカイブ済みならアーカイブから）
+    """
+    snap = snapshot.open_snapshot(survey_id)
+    if snap:
+        return load_snapshot_table(snap)
+    with db.get_read_db() as conn:
+        schema = db._survey_schema(conn, survey_id)
+        rows = conn.execute(
+            f"""SELECT e.department, e.join_year, {", ".join(f"r.{k}" for k in SCORE_KEYS)}
+                FROM {schema}.responses r
+                JOIN employees e ON r.employee_id = e.id
+                WHERE r.survey_id = ?""",
+            (survey_id,),
+        ).fetchall()
+    return build_table([tuple(r) for r in rows])
+
+
+# ─── 集計（NumPy） ───────────────────────────────
+
+def _percentiles_np(sorted_vals) -> dict:
+    return {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(sorted_vals, PERCENTILES))}
+
+
+def _summaries_np(values, codes, group_count: int) -> list[dict]:
+    """全グループ分の統計量をまとめて算出"""
+    counts = np.bincount(codes, minlength=group_count)
+    sums = np.bincount(codes, weights=values, minlength=group_count)
+    sq_sums = np.bincount(codes, weights=values * values, minlength=group_count)
+    buckets = np.clip(np.floor(values + 0.5), 1, 5).astype(np.int64) - 1
+    hist = np.bincount(codes * 5 + buckets, minlength=group_count * 5).reshape(group_count, 5)
+    favourable = np.bincount(codes, weights=values >= config.FAVOURABLE_SCORE, minlength=group_count)
+    unfavourable = np.bincount(codes, weights=values <= config.UNFAVOURABLE_SCORE, minlength=group_count)
+
+    # グループ → 値の順に並べ、境界で分割してパーセンタイルを求める
+    order = np.lexsort((values, codes))
+    bounds = np.cumsum(counts)[:-1]
+    slices = np.split(values[order], bounds)
+
+    summaries = []
+    for g in range(group_count):
+        n = int(counts[g])
+        if n == 0:
+            summaries.append({"n": 0})
+            continue
+        summaries.append(_finish(
+            n, float(sums[g]), float(sq_sums[g]), hist[g].tolist(),
+            float(favourable[g]), float(unfavourable[g]), _percentiles_np(slices[g]),
+        ))
+    return summaries
+
+
+# ─── 集計（標準ライブラリ） ─────────────────────────
+
+def _percentile(sorted_vals, p: float) -> float:
+    """線形補間によるパーセンタイル（numpy.percentile の既定と同じ）"""
+    pos = (len(sorted_vals) - 1) * p / 100
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (pos - lo)
+
+
+def _summaries_array(values, codes, group_count: int) -> list[dict]:
+    per_group = [array("d") for _ in range(group_count)]
+    for code, v in zip(codes, values):
+        per_group[code].append(v)
+
+    summaries = []
+    for vals in per_group:
+        n = len(vals)
+        if n == 0:
+            summaries.append({"n": 0})
+            continue
+        hist = [0] * 5
+        for v in vals:
+            hist[min(max(math.floor(v + 0.5), 1), 5) - 1] += 1
+        ordered = sorted(vals)
+        summaries.append(_finish(
+            n, math.fsum(vals), math.fsum(v * v for v in vals), hist,
+            sum(1 for v in vals if v >= config.FAVOURABLE_SCORE),
+            sum(1 for v in vals if v <= config.UNFAVOURABLE_SCORE),
+            {f"p{p}": round(_percentile(ordered, p), 2) for p in PERCENTILES},
+        ))
+    return summaries
+
+
+def _finish(n: int, total: float, sq_total: float, hist: list[int],
+            favourable: float, unfavourable: float, percentiles: dict) -> dict:
+    """合計値から平均・標準偏差（不偏）・95%信頼区間などを組み立てる"""
+    mean = total / n
+    variance = max(sq_total - n * mean * mean, 0.0) / (n - 1) if n > 1 else 0.0
+    sd = math.sqrt(variance)
+    margin = Z_95 * sd / math.sqrt(n)
+    return {
+        "n": n,
+        "mean": round(mean, 2),
+        "sd": round(sd, 2),
+        "ci95": [round(mean - margin, 2), round(mean + margin, 2)],
+        "median": percentiles["p50"],
+        "percentiles": percentiles,
+        "histogram": {str(i + 1): int(c) for i, c in enumerate(hist)},
+        "favourable_rate": round(favourable / n * 100, 1),
+        "unfavourable_rate": round(unfavourable / n * 100, 1),
+    }
+
+
+def _summaries(values, codes, group_count: int) -> list[dict]:
+    if np is not None:
+        return _summaries_np(values, codes, group_count)
+    return _summaries_array(values, codes, group_count)
+
+
+# ─── 公開API ──────────────────────────────────
+
+def summarize(table: dict, group_by: str = None) -> dict:
+    """
+    読み込み済みテーブルの分布統計
+    group_by: None（全体）/ "department" / "join_year"
+    """
+    if group_by is None:
+        codes, labels = _int_array([0] * table["n"]), ["全体"]
+    elif group_by in GROUP_FIELDS:
+        codes, labels = table["groups"][group_by]
+    else:
+        raise ValueError(f"group_by は {', '.join(GROUP_FIELDS)} のいずれかを指定してください")
+
+    groups = [{"key": label, "scores": {}} for label in labels]
+    for key in SCORE_KEYS:
+        for group, summary in zip(groups, _summaries(table["scores"][key], codes, len(labels))):
+            group["scores"][key] = summary
+    for group in groups:
+        group["n"] = group["scores"][SCORE_KEYS[0]]["n"] if SCORE_KEYS else 0
+    groups.sort(key=lambda g: (g["key"] is None, str(g["key"])))
+
+    return {
+        "group_by": group_by,
+        "backend": "numpy" if np is not None else "array",
+        "total": table["n"],
+        "groups": groups,
+    }
+
+
+def get_score_distribution(survey_id: int, group_by: str = None) -> dict:
+    """サーベイのスコア分布（全体 / 部門別 / 入社年別）"""
+    return {"survey_id": survey_id, **summarize(load_scores(survey_id), group_by)}
+
+
+# ─── ベンチマーク ─────────────────────────────────
+
+def _naive_summarize(rows, group_index: int) -> dict:
+    """比較用: 行ごとにPythonで集計する素朴な実装"""
+    import statistics
+    grouped = {}
+    for row in rows:
+        for i, key in enumerate(SCORE_KEYS):
+            grouped.setdefault((row[group_index], key), []).append(row[len(GROUP_FIELDS) + i])
+    result = {}
+    for (group, key), vals in grouped.items():
+        ordered = sorted(vals)
+        result[(group, key)] = {
+            "mean": statistics.fmean(vals),
+            "sd": statistics.stdev(vals) if len(vals) > 1 else 0.0,
+            "percentiles": [_percentile(ordered, p) for p in PERCENTILES],
+            "histogram": [sum(1 for v in vals if min(max(math.floor(v + 0.5), 1), 5) == b) for b in range(1, 6)],
+            "favourable": sum(1 for v in vals if v >= config.FAVOURABLE_SCORE) / len(vals),
+            "unfavourable": sum(1 for v in vals if v <= config.UNFAVOURABLE_SCORE) / len(vals),
+        }
+    return result
+
+
+def benchmark(n: int = 100_000, departments: int = 30):
+    """合成データで一括集計と行ごとのPython集計を比較"""
+    import random
+    import time
+
+    rng = random.Random(0)
+    rows = [
+        (f"{d:02d} 部門", 2000 + rng.randrange(26), *(round(rng.uniform(1, 5), 1) for _ in SCORE_KEYS))
+        for d in (rng.randrange(departments) for _ in range(n))
+    ]
+    print(f"[ベンチマーク] {n:,}件 / {departments}部門  backend={'numpy' if np is not None else 'array'}")
+
+    start = time.perf_counter()
+    table = build_table(rows)
+    loaded = time.perf_counter()
+    for group_by in GROUP_FIELDS:
+        summarize(table, group_by)
+    done = time.perf_counter()
+    print(f"  列指向:   読み込み {loaded - start:.3f}s + 集計 {done - loaded:.3f}s")
+
+    start = time.perf_counter()
+    for i in range(len(GROUP_FIELDS)):
+        _naive_summarize(rows, i)
+    naive = time.perf_counter() - start
+    print(f"  行ごと:   集計 {naive:.3f}s  (×{naive / (done - loaded):.1f})")
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -1,23 +1,40 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, g
 from datetime import datetime
 from functools import wraps
 import os
 import base64
+import time
 
 import config
 import database as db
 import survey_manager as sm
+import analytics
+import bootstrap
+import email_report
+import hierarchy
+import ingest
+import maintenance
+import profiler
+import ratelimit
+import response_cache
+import static_assets
+import tenants
+import timeline
+import trends
 
 # ============================================================
 # Flask 初期化
 # ============================================================
 app = Flask(__name__, static_folder=None)
 app.config["JSON_AS_ASCII"] = False
+app.wsgi_app = tenants.PathPrefixMiddleware(app.wsgi_app)
 
 db.init_db()
+maintenance.start_scheduler()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 REACT_BUILD_DIR = os.path.join(BASE_DIR, "frontend", "build")
+static_assets.load(REACT_BUILD_DIR)
 
 def _seed_persistent_db():
     bundled_db = os.path.join(BASE_DIR, "survey.db")
@@ -54,6 +71,38 @@ def _seed_persistent_db():
 
 _seed_persistent_db()
 
+# ============================================================
+# テナントの切り替え（SURVEY_MULTI_TENANT=1 のとき）
+# ============================================================
+@app.before_request
+def enter_tenant():
+    if not config.MULTI_TENANT:
+        return None
+    tenant_id = tenants.resolve(request)
+    if tenant_id is None:
+        if request.path.startswith(("/api/", "/survey/")) and not request.path.startswith("/api/admin/tenants"):
+            return jsonify({"error": "テナントが指定されていません"}), 404
+        return None
+    if not tenants.exists(tenant_id):
+        return jsonify({"error": "テナントが見つかりません"}), 404
+    g.tenant_context = tenants.use_tenant(tenant_id)
+    g.tenant_context.__enter__()
+    g.tenant_id = tenant_id
+    g.tenant_started = time.perf_counter()
+    return None
+
+@app.after_request
+def record_tenant_metrics(response):
+    if "tenant_id" in g:
+        tenants.record_request(g.tenant_id, time.perf_counter() - g.tenant_started, response.status_code)
+    return response
+
+@app.teardown_request
+def leave_tenant(exc):
+    context = g.pop("tenant_context", None)
+    if context is not None:
+        context.__exit__(None, None, None)
+
 # ============================================================
 # Basic認証（管理者向けAPIの保護）
 # ============================================================
@@ -81,7 +130,7 @@ def require_admin_auth(f):
 # ============================================================
 @app.route("/health", methods=["GET"])
 def health():
-    db_path = config.DATABASE_PATH
+    db_path = db.current_db_path()
     db_exists = os.path.exists(db_path)
     db_size = os.path.getsize(db_path) if db_exists else 0
     survey_count = 0
@@ -111,6 +160,7 @@ def health():
 # 回答者向け API（認証不要）
 # ============================================================
 @app.route("/api/survey/submit", methods=["POST"])
+@ratelimit.limited("submit")
 def submit_survey():
     data = request.get_json()
     if not data or "token" not in data:
@@ -130,6 +180,7 @@ def submit_survey():
         return jsonify({"error": str(e)}), 400
 
 @app.route("/api/survey/validate/<token>", methods=["GET"])
+@ratelimit.limited("validate")
 def validate_survey_token(token):
     info = sm.validate_token(token)
     if not info:
@@ -141,57 +192,242 @@ def validate_survey_token(token):
         "deadline": info["deadline"],
     })
 
+@app.route("/api/survey/bootstrap/<token>", methods=["GET"])
+@ratelimit.limited("validate")
+def survey_bootstrap(token):
+    return bootstrap.serve(token)
+
 # ============================================================
 # 管理者向け API（Basic認証必須）
 # ============================================================
 @app.route("/api/admin/surveys", methods=["GET"])
 @require_admin_auth
+@response_cache.cached()
 def list_surveys():
-    with db.get_db() as conn:
-        rows = conn.execute("SELECT * FROM surveys ORDER BY year_month DESC").fetchall()
-        return jsonify([dict(r) for r in rows])
+    return jsonify(db.list_surveys())
 
 @app.route("/api/admin/surveys/<int:survey_id>/prepare", methods=["POST"])
 @require_admin_auth
 def prepare_survey(survey_id):
     try:
         result = sm.prepare_survey(survey_id)
-        return jsonify({"status": "success", "total": result["total"], "sample_urls": [t["url"] for t in result["tokens"][:5]]})
+        return jsonify({"status": "success", "total": result["total"], "sample_urls": [t.url for t in result["tokens"][:5]]})
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
 @app.route("/api/admin/surveys/<int:survey_id>/responses", methods=["GET"])
 @require_admin_auth
+@response_cache.cached("survey_id")
 def survey_responses(survey_id):
     return jsonify(db.get_responses(survey_id))
 
 @app.route("/api/admin/surveys/<int:survey_id>/stats", methods=["GET"])
 @require_admin_auth
+@response_cache.cached("survey_id")
 def survey_stats(survey_id):
     return jsonify(db.get_survey_stats(survey_id))
 
 @app.route("/api/admin/surveys/<int:survey_id>/progress", methods=["GET"])
 @require_admin_auth
+@response_cache.cached("survey_id")
 def survey_progress(survey_id):
     return jsonify(sm.get_survey_progress(survey_id))
 
+@app.route("/api/admin/surveys/<int:survey_id>/close", methods=["POST"])
+@require_admin_auth
+def close_survey(survey_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        result = sm.close_survey(survey_id, freeze=data.get("snapshot"))
+        return jsonify({"status": "success", **result})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/admin/surveys/<int:survey_id>/analytics", methods=["GET"])
+@require_admin_auth
+def survey_analytics(survey_id):
+    try:
+        return jsonify(analytics.get_score_distribution(survey_id, group_by=request.args.get("group_by")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/admin/surveys/<int:survey_id>/email-report", methods=["GET"])
+@require_admin_auth
+def survey_email_report(survey_id):
+    try:
+        return jsonify(email_report.get_delivery_report(survey_id))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/admin/surveys/<int:survey_id>/hierarchy", methods=["GET"])
+@require_admin_auth
+@response_cache.cached("survey_id")
+def survey_hierarchy(survey_id):
+    try:
+        return jsonify(hierarchy.get_hierarchy(
+            survey_id, min_group_size=request.args.get("min_group_size", type=int)
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/admin/surveys/<int:survey_id>/department-drops", methods=["GET"])
+@require_admin_auth
+def survey_department_drops(survey_id):
+    return jsonify(trends.get_department_drops(survey_id, limit=request.args.get("limit", type=int)))
+
+@app.route("/api/admin/surveys/<int:survey_id>/score-drops", methods=["GET"])
+@require_admin_auth
+def survey_score_drops(survey_id):
+    min_drop = request.args.get("min_drop", type=float)
+    return jsonify(db.get_score_drops(
+        survey_id,
+        min_drop=config.SCORE_DROP_THRESHOLD if min_drop is None else min_drop,
+        limit=request.args.get("limit", type=int),
+    ))
+
+@app.route("/api/admin/surveys/<int:survey_id>/themes", methods=["GET"])
+@require_admin_auth
+def survey_comment_themes(survey_id):
+    return jsonify(trends.get_comment_themes(
+        survey_id,
+        department=request.args.get("department"),
+        limit=request.args.get("limit", 20, type=int),
+    ))
+
+@app.route("/api/admin/trends", methods=["GET"])
+@require_admin_auth
+def score_trends():
+    return jsonify(trends.get_trends(
+        department=request.args.get("department"),
+        since=request.args.get("since"),
+        until=request.args.get("until"),
+    ))
+
+@app.route("/api/admin/comments/search", methods=["GET"])
+@require_admin_auth
+def search_comments():
+    query = request.args.get("q", "")
+    if not query.strip():
+        return jsonify({"error": "検索語（q）が必要です"}), 400
+    return jsonify(db.search_comments(
+        query,
+        survey_id=request.args.get("survey_id", type=int),
+        department=request.args.get("department"),
+        min_score=request.args.get("min_score", type=float),
+        max_score=request.args.get("max_score", type=float),
+        limit=request.args.get("limit", 50, type=int),
+    ))
+
+@app.route("/api/admin/alerts", methods=["GET"])
+@require_admin_auth
+def list_alerts():
+    survey_id = request.args.get("survey_id", type=int)
+    status = request.args.get("status")
+    return jsonify(db.get_alerts(survey_id=survey_id, status=status))
+
+@app.route("/api/admin/alerts/<int:alert_id>/handle", methods=["POST"])
+@require_admin_auth
+def handle_alert(alert_id):
+    data = request.get_json()
+    if not data or not data.get("author") or not data.get("note"):
+        return jsonify({"error": "author と note が必要です"}), 400
+    try:
+        result = sm.handle_alert(
+            alert_id=alert_id,
+            author=data["author"],
+            note=data["note"],
+            action_type=data.get("action_type", "memo"),
+            status=data.get("status", "handled"),
+        )
+        return jsonify({"status": "success", **result})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/admin/employees/<int:employee_id>/timeline", methods=["GET"])
+@require_admin_auth
+def employee_timeline(employee_id):
+    kinds = request.args.get("kind")
+    try:
+        return jsonify(timeline.get_timeline(
+            employee_id,
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit", timeline.DEFAULT_LIMIT, type=int),
+            kinds=kinds.split(",") if kinds else None,
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/api/admin/responses/ingest", methods=["POST"])
+@require_admin_auth
+def ingest_responses():
+    fmt = request.args.get("format") or ingest.detect_format(content_type=request.content_type)
+    try:
+        result = ingest.ingest_stream(
+            request.stream, fmt,
+            survey_id=request.args.get("survey_id", type=int),
+            dry_run=request.args.get("dry_run") == "1",
+            notify=request.args.get("notify", "1") == "1",
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@app.route("/api/admin/tenants", methods=["GET"])
+@require_admin_auth
+def list_tenants():
+    return jsonify({"multi_tenant": config.MULTI_TENANT, "tenants": tenants.get_metrics()})
+
+@app.route("/api/admin/maintenance", methods=["GET"])
+@require_admin_auth
+def maintenance_status():
+    return jsonify({
+        "interval": config.MAINTENANCE_INTERVAL,
+        "last_run": maintenance.get_last_report(),
+        "response_cache": response_cache.stats(),
+        "rate_limit": ratelimit.stats(),
+    })
+
+@app.route("/api/admin/profile", methods=["POST"])
+@require_admin_auth
+def profile_worker():
+    """
+    このワーカーを seconds 秒間サンプリングし、collapsed 形式（?format=json で JSON）で返す
+    採取中はこの要求のスレッドが待つだけなので、他の要求を同じワーカーの別スレッドで処理できる構成
+    （gunicorn --threads 2 以上 / -k gthread、python app.py）でないと何も採れない。そうでなければ 400 を返す
+    """
+    if not request.environ.get("wsgi.multithread"):
+        return jsonify({"error": "このワーカーは1スレッドで動いているため、採取中に他の要求を処理できません。"
+                                 "gunicorn を --threads 2 以上（-k gthread）で起動してください"}), 400
+    try:
+        result = profiler.profile(
+            request.args.get("seconds", 10, type=float),
+            interval_ms=request.args.get("interval_ms", type=int),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if request.args.get("format") == "json":
+        return jsonify({**result, "stacks": dict(result["stacks"].most_common())})
+    headers = {
+        "Content-Disposition": f'attachment; filename="profile-{datetime.now():%Y%m%d-%H%M%S}.folded"',
+        "X-Profile-Samples": str(result["samples"]),
+        "X-Profile-Seconds": str(result["seconds"]),
+    }
+    return app.response_class(profiler.collapsed(result), mimetype="text/plain", headers=headers)
+
 # ============================================================
 # React SPA 配信
 # ============================================================
 @app.route("/")
 def index():
-    return send_from_directory(REACT_BUILD_DIR, "index.html")
+    return static_assets.serve(static_assets.INDEX_FILE)
 
 @app.route("/static/<path:filename>")
 def react_static(filename):
-    return send_from_directory(os.path.join(REACT_BUILD_DIR, "static"), filename)
+    return static_assets.serve("static/" + filename, fallback=False)
 
 @app.route("/<path:path>")
 def react_catch_all(path):
-    file_path = os.path.join(REACT_BUILD_DIR, path)
-    if os.path.exists(file_path):
-        return send_from_directory(REACT_BUILD_DIR, path)
-    return send_from_directory(REACT_BUILD_DIR, "index.html")
+    return static_assets.serve(path)
 
 # ============================================================
 # 起動
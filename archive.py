@@ -0,0 +1,160 @@
+"""
+アーカイブ管理モジュール
+締切済みサーベイのトークン・回答・メールログ・アラートを年別のSQLiteファイルへ移し、
+稼働中の survey.db には受付中のサーベイ分だけを残す
+（履歴参照時は database 側でアーカイブを ATTACH して透過的に読む）
+"""
+import os
+import re
+
+import config
+import database as db
+import maintenance
+
+# アーカイブ側のテーブル定義から外す外部キー制約
+_FOREIGN_KEY = re.compile(r",\s*FOREIGN KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)", re.IGNORECASE)
+
+
+def archive_file_name(year_month: str) -> str:
+    return f"survey_{year_month[:4]}.db"
+
+
+def _archive_ddl(conn, table: str, schema: str) -> str:
+    """main と同じ定義（主キー・UNIQUE・DEFAULT）のアーカイブ側テーブルの CREATE 文"""
+    sql = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()["sql"]
+    # 参照先（surveys・employees など）はアーカイブ側にないので外部キー制約は外す
+    return f"CREATE TABLE {schema}.{table} " + _FOREIGN_KEY.sub("", sql[sql.index("("):])
+
+
+def _add_missing_columns(conn, table: str, schema: str):
+    """main に後から追加された列をアーカイブ側にも追加"""
+    existing = set(db._table_columns(conn, schema, table))
+    for c in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+        if c["name"] in existing:
+            continue
+        # ALTER TABLE ADD COLUMN は式の既定値・既定値なしの NOT NULL を付けられない
+        default = c["dflt_value"]
+        column = f"{c['name']} {c['type']}" + (f" DEFAULT {default}" if default and not default.startswith("(") else "")
+        conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {column}")
+
+
+def _ensure_archive_tables(conn, schema: str):
+    """アーカイブ側に main と同じ定義のテーブル・参照用インデックス・コメントの全文検索を用意"""
+    for table in db.ARCHIVED_TABLES:
+        exists = conn.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if exists:
+            _add_missing_columns(conn, table, schema)
+        else:
+            conn.execute(_archive_ddl(conn, table, schema))
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_survey ON {table}(survey_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_employee ON {table}(employee_id)")
+
+    if not db.has_comment_index(conn, schema):
+        conn.execute(
+            f"""CREATE VIRTUAL TABLE {schema}.responses_fts USING fts5(
+                comment, content='responses', content_rowid='id', tokenize='trigram')"""
+        )
+        # 索引を持たずに作られたアーカイブは、既存の回答から作り直す
+        conn.execute(f"INSERT INTO {schema}.responses_fts(responses_fts) VALUES ('rebuild')")
+
+
+def get_archivable_surveys(until: str = None) -> list[dict]:
+    """
+    アーカイブ対象のサーベイ（締切済み・未アーカイブ）
+    未対応アラートが残っているサーベイは対象外として理由を付けて返す
+    """
+    where, params = ["s.status = 'closed'", "a.survey_id IS NULL"], []
+    if until is not None:
+        where.append("s.year_month <= ?")
+        params.append(until)
+    with db.get_db() as conn:
+        rows = conn.execute(
+            f"""SELECT s.*,
+                       (SELECT COUNT(*) FROM alerts al
+                        WHERE al.survey_id = s.id AND al.status != 'handled') as unhandled_alerts
+                FROM surveys s
+                LEFT JOIN survey_archives a ON a.survey_id = s.id
+                WHERE {" AND ".join(where)}
+                ORDER BY s.year_month""",
+            params,
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+def archive_survey(survey_id: int) -> dict:
+    """
+    サーベイ1件をアーカイブ
+    コピー → 削除 → 記録 を1トランザクションで行う（id を保持するので再実行しても重複しない）
+    """
+    survey = db.get_survey(survey_id)
+    if not survey:
+        raise ValueError(f"サーベイID {survey_id} が見つかりません")
+    if survey["status"] != "closed":
+        raise ValueError("アーカイブできるのは締切済みのサーベイのみです")
+
+    file_name = archive_file_name(survey["year_month"])
+    os.makedirs(db.data_path("archive", config.ARCHIVE_DIR), exist_ok=True)
+    with db.get_db() as conn:
+        if conn.execute("SELECT 1 FROM survey_archives WHERE survey_id = ?", (survey_id,)).fetchone():
+            raise ValueError(f"サーベイID {survey_id} はアーカイブ済みです")
+        schema = db.attach_archive(conn, file_name)
+        _ensure_archive_tables(conn, schema)
+
+        counts = {}
+        for table in db.ARCHIVED_TABLES:
+            # 列の順序はDBごとに異なりうる（後から追加した列は末尾）ので列名で対応させる
+            columns = ", ".join(db._table_columns(conn, "main", table))
+            cursor = conn.execute(
+                f"INSERT OR REPLACE INTO {schema}.{table} ({columns}) "
+                f"SELECT {columns} FROM main.{table} WHERE survey_id = ?",
+                (survey_id,),
+            )
+            counts[table] = cursor.rowcount
+        conn.execute(
+            f"""INSERT INTO {schema}.responses_fts(rowid, comment)
+                SELECT id, comment FROM {schema}.responses WHERE survey_id = ?""",
+            (survey_id,),
+        )
+        # 参照関係の逆順に削除
+        for table in reversed(db.ARCHIVED_TABLES):
+            conn.execute(f"DELETE FROM main.{table} WHERE survey_id = ?", (survey_id,))
+        conn.execute(
+            """INSERT INTO survey_archives
+               (survey_id, file_name, token_count, response_count, email_log_count)
+               VALUES (?, ?, ?, ?, ?)""",
+            (survey_id, file_name, counts["survey_tokens"], counts["responses"], counts["email_logs"]),
+        )
+    return {"survey_id": survey_id, "year_month": survey["year_month"], "file_name": file_name, **counts}
+
+
+def archive_closed_surveys(until: str = None, dry_run: bool = False) -> dict:
+    """
+    締切済みサーベイをまとめてアーカイブ
+    - until: この年月以前のサーベイのみ（例: "2025-12"）
+    - 戻り値: {"archived": [...], "skipped": [...], "vacuum": 空き領域の返却結果}
+    """
+    archived, skipped = [], []
+    for survey in get_archivable_surveys(until):
+        if survey["unhandled_alerts"]:
+            skipped.append({
+                "survey_id": survey["id"],
+                "year_month": survey["year_month"],
+                "reason": f"未対応のアラートが{survey['unhandled_alerts']}件あります",
+            })
+            continue
+        if dry_run:
+            archived.append({
+                "survey_id": survey["id"],
+                "year_month": survey["year_month"],
+                "file_name": archive_file_name(survey["year_month"]),
+            })
+            continue
+        archived.append(archive_survey(survey["id"]))
+    result = {"archived": archived, "skipped": skipped}
+    if archived and not dry_run:
+        result["vacuum"] = maintenance.incremental_vacuum()
+    return result
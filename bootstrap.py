@@ -0,0 +1,122 @@
+"""
+回答フォームの初期表示データ（/api/survey/bootstrap/<token>）
+トークンの有効性・設問・サーベイ情報を1回の応答で返し、フォームが追加の通信なしで描画できるようにする
+
+- サーベイ側の部分（タイトル・締切・設問・追加質問）はサーベイごとにJSONへシリアライズして保持し、
+  全体の変更カウンタ（サーベイ・従業員マスタの変更で進む）が変わったときだけ作り直す
+- リクエストごとの処理は、トークン1件とカウンタを一緒に読むインデックス検索1回と、JSONの連結のみ
+- 応答には サーベイ・カウンタ・トークンの状態 から作る ETag を付け、再訪時は 304 を返す
+"""
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import Response, request
+
+import config
+import database as db
+
+MAX_SURVEYS = 256  # 保持するサーベイ部分の数（テナント合計）
+# トークンが無効な理由 → 表示用メッセージ
+REASONS = {
+    "not_found": "URLが正しくありません",
+    "expired": "回答期限が過ぎています",
+    "used": "回答済みです",
+    "closed": "このサーベイは受付を終了しています",
+}
+
+# {(DBパス, サーベイID): (変更カウンタ, ステータス, JSON)}
+_surveys = OrderedDict()
+_lock = threading.Lock()
+
+
+def _questions(survey: dict) -> list[dict]:
+    questions = [
+        {"key": q["key"], "title": q["title"], "description": q["description"],
+         "min": 1, "max": 5, "required": True}
+        for q in config.SURVEY_QUESTIONS
+    ]
+    if survey.get("extra_question_title"):
+        questions.append({
+            "key": "extra_answer", "title": survey["extra_question_title"],
+            "description": survey.get("extra_question_description") or "",
+            "min": 1, "max": 5, "required": False,
+        })
+    return questions
+
+
+def _survey_part(survey_id: int, version: int) -> tuple[str, bytes] | None:
+    """サーベイ部分の (ステータス, JSON)。カウンタが同じならシリアライズ済みのものを返す"""
+    key = (db.current_db_path(), survey_id)
+    with _lock:
+        entry = _surveys.get(key)
+        if entry is not None and entry[0] == version:
+            _surveys.move_to_end(key)
+            return entry[1], entry[2]
+    survey = db.get_survey(survey_id)
+    if survey is None:
+        return None
+    body = json.dumps({
+        "id": survey["id"],
+        "year_month": survey["year_month"],
+        "title": survey["title"],
+        "deadline": survey["deadline"],
+        "questions": _questions(survey),
+    }, ensure_ascii=False, separators=(",", ":")).encode()
+    with _lock:
+        _surveys[key] = (version, survey["status"], body)
+        _surveys.move_to_end(key)
+        while len(_surveys) > MAX_SURVEYS:
+            _surveys.popitem(last=False)
+    return survey["status"], body
+
+
+def _reason(state: dict, status: str) -> str | None:
+    if state["is_used"]:
+        return "used"
+    if status != "active":
+        return "closed"
+    if datetime.now() > datetime.strptime(state["expires_at"], "%Y-%m-%d %H:%M:%S"):
+        return "expired"
+    return None
+
+
+def _respond(payload: bytes, status: int, etag: str = None) -> Response:
+    response = Response(payload, status=status, mimetype="application/json")
+    # 従業員名を含むので共有キャッシュには置かせず、ブラウザには ETag で確認させる
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+def serve(token: str) -> Response:
+    """トークンの初期表示データを返す（無効なトークンは 400 + reason）"""
+    state = db.get_token_state(token)
+    part = _survey_part(state["survey_id"], state["version"]) if state else None
+    if part is None:
+        return _respond(json.dumps(
+            {"valid": False, "reason": "not_found", "message": REASONS["not_found"]}, ensure_ascii=False
+        ).encode(), 400)
+
+    status, survey_json = part
+    reason = _reason(state, status)
+    etag = f"{state['survey_id']}.{state['version']}.{reason or 'ok'}"
+    if request.if_none_match.contains(etag):
+        return _respond(b"", 304, etag)
+
+    head = {"valid": reason is None}
+    if reason:
+        head.update(reason=reason, message=REASONS[reason])
+    else:
+        head.update(employee_name=state["emp_name"], expires_at=state["expires_at"])
+    # シリアライズ済みのサーベイ部分を末尾に連結する
+    payload = json.dumps(head, ensure_ascii=False, separators=(",", ":"))[:-1].encode() + b',"survey":' + survey_json + b"}"
+    return _respond(payload, 400 if reason else 200, etag)
+
+
+def clear():
+    with _lock:
+        _surveys.clear()
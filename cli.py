@@ -5,11 +5,25 @@
 import argparse
 import csv
 import json
+import os
+import shlex
 import sys
+import time
 from datetime import datetime, timedelta
 
 import database as db
 import survey_manager as sm
+import analytics
+import archive
+import email_report
+import hierarchy
+import ingest
+import maintenance
+import reports
+import tenants
+import timeline
+import snapshot
+import trends
 import config
 
 
@@ -38,16 +52,17 @@ def cmd_import_employees(args):
 
 def cmd_list_employees(args):
     """従業員一覧を表示"""
-    employees = db.get_active_employees()
-    if not employees:
+    count = 0
+    for emp in db.iter_active_employees():
+        if count == 0:
+            print(f"\n{'ID':>4}  {'名前':<12}  {'部門':<16}  {'メール':<30}  {'入社年'}")
+            print("─" * 80)
+        print(f"{emp.id:>4}  {emp.name:<12}  {emp.department:<16}  {emp.email:<30}  {emp.join_year or '-'}")
+        count += 1
+    if not count:
         print("従業員が登録されていません")
         return
-
-    print(f"\n{'ID':>4}  {'名前':<12}  {'部門':<16}  {'メール':<30}  {'入社年'}")
-    print("─" * 80)
-    for emp in employees:
-        print(f"{emp['id']:>4}  {emp['name']:<12}  {emp['department']:<16}  {emp['email']:<30}  {emp.get('join_year', '-')}")
-    print(f"\n合計: {len(employees)}名")
+    print(f"\n合計: {count}名")
 
 
 def cmd_create_survey(args):
@@ -70,7 +85,7 @@ def cmd_prepare(args):
     print(f"\n✅ {result['total']}名分の回答URLを生成しました\n")
     print("サンプルURL（先頭5名）:")
     for t in result["tokens"][:5]:
-        print(f"  {t['name']:<12} → {t['url']}")
+        print(f"  {t.name:<12} → {t.url}")
 
     if result["total"] > 5:
         print(f"  ... 他 {result['total'] - 5}名")
@@ -81,31 +96,23 @@ def cmd_export_urls(args):
     survey = db.get_survey(args.survey_id)
     if not survey:
         print(f"❌ サーベイID {args.survey_id} が見つかりません")
-        return
-
-    with db.get_db() as conn:
-        rows = conn.execute(
-            """SELECT t.token, e.name, e.email, e.department
-               FROM survey_tokens t
-               JOIN employees e ON t.employee_id = e.id
-               WHERE t.survey_id = ?
-               ORDER BY e.department, e.name""",
-            (args.survey_id,),
-        ).fetchall()
-
-    if not rows:
-        print("❌ トークンが見つかりません。先に prepare コマンドを実行してください")
-        return
+        sys.exit(1)
 
     output = args.output or f"survey_{args.survey_id}_urls.csv"
+    count = 0
     with open(output, "w", encoding="utf-8-sig", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(["名前", "メールアドレス", "部門", "回答URL"])
-        for row in rows:
-            url = sm.build_survey_url(row["token"])
-            writer.writerow([row["name"], row["email"], row["department"], url])
+        for t in db.iter_survey_tokens(args.survey_id):
+            writer.writerow([t.name, t.email, t.department, sm.build_survey_url(t.token)])
+            count += 1
+
+    if not count:
+        os.remove(output)
+        print("❌ トークンが見つかりません。先に prepare コマンドを実行してください")
+        sys.exit(1)
 
-    print(f"✅ {len(rows)}名分のURLを {output} に出力しました")
+    print(f"✅ {count}名分のURLを {output} に出力しました")
     print(f"   サーベイ: {survey['title']}")
     print(f"   締切: {survey['deadline']}")
 
@@ -137,60 +144,587 @@ def cmd_progress(args):
 
 def cmd_alerts(args):
     """アラート対象者を表示"""
-    stats = db.get_survey_stats(args.survey_id)
+    alerts = db.get_alerts(survey_id=args.survey_id, status=args.status)
 
-    if not stats["alerts"]:
+    if not alerts:
         print("🎉 アラート対象者はいません")
         return
 
-    print(f"\n⚠️ アラート対象者: {stats['alert_count']}名")
+    print(f"\n⚠️ アラート対象者: {len(alerts)}名")
     print("─" * 60)
-    for a in stats["alerts"]:
-        min_score = min(a["work_satisfaction"], a["relationships"], a["health"])
-        severity = "🔴 緊急" if min_score < config.CRITICAL_THRESHOLD else "🟡 注意"
-        print(f"  {severity}  {a['name']} ({a['department']})")
+    for a in alerts:
+        severity = "🔴 緊急" if a["severity"] == "critical" else "🟡 注意"
+        print(f"  [{a['id']}] {severity}  {a['name']} ({a['department']})  {a['year_month']}  状態: {a['status']}")
         print(f"         仕事:{a['work_satisfaction']:.1f}  人間関係:{a['relationships']:.1f}  健康:{a['health']:.1f}")
         if a.get("comment"):
             print(f"         💬 {a['comment']}")
         print()
 
 
+def cmd_handle_alert(args):
+    """アラートへの対応を記録"""
+    try:
+        result = sm.handle_alert(
+            alert_id=args.alert_id,
+            author=args.author,
+            note=args.note,
+            action_type=args.action_type,
+            status=args.status,
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ アラート (ID: {result['alert_id']}) を {result['status']} にしました（対応記録ID: {result['follow_up_note_id']}）")
+
+
+def cmd_email_report(args):
+    """メール配信レポート（送信・失敗件数、リマインドの効果、回答までの時間、繰り返し失敗）"""
+    try:
+        report = email_report.get_delivery_report(args.survey_id)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    tokens = report["tokens"]
+    print(f"\n📧 サーベイ {args.survey_id} の配信レポート")
+    print("─" * 60)
+    print(f"  案内済み: {tokens['invited']}/{tokens['total']}名  回答: {tokens['responded']}名")
+    for email_type, c in sorted(report["emails"].items()):
+        print(f"  {email_type:<8} 送信 {c.get('sent', 0):>6}件  失敗 {c.get('failed', 0):>4}件 ({c['failure_rate']}%)")
+
+    r = report["reminders"]
+    print(f"\n  リマインド: {r['reminded']}名 → 回答 {r['responded_after_reminder']}名 ({r['conversion_rate']}%)"
+          + (f"  平均 {r['avg_hours_to_respond']}時間後" if r["avg_hours_to_respond"] is not None else ""))
+
+    times = report["response_times"]
+    if times["responses"]:
+        print(f"\n  案内から回答まで（平均 {times['avg_hours']}時間）:")
+        for b in times["buckets"]:
+            bar = "█" * int(b["ratio"] / 2)
+            print(f"    {b['label']:<8} {b['count']:>6}件 {b['ratio']:>5}% {bar}")
+
+    if report["repeated_failures"]:
+        print(f"\n  ⚠️ 送信に繰り返し失敗しているアドレス: {len(report['repeated_failures'])}件")
+        for f in report["repeated_failures"][:args.limit]:
+            print(f"    {f['email']:<32} {f['name']}（{f['department']}） 通算 {f['total_failures']}回"
+                  + (f"  {f['error_message']}" if f["error_message"] else ""))
+
+
+def cmd_hierarchy(args):
+    """全社 → グループ → 部門・勤続年数帯ごとのスコア（少人数の集団は伏せる）"""
+    try:
+        if args.rebuild:
+            r = hierarchy.rebuild(args.survey_id)
+            print(f"🔄 集計を作り直しました（{r['cells']}セル）")
+        result = hierarchy.get_hierarchy(args.survey_id, min_group_size=args.min_group_size)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    def line(node, indent):
+        label = f"{' ' * indent}{node['name']}"
+        if node["suppressed"]:
+            return f"  {label:<24} {'—':>5}  （{result['min_group_size']}名未満のため非表示）"
+        avg = node["avg"]
+        return (f"  {label:<24} {node['n']:>5}名  総合 {node['overall']:.2f}  "
+                + "  ".join(f"{avg[k]:.2f}" for k in db.SCORE_KEYS))
+
+    print(f"\n🏢 {result['year_month']} の階層別スコア（仕事 / 人間関係 / 健康）")
+    print("─" * 72)
+    print(line(result["company"], 0))
+    for group in result["groups"]:
+        print(line(group, 2))
+        for dept in group["departments"]:
+            print(line(dept, 4))
+    print("\n  勤続年数別")
+    for band in result["tenure"]:
+        print(line(band, 2))
+    if result["suppressed"]:
+        print(f"\n  ※ {result['suppressed']}集団を非表示にしました（{result['min_group_size']}名未満、または逆算防止）")
+
+
+def cmd_timeline(args):
+    """従業員の回答・アラート・対応記録・メールを新しい順に表示"""
+    icons = {"response": "✍️ ", "alert": "⚠️ ", "note": "📝", "email": "📧"}
+    try:
+        result = timeline.get_timeline(
+            args.employee_id, cursor=args.cursor, limit=args.limit,
+            kinds=args.kind.split(",") if args.kind else None,
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    emp = result["employee"]
+    print(f"\n🗂  {emp['name']}（{emp['department']}）のタイムライン")
+    print("─" * 60)
+    for item in result["items"]:
+        head = f"  {item['at']}  {icons[item['kind']]} {item['year_month'] or '-':<8}"
+        if item["kind"] == "response":
+            print(f"{head} 回答  仕事:{item['work_satisfaction']:.1f}  人間関係:{item['relationships']:.1f}  健康:{item['health']:.1f}")
+            if item["comment"]:
+                print(f"{'':>32}💬 {item['comment']}")
+        elif item["kind"] == "alert":
+            print(f"{head} アラート（{item['severity']} / {item['dimension']} {item['score']:.1f}）状態: {item['status']}")
+        elif item["kind"] == "note":
+            print(f"{head} 対応記録（{item['action_type']} / {item['author']}）{item['note']}")
+        else:
+            print(f"{head} メール {item['email_type']}: {item['status']}" + (f"（{item['error_message']}）" if item["error_message"] else ""))
+    if not result["items"]:
+        print("  履歴はありません")
+    if result["next_cursor"]:
+        print(f"\n続き: python cli.py timeline --employee-id {args.employee_id} --cursor {result['next_cursor']}")
+
+
 def cmd_close(args):
     """サーベイを締め切る"""
-    db.close_survey(args.survey_id)
+    try:
+        result = sm.close_survey(args.survey_id, freeze=args.snapshot or None)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
     print(f"✅ サーベイ (ID: {args.survey_id}) を締め切りました")
+    if result["snapshot"]:
+        snap = result["snapshot"]
+        print(f"   スナップショット: {snap['path']} ({snap['rows']}件, {snap['bytes']:,} bytes)")
 
 
-def cmd_export(args):
-    """回答データをCSV出力"""
-    responses = db.get_responses(args.survey_id)
-    if not responses:
+def cmd_snapshot(args):
+    """締切済みサーベイのスナップショットを作成"""
+    try:
+        snap = snapshot.write_snapshot(args.survey_id)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ スナップショットを作成しました: {snap['path']} ({snap['rows']}件, {snap['bytes']:,} bytes)")
+
+
+def cmd_trends(args):
+    """部門・全社のスコア推移を表示"""
+    rows = trends.get_trends(department=args.department, since=args.since, until=args.until)
+    if not rows:
+        print("締切済みサーベイの集計がありません")
+        return
+
+    labels = {q["key"]: q["title"] for q in config.SURVEY_QUESTIONS}
+    print(f"\n📈 スコア推移 - {args.department or '全社'}")
+    print("─" * 60)
+    print(f"  {'年月':<8} {'回答数':>6} {'総合':>6}  " + "  ".join(labels.values()))
+    for r in rows:
+        scores = "  ".join(
+            f"{r['scores'][k]['mean']:>{len(labels[k]) * 2}.2f}" if k in r["scores"] else "-"
+            for k in labels
+        )
+        print(f"  {r['year_month']:<8} {r['n']:>6} {r['overall']:>6.2f}  {scores}")
+
+
+def cmd_dept_drops(args):
+    """前月からスコアが低下した部門を表示"""
+    result = trends.get_department_drops(args.survey_id, limit=args.limit)
+    if not result["previous_survey_id"]:
+        print("比較対象となる前回の締切済みサーベイがありません")
+        return
+
+    print(f"\n📉 部門別スコア低下（{result['previous_year_month']} → 今回）")
+    print("─" * 60)
+    for d in result["drops"]:
+        if d["drop"] <= 0:
+            continue
+        print(f"  {d['department']:<16} {d['previous_overall']:.2f} → {d['overall']:.2f}  (−{d['drop']:.2f})")
+
+
+def cmd_score_drops(args):
+    """前回からスコアが大きく低下した従業員を表示"""
+    min_drop = args.min_drop if args.min_drop is not None else config.SCORE_DROP_THRESHOLD
+    drops = db.get_score_drops(args.survey_id, min_drop=min_drop, limit=args.limit)
+    if not drops:
+        print(f"前回から{min_drop}以上スコアが低下した従業員はいません")
+        return
+
+    print(f"\n📉 スコア低下者: {len(drops)}名（低下幅 {min_drop} 以上）")
+    print("─" * 60)
+    for d in drops:
+        print(f"  {d['name']} ({d['department']})  {d['previous_overall']:.2f} → {d['overall']:.2f}  (−{d['drop_amount']:.2f})")
+        print(f"         最も低下: {d['dimension']} (−{d['dimension_drop']:.1f})  直近平均比: −{d['baseline_drop']:.2f}")
+
+
+def cmd_analytics(args):
+    """スコア分布（中央値・ばらつき・好意的回答率）を表示"""
+    result = analytics.get_score_distribution(args.survey_id, group_by=args.group_by)
+    if not result["total"]:
         print("回答データがありません")
         return
 
+    labels = {q["key"]: q["title"] for q in config.SURVEY_QUESTIONS}
+    print(f"\n📊 スコア分布（{result['total']}件）")
+    for g in result["groups"]:
+        print(f"\n■ {g['key'] if g['key'] is not None else '未設定'} ({g['n']}名)")
+        for key, st in g["scores"].items():
+            hist = " ".join(f"{b}:{c}" for b, c in st["histogram"].items())
+            print(f"  {labels[key]:<6} 平均 {st['mean']:.2f} ±{st['sd']:.2f}  "
+                  f"中央値 {st['median']:.2f}  95%CI {st['ci95'][0]:.2f}〜{st['ci95'][1]:.2f}  "
+                  f"好意 {st['favourable_rate']:.0f}% / 否定 {st['unfavourable_rate']:.0f}%  [{hist}]")
+
+
+def cmd_search_comments(args):
+    """自由記述コメントを検索"""
+    results = db.search_comments(
+        args.query,
+        survey_id=args.survey_id,
+        department=args.department,
+        min_score=args.min_score,
+        max_score=args.max_score,
+        limit=args.limit,
+    )
+    if not results:
+        print("該当するコメントはありません")
+        return
+
+    print(f"\n🔍 「{args.query}」の検索結果: {len(results)}件")
+    print("─" * 60)
+    for r in results:
+        print(f"  {r['year_month']}  {r['name']} ({r['department']})  スコア: {r['score']:.2f}")
+        print(f"         💬 {r['snippet']}")
+
+
+def cmd_themes(args):
+    """コメントの頻出キーワードと増加しているテーマを表示"""
+    result = trends.get_comment_themes(args.survey_id, department=args.department, limit=args.limit)
+    if not result["comment_count"]:
+        print("コメントがありません")
+        return
+
+    print(f"\n💬 頻出キーワード（コメント {result['comment_count']}件）")
+    print("─" * 60)
+    for t in result["top"]:
+        print(f"  {t['term']:<16} {t['n']:>4}件 ({t['share']:.1f}%)")
+    if result["rising"]:
+        print("\n📈 前回から増えたテーマ:")
+        for t in result["rising"]:
+            print(f"  {t['term']:<16} {t['previous_share']:.1f}% → {t['share']:.1f}%  (+{t['change']:.1f}pt)")
+
+
+def cmd_archive(args):
+    """締切済みサーベイを年別アーカイブDBへ移動"""
+    result = archive.archive_closed_surveys(until=args.until, dry_run=args.dry_run)
+    if not result["archived"] and not result["skipped"]:
+        print("アーカイブ対象のサーベイはありません")
+        return
+
+    label = "アーカイブ対象" if args.dry_run else "アーカイブしました"
+    for a in result["archived"]:
+        detail = "" if args.dry_run else f"  (トークン {a['survey_tokens']}件 / 回答 {a['responses']}件 / メールログ {a['email_logs']}件)"
+        print(f"✅ {label}: {a['year_month']} → {a['file_name']}{detail}")
+    for s in result["skipped"]:
+        print(f"⏭️  スキップ: {s['year_month']}  {s['reason']}")
+    if "vacuum" in result and "freed_bytes" in result["vacuum"]:
+        print(f"🧹 空き領域を返却しました: {_format_bytes(result['vacuum']['freed_bytes'])}")
+
+
+def _format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def cmd_maintenance(args):
+    """WALチェックポイント・optimize・インクリメンタルVACUUM（・バックアップ）"""
+    if args.enable_incremental_vacuum:
+        print("⏳ auto_vacuum=INCREMENTAL へ切り替えています（VACUUM 実行中は書き込みが止まります）")
+        result = maintenance.enable_incremental_vacuum()
+        if result["changed"]:
+            print(f"✅ 切り替えました（{_format_bytes(result['freed_bytes'])} 削減）")
+        else:
+            print("切り替え済みです")
+        return
+
+    report = maintenance.run_maintenance(
+        truncate=not args.no_truncate, vacuum=not args.no_vacuum, with_backup=args.backup,
+    )
+    tasks = report["tasks"]
+    for name, t in tasks.items():
+        if name.startswith("checkpoint"):
+            state = "（読み取り中の接続があり一部のみ）" if t["busy"] else ""
+            detail = (f"{t['mode']}: {t['checkpointed_pages']}/{t['wal_pages']}ページ書き戻し, "
+                      f"WAL {_format_bytes(t['wal_bytes_before'])} → {_format_bytes(t['wal_bytes_after'])}{state}")
+        elif name == "incremental_vacuum":
+            detail = t.get("skipped") or (
+                f"{t['free_pages_before'] - t['free_pages_after']}ページ返却 ({_format_bytes(t['freed_bytes'])})")
+        elif name == "backup":
+            detail = f"{t['output']} ({_format_bytes(t['bytes'])}, {t['steps']}ステップ)"
+        else:
+            detail = ""
+        print(f"✅ {name:<20} {t['seconds']:>7.3f}s  {detail}")
+    print(f"\n合計 {report['seconds']:.3f}s  DB {_format_bytes(report['db_bytes'])} / WAL {_format_bytes(report['wal_bytes'])}")
+
+
+def cmd_backup(args):
+    """稼働中のDBをオンラインバックアップ"""
+    result = maintenance.backup(output=args.output, pages_per_step=args.pages_per_step)
+    print(f"✅ バックアップしました: {result['output']} "
+          f"({_format_bytes(result['bytes'])}, {result['steps']}ステップ)")
+    for f in result["removed"]:
+        print(f"🗑️  古いバックアップを削除: {f}")
+
+
+def cmd_ingest(args):
+    """紙・キオスクの回答を CSV / NDJSON から一括登録"""
+    fmt = args.format or ingest.detect_format(name=args.file)
+    if args.file == "-":
+        result = ingest.ingest_stream(sys.stdin, fmt, survey_id=args.survey_id,
+                                      dry_run=args.dry_run, notify=not args.no_notify)
+    else:
+        with open(args.file, encoding="utf-8-sig", newline="") as f:
+            result = ingest.ingest_stream(f, fmt, survey_id=args.survey_id,
+                                          dry_run=args.dry_run, notify=not args.no_notify)
+
+    for r in result["rows"]:
+        if r["status"] == "error":
+            print(f"❌ {r['row']}行目: {r['error']}")
+        elif args.verbose:
+            print(f"✅ {r['row']}行目: 回答ID {r['response_id']}")
+    label = "登録可能" if result["dry_run"] else "登録"
+    print(f"\n{label}: {result['inserted']}件 / エラー: {result['failed']}件 / 全{result['total']}行")
+    if result["alerts"]:
+        print(f"🚨 アラート対象: {result['alerts']}件")
+    if result["refreshed_surveys"]:
+        print(f"🔄 締切済みサーベイの集計を更新: {', '.join(map(str, result['refreshed_surveys']))}")
+    if result["failed"]:
+        sys.exit(1)
+
+
+def cmd_tenants(args):
+    """テナントの一覧表示・作成"""
+    if args.create:
+        result = tenants.create_tenant(args.create)
+        print(f"✅ テナントを作成しました: {result['tenant_id']} ({result['db_path']})")
+        return
+    rows = tenants.get_metrics()
+    if not rows:
+        print(f"テナントはありません（{config.TENANTS_DIR}）")
+        return
+    print(f"{'テナント':<24} {'DBサイズ':>10}")
+    print("-" * 36)
+    for t in rows:
+        print(f"{t['tenant_id']:<24} {_format_bytes(t['db_bytes']):>10}")
+    print(f"\n合計: {len(rows)}テナント")
+
+
+def cmd_migrate(args):
+    """スキーマ移行の状況表示 / 未適用ステップとバックフィルの実行"""
+    import migrations
+    if not args.status:
+        with db.get_db() as conn:
+            result = migrations.migrate(conn)
+        for step in result["applied"]:
+            print(f"✅ v{step['version']}: {step['description']} ({step['seconds']}s)")
+        for b in result["backfills"]:
+            print(f"✅ バックフィル {b['name']}: {b['rows']}行 / {b['batches']}バッチ ({b['seconds']}s)")
+        if not result["applied"] and not result["backfills"]:
+            print(f"スキーマは最新です (v{result['to_version']})")
+        return
+
+    status = migrations.get_status()
+    print(f"スキーマバージョン: v{status['version']} (最新 v{status['latest_version']})")
+    for step in status["pending"]:
+        print(f"  未適用 v{step['version']}: {step['description']}")
+    for b in status["backfills"]:
+        state = "完了" if b["done"] else f"{b['last_id']}/{b['max_id']}"
+        print(f"  バックフィル {b['name']}: {state}  (登録 {b['created_at']})")
+
+
+def cmd_compress_assets(args):
+    """React ビルドの gzip / brotli 圧縮版を書き出す（デプロイ時に実行）"""
+    import static_assets
+    build_dir = args.build_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "build")
+    if not os.path.isdir(build_dir):
+        print(f"❌ ビルドディレクトリが見つかりません: {build_dir}")
+        sys.exit(1)
+    result = static_assets.precompress(build_dir)
+    print(f"✅ 圧縮版を {result['written']}件 書き出しました（形式: {', '.join(result['encodings'])}）")
+    if result["skipped"]:
+        print(f"   圧縮効果が小さいため {result['skipped']}件は作りませんでした")
+    if "br" not in result["encodings"]:
+        print("   brotli パッケージがないため brotli 版は作りません（pip install brotli）")
+
+
+def cmd_audit_indexes(args):
+    """大規模DBを生成して全クエリの実行計画を検査"""
+    import index_audit
+    argv = ["--employees", str(args.employees), "--surveys", str(args.surveys)]
+    if args.verbose:
+        argv.append("--verbose")
+    sys.exit(index_audit.main(argv))
+
+
+def cmd_export(args):
+    """回答データをCSV出力（スナップショットがあればそちらから読む）"""
+    fields = ["name", "department", "work_satisfaction", "relationships",
+              "health", "extra_answer", "comment", "submitted_at"]
+    snap = snapshot.open_snapshot(args.survey_id)
+    if snap:
+        rows = ([r[k] for k in fields] for r in snapshot.iter_responses(snap))
+    else:
+        rows = ([getattr(r, k) for k in fields] for r in db.iter_responses(args.survey_id))
+
     output = args.output or f"survey_{args.survey_id}_responses.csv"
+    count = 0
     with open(output, "w", encoding="utf-8-sig", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            "name", "department", "work_satisfaction", "relationships",
-            "health", "extra_answer", "comment", "submitted_at",
-        ])
-        writer.writeheader()
-        for r in responses:
-            writer.writerow({
-                "name": r["name"],
-                "department": r["department"],
-                "work_satisfaction": r["work_satisfaction"],
-                "relationships": r["relationships"],
-                "health": r["health"],
-                "extra_answer": r.get("extra_answer", ""),
-                "comment": r.get("comment", ""),
-                "submitted_at": r["submitted_at"],
-            })
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
 
-    print(f"✅ {len(responses)}件の回答を {output} に出力しました")
+    if not count:
+        os.remove(output)
+        print("回答データがありません")
+        return
 
+    print(f"✅ {count}件の回答を {output} に出力しました")
+
+
+def cmd_reports(args):
+    """全部門のレポート（HTML / CSV）と全社サマリーを並列に書き出す"""
+    def progress(done, total, department):
+        print(f"\r  [{done}/{total}] {department[:30]:<30}", end="", flush=True)
+
+    try:
+        result = reports.generate_reports(
+            args.survey_id, out_dir=args.output, workers=args.workers, on_progress=progress,
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"\n✅ {result['departments']}部門のレポート（回答 {result['responses']}件）を "
+          f"{result['out_dir']} に出力しました")
+    print(f"   {result['workers']}プロセス  読み込み {result['load_seconds']:.2f}秒 / 合計 {result['seconds']:.2f}秒")
+
+
+def cmd_batch(args):
+    """スクリプト（1行1コマンド）のサブコマンドを1プロセス・1接続でまとめて実行"""
+    if args.file == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.file, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+    # 実行前に全行を解析し、書き間違いがあれば何も実行しない
+    parser = build_parser()
+    steps = []
+    for lineno, line in enumerate(lines, 1):
+        try:
+            argv = shlex.split(line, comments=True)
+        except ValueError as e:
+            print(f"❌ {lineno}行目: {e}")
+            sys.exit(1)
+        if not argv:
+            continue
+        try:
+            step = parser.parse_args(argv)
+        except SystemExit:
+            print(f"❌ {lineno}行目を解析できません: {line.strip()}")
+            sys.exit(1)
+        if step.command in (None, "batch") or step.tenant:
+            print(f"❌ {lineno}行目: batch の中ではサブコマンドのみ指定できます（--tenant は batch 自体に指定）")
+            sys.exit(1)
+        if args.transaction and step.command in NON_TRANSACTIONAL:
+            print(f"❌ {lineno}行目: {step.command} は独自にコミットするため --transaction では実行できません")
+            sys.exit(1)
+        steps.append((lineno, line.strip(), step))
+    if not steps:
+        print("実行するコマンドがありません")
+        return
 
-def main():
+    failed, done = 0, 0
+    start = time.perf_counter()
+    with db.shared_connection(transaction=args.transaction) as conn:
+        for i, (lineno, line, step) in enumerate(steps, 1):
+            print(f"▶ [{i}/{len(steps)}] {line}")
+            t = time.perf_counter()
+            try:
+                COMMANDS[step.command](step)
+                ok = True
+            except SystemExit as e:
+                ok = not e.code
+            except Exception as e:
+                print(f"❌ {lineno}行目: {type(e).__name__}: {e}")
+                ok = False
+            done += 1
+            print(f"⏱ [{i}/{len(steps)}] {step.command}  {time.perf_counter() - t:.3f}秒")
+            if not ok:
+                failed += 1
+                if args.transaction:
+                    conn.rollback()
+                    print(f"↩ {lineno}行目で失敗したため、全ての変更を取り消しました")
+                    break
+                if not args.keep_going:
+                    break
+
+    total = time.perf_counter() - start
+    print(f"\n{'❌' if failed else '✅'} {done}/{len(steps)}件実行（失敗 {failed}件）  合計 {total:.2f}秒"
+          + ("  1トランザクション" if args.transaction else ""))
+    if failed:
+        sys.exit(1)
+
+
+def cmd_profile(args):
+    """稼働中のワーカー（--url）か、このプロセスで実行するコマンド（--run）をサンプリング"""
+    import profiler
+    output = args.output or f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+    if args.run:
+        step = build_parser().parse_args(shlex.split(args.run))
+        if step.command in (None, "profile", "batch"):
+            print("❌ --run には profile / batch 以外のサブコマンドを指定してください")
+            sys.exit(1)
+        with profiler.sampling(args.interval_ms) as result:
+            try:
+                COMMANDS[step.command](step)
+            except SystemExit:
+                pass
+        text = profiler.collapsed(result)
+        samples, seconds = result["samples"], result["seconds"]
+    else:
+        import base64
+        import urllib.error
+        import urllib.parse
+        import urllib.request
+        query = {"seconds": args.seconds}
+        if args.interval_ms:
+            query["interval_ms"] = args.interval_ms
+        credentials = f"{os.environ.get('ADMIN_USER', 'admin')}:{os.environ.get('ADMIN_PASS', 'changeme')}"
+        req = urllib.request.Request(
+            f"{args.url.rstrip('/')}/api/admin/profile?{urllib.parse.urlencode(query)}", method="POST",
+            headers={"Authorization": "Basic " + base64.b64encode(credentials.encode()).decode()},
+        )
+        print(f"⏳ {args.url} を {args.seconds}秒間サンプリングしています...")
+        try:
+            with urllib.request.urlopen(req, timeout=args.seconds + 30) as res:
+                text = res.read().decode("utf-8")
+                samples, seconds = res.headers.get("X-Profile-Samples"), res.headers.get("X-Profile-Seconds")
+        except urllib.error.HTTPError as e:
+            body = e.read().decode("utf-8", "replace")
+            try:
+                body = json.loads(body)["error"]
+            except (ValueError, KeyError, TypeError):
+                pass
+            print(f"❌ {e.code} {body}")
+            sys.exit(1)
+        except urllib.error.URLError as e:
+            print(f"❌ {args.url} に接続できません: {e.reason}")
+            sys.exit(1)
+
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"✅ {samples}回・{seconds}秒分のスタック（{len(text.splitlines())}種類）を {output} に出力しました")
+    print(f"   flamegraph.pl {output} > profile.svg  または https://www.speedscope.app/ で表示")
+
+
+# batch --transaction で実行できないコマンド（自前でコミット・トランザクション開始する、別ファイルへ書き出す）
+NON_TRANSACTIONAL = {"init", "migrate", "ingest", "archive", "maintenance", "backup", "tenants", "audit-indexes"}
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="パルスサーベイ管理ツール",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -213,8 +747,15 @@ def main():
   # アラート確認・CSV出力
   python cli.py alerts --survey-id 1
   python cli.py export --survey-id 1
+
+  # テナントを指定して実行
+  python cli.py --tenant acme progress --survey-id 1
+
+  # 月次手順をまとめて実行（1行1コマンド、1トランザクション）
+  python cli.py batch monthly.txt --transaction
         """,
     )
+    parser.add_argument("--tenant", help="対象テナント（マルチテナント運用時）")
     sub = parser.add_subparsers(dest="command")
 
     # init
@@ -251,36 +792,205 @@ def main():
 
     # alerts
     p = sub.add_parser("alerts", help="アラート対象者を表示")
+    p.add_argument("--survey-id", type=int, help="対象サーベイ（省略時: 全サーベイ）")
+    p.add_argument("--status", choices=["open", "acknowledged", "handled"], help="対応状況で絞り込み")
+
+    # handle-alert
+    p = sub.add_parser("handle-alert", help="アラートへの対応を記録")
+    p.add_argument("--alert-id", type=int, required=True)
+    p.add_argument("--author", required=True, help="対応者")
+    p.add_argument("--note", required=True, help="対応内容")
+    p.add_argument("--action-type", default="memo", choices=["memo", "meeting", "call", "email"])
+    p.add_argument("--status", default="handled", choices=["acknowledged", "handled"])
+
+    # email-report
+    p = sub.add_parser("email-report", help="メール配信レポート（失敗・リマインド効果・回答までの時間）")
+    p.add_argument("--survey-id", type=int, required=True)
+    p.add_argument("--limit", type=int, default=20, help="繰り返し失敗の表示件数")
+
+    # hierarchy
+    p = sub.add_parser("hierarchy", help="全社・グループ・部門・勤続年数帯ごとのスコア（少人数は非表示）")
     p.add_argument("--survey-id", type=int, required=True)
+    p.add_argument("--min-group-size", type=int, help=f"非表示にする人数の基準（既定・最小 {config.MIN_GROUP_SIZE}）")
+    p.add_argument("--rebuild", action="store_true", help="集計を回答から作り直してから表示")
+
+    # timeline
+    p = sub.add_parser("timeline", help="従業員の回答・アラート・対応記録・メールを時系列で表示")
+    p.add_argument("--employee-id", type=int, required=True)
+    p.add_argument("--limit", type=int, default=timeline.DEFAULT_LIMIT, help="1ページの件数")
+    p.add_argument("--cursor", help="前のページの続きから表示")
+    p.add_argument("--kind", help=f"種類を絞り込み（カンマ区切り: {','.join(timeline.KINDS)}）")
 
     # close
     p = sub.add_parser("close", help="サーベイを締め切る")
     p.add_argument("--survey-id", type=int, required=True)
+    p.add_argument("--snapshot", action="store_true", help="回答データのスナップショットも作成")
+
+    # snapshot
+    p = sub.add_parser("snapshot", help="締切済みサーベイのスナップショットを作成")
+    p.add_argument("--survey-id", type=int, required=True)
+
+    # trends
+    p = sub.add_parser("trends", help="スコアの月次推移を表示（締切済みサーベイ）")
+    p.add_argument("--department", help="部門（省略時: 全社）")
+    p.add_argument("--since", help="開始年月（例: 2025-04）")
+    p.add_argument("--until", help="終了年月（例: 2026-03）")
+
+    # dept-drops
+    p = sub.add_parser("dept-drops", help="前月からスコアが低下した部門を表示")
+    p.add_argument("--survey-id", type=int, required=True)
+    p.add_argument("--limit", type=int, default=10)
+
+    # score-drops
+    p = sub.add_parser("score-drops", help="前回からスコアが大きく低下した従業員を表示")
+    p.add_argument("--survey-id", type=int, required=True)
+    p.add_argument("--min-drop", type=float, help=f"低下幅の下限（省略時: {config.SCORE_DROP_THRESHOLD}）")
+    p.add_argument("--limit", type=int)
+
+    # analytics
+    p = sub.add_parser("analytics", help="スコア分布（中央値・ばらつき・好意的回答率）を表示")
+    p.add_argument("--survey-id", type=int, required=True)
+    p.add_argument("--group-by", choices=list(analytics.GROUP_FIELDS), help="部門別 / 入社年別")
+
+    # search-comments
+    p = sub.add_parser("search-comments", help="自由記述コメントを全文検索")
+    p.add_argument("query", help="検索語（空白区切りでAND検索）")
+    p.add_argument("--survey-id", type=int)
+    p.add_argument("--department")
+    p.add_argument("--min-score", type=float, help="3設問平均スコアの下限")
+    p.add_argument("--max-score", type=float, help="3設問平均スコアの上限")
+    p.add_argument("--limit", type=int, default=50)
+
+    # themes
+    p = sub.add_parser("themes", help="コメントの頻出キーワード・増加テーマを表示")
+    p.add_argument("--survey-id", type=int, required=True)
+    p.add_argument("--department")
+    p.add_argument("--limit", type=int, default=20)
+
+    # archive
+    p = sub.add_parser("archive", help="締切済みサーベイを年別アーカイブDBへ移動")
+    p.add_argument("--until", help="この年月以前のサーベイのみ（例: 2025-12）")
+    p.add_argument("--dry-run", action="store_true", help="対象の確認のみ")
+
+    # maintenance
+    p = sub.add_parser("maintenance", help="WALチェックポイント・optimize・VACUUM（稼働中に実行可）")
+    p.add_argument("--backup", action="store_true", help="続けてバックアップも取る")
+    p.add_argument("--no-truncate", action="store_true", help="WALファイルの切り詰めを行わない")
+    p.add_argument("--no-vacuum", action="store_true", help="インクリメンタルVACUUMを行わない")
+    p.add_argument("--enable-incremental-vacuum", action="store_true",
+                   help="既存DBを auto_vacuum=INCREMENTAL に切り替える（全体VACUUM、1回だけ）")
+
+    # backup
+    p = sub.add_parser("backup", help="稼働中のDBをオンラインバックアップ")
+    p.add_argument("--output", help="出力ファイル（省略時は BACKUP_DIR に世代管理）")
+    p.add_argument("--pages-per-step", type=int, help="1回にコピーするページ数")
+
+    # ingest
+    p = sub.add_parser("ingest", help="紙・キオスクの回答を CSV / NDJSON から一括登録")
+    p.add_argument("file", help="入力ファイル（- で標準入力）")
+    p.add_argument("--survey-id", type=int, help="employee_id / email で指定する行の既定サーベイ")
+    p.add_argument("--format", choices=ingest.FORMATS, help="入力形式（省略時は拡張子から判定）")
+    p.add_argument("--dry-run", action="store_true", help="検証のみ")
+    p.add_argument("--no-notify", action="store_true", help="アラートのフック（メール等）を呼ばない")
+    p.add_argument("--verbose", action="store_true", help="成功した行も表示")
+
+    # tenants
+    p = sub.add_parser("tenants", help="テナントの一覧表示・作成")
+    p.add_argument("--create", metavar="TENANT_ID", help="テナントを作成（英小文字・数字・ハイフン）")
+
+    # migrate
+    p = sub.add_parser("migrate", help="スキーマ移行（未適用ステップ・中断したバックフィルを実行）")
+    p.add_argument("--status", action="store_true", help="バージョンと進捗の表示のみ")
+
+    # compress-assets
+    p = sub.add_parser("compress-assets", help="React ビルドの gzip / brotli 圧縮版を書き出す")
+    p.add_argument("--build-dir", help="ビルドディレクトリ（省略時は frontend/build）")
+
+    # audit-indexes
+    p = sub.add_parser("audit-indexes", help="全クエリがインデックスを使うか検査（検査用DBを一時生成）")
+    p.add_argument("--employees", type=int, default=5000)
+    p.add_argument("--surveys", type=int, default=12)
+    p.add_argument("--verbose", action="store_true")
 
     # export
     p = sub.add_parser("export", help="回答データをCSV出力")
     p.add_argument("--survey-id", type=int, required=True)
     p.add_argument("--output", help="出力ファイル名")
 
+    # reports
+    p = sub.add_parser("reports", help="全部門のレポート（HTML / CSV）と全社サマリーを一括出力")
+    p.add_argument("--survey-id", type=int, required=True)
+    p.add_argument("--output", "-o", help="出力先ディレクトリ（既定: REPORT_DIR/<年月>）")
+    p.add_argument("--workers", type=int, help="並列プロセス数（既定: CPU数、1 で並列化しない）")
+
+    # batch
+    p = sub.add_parser("batch", help="ファイル / 標準入力のサブコマンドを1プロセス・1接続でまとめて実行")
+    p.add_argument("file", help="1行1コマンドのスクリプト（- で標準入力、# 以降はコメント）")
+    p.add_argument("--transaction", action="store_true", help="全体を1トランザクションにする（失敗時は全て取り消す）")
+    p.add_argument("--keep-going", action="store_true", help="失敗しても残りのコマンドを続ける")
+
+    # profile
+    p = sub.add_parser("profile", help="稼働中のワーカーをサンプリングしフレームグラフ用のスタックを出力")
+    p.add_argument("--url", default="http://localhost:5000", help="app.py のURL（既定: http://localhost:5000）")
+    p.add_argument("--seconds", type=float, default=10, help="採取する秒数")
+    p.add_argument("--interval-ms", type=int, help=f"採取間隔（ミリ秒、既定: {config.PROFILE_INTERVAL_MS}）")
+    p.add_argument("--run", metavar="COMMAND", help="ワーカーではなくこのプロセスでサブコマンドを実行して採取")
+    p.add_argument("--output", "-o", help="出力ファイル（省略時: profile-<日時>.folded）")
+    return parser
+
+
+COMMANDS = {
+    "init": cmd_init,
+    "import-employees": cmd_import_employees,
+    "list-employees": cmd_list_employees,
+    "create-survey": cmd_create_survey,
+    "prepare": cmd_prepare,
+    "export-urls": cmd_export_urls,
+    "progress": cmd_progress,
+    "alerts": cmd_alerts,
+    "handle-alert": cmd_handle_alert,
+    "timeline": cmd_timeline,
+    "email-report": cmd_email_report,
+    "hierarchy": cmd_hierarchy,
+    "close": cmd_close,
+    "snapshot": cmd_snapshot,
+    "export": cmd_export,
+    "reports": cmd_reports,
+    "trends": cmd_trends,
+    "dept-drops": cmd_dept_drops,
+    "score-drops": cmd_score_drops,
+    "analytics": cmd_analytics,
+    "search-comments": cmd_search_comments,
+    "themes": cmd_themes,
+    "archive": cmd_archive,
+    "maintenance": cmd_maintenance,
+    "backup": cmd_backup,
+    "ingest": cmd_ingest,
+    "tenants": cmd_tenants,
+    "migrate": cmd_migrate,
+    "compress-assets": cmd_compress_assets,
+    "audit-indexes": cmd_audit_indexes,
+    "batch": cmd_batch,
+    "profile": cmd_profile,
+}
+
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
 
     if not args.command:
         parser.print_help()
         return
 
-    commands = {
-        "init": cmd_init,
-        "import-employees": cmd_import_employees,
-        "list-employees": cmd_list_employees,
-        "create-survey": cmd_create_survey,
-        "prepare": cmd_prepare,
-        "export-urls": cmd_export_urls,
-        "progress": cmd_progress,
-        "alerts": cmd_alerts,
-        "close": cmd_close,
-        "export": cmd_export,
-    }
-    commands[args.command](args)
+    if not args.tenant:
+        COMMANDS[args.command](args)
+        return
+    if not tenants.exists(args.tenant):
+        print(f"❌ テナント {args.tenant} が見つかりません（python cli.py tenants --create {args.tenant}）")
+        sys.exit(1)
+    with tenants.use_tenant(args.tenant):
+        COMMANDS[args.command](args)
 
 
 if __name__ == "__main__":
@@ -12,6 +12,71 @@ BASE_URL = os.environ.get("SURVEY_BASE_URL", "http://localhost:5000")
 _BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_PATH = os.environ.get("SURVEY_DB_PATH", os.path.join(_BASE_DIR, "survey.db"))
 
+# 締切済みサーベイのスナップショット（列指向ファイル）の保存先
+SNAPSHOT_DIR = os.environ.get("SURVEY_SNAPSHOT_DIR", os.path.join(_BASE_DIR, "snapshots"))
+SNAPSHOT_ON_CLOSE = os.environ.get("SURVEY_SNAPSHOT_ON_CLOSE", "0") == "1"
+
+# 部門別レポート（cli.py reports）の出力先（年月ごとのサブディレクトリに書き出す）
+REPORT_DIR = os.environ.get("SURVEY_REPORT_DIR", os.path.join(_BASE_DIR, "reports"))
+
+# 締切済みサーベイのトークン・回答・メールログを移す年別アーカイブDBの保存先
+ARCHIVE_DIR = os.environ.get("SURVEY_ARCHIVE_DIR", os.path.join(_BASE_DIR, "archive"))
+
+# 管理画面の集計に使う読み取り専用接続のプールサイズ（DBファイルごと）
+READ_POOL_SIZE = int(os.environ.get("SURVEY_READ_POOL_SIZE", "4"))
+
+# スキーマ移行時のバックフィルで1トランザクションに処理する行数（書き込みロックの保持時間を抑える）
+MIGRATION_BATCH_SIZE = int(os.environ.get("SURVEY_MIGRATION_BATCH_SIZE", "2000"))
+
+# 管理画面APIの応答キャッシュ（シリアライズ済みJSON）の上限（全テナント合計のバイト数、0 で無効）
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("SURVEY_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# ─── 回答者向けAPIの流量制限・過負荷時の遮断 ────────────────
+# /api/survey/validate・submit を クライアントIP・トークンごとのトークンバケットで制限する（超過は 429）
+RATE_LIMIT_ENABLED = os.environ.get("SURVEY_RATE_LIMIT", "1") == "1"
+# "バースト回数/1秒あたりの回復数"。トークンごとの制限を先に判定し、IPごとの制限は
+# 事業所のNAT配下で全員が一斉に開いても通る大きさにする（スキャナー等の大量アクセス向け）
+RATE_LIMIT_TOKEN = tuple(float(x) for x in os.environ.get("SURVEY_RATE_LIMIT_TOKEN", "10/0.2").split("/"))
+RATE_LIMIT_IP = tuple(float(x) for x in os.environ.get("SURVEY_RATE_LIMIT_IP", "1000/20").split("/"))
+# 複数ワーカーで共有するバケットの保存先（例: /dev/shm/survey_ratelimit.db、空ならワーカーごとのメモリ）
+RATE_LIMIT_STORE = os.environ.get("SURVEY_RATE_LIMIT_STORE", "")
+# リバースプロキシ配下で X-Forwarded-For の先頭をクライアントIPとみなす
+RATE_LIMIT_TRUST_PROXY = os.environ.get("SURVEY_RATE_LIMIT_TRUST_PROXY", "0") == "1"
+# 処理中の回答者向けリクエストがこれを超えたら 503（validate はこの半分で遮断し、submit を優先する）
+SHED_MAX_IN_FLIGHT = int(os.environ.get("SURVEY_SHED_MAX_IN_FLIGHT", "32"))
+# 回答者向けAPIの応答時間の移動平均がこれを超えたら validate を 503（ミリ秒、0 で無効）
+SHED_LATENCY_MS = int(os.environ.get("SURVEY_SHED_LATENCY_MS", "500"))
+SHED_RETRY_AFTER = 5  # 503 の Retry-After（秒）
+
+# ─── サンプリングプロファイラ（/api/admin/profile） ───────────
+PROFILE_INTERVAL_MS = int(os.environ.get("SURVEY_PROFILE_INTERVAL_MS", "10"))  # スタックを採る間隔（ミリ秒）
+PROFILE_MAX_SECONDS = 120  # 1回に採取できる最長の秒数
+
+# ─── マルチテナント ─────────────────────────────
+# 有効にすると、ホスト名・パス（/t/<テナント>/...）・X-Tenant-ID ヘッダー・トークンの接頭辞から
+# テナントを判定し、TENANTS_DIR/<テナント>/survey.db を使う
+MULTI_TENANT = os.environ.get("SURVEY_MULTI_TENANT", "0") == "1"
+TENANTS_DIR = os.environ.get("SURVEY_TENANTS_DIR", os.path.join(_BASE_DIR, "tenants"))
+# ホスト名で判定する場合のベースドメイン（例: "survey.example.com" → acme.survey.example.com）
+TENANT_DOMAIN = os.environ.get("SURVEY_TENANT_DOMAIN", "")
+# 読み取り接続プールを保持するDBファイル数の上限（超えたら最も使われていないものを閉じる）
+TENANT_POOL_LIMIT = int(os.environ.get("SURVEY_TENANT_POOL_LIMIT", "64"))
+
+# ─── 保守（チェックポイント・VACUUM・バックアップ） ─────────────
+# app.py 起動時に開始する定期保守の間隔（秒、0 で無効）
+MAINTENANCE_INTERVAL = int(os.environ.get("SURVEY_MAINTENANCE_INTERVAL", "0"))
+# 定期保守でバックアップを取る間隔（秒、0 で取らない）
+BACKUP_INTERVAL = int(os.environ.get("SURVEY_BACKUP_INTERVAL", "86400"))
+BACKUP_DIR = os.environ.get("SURVEY_BACKUP_DIR", os.path.join(_BASE_DIR, "backups"))
+BACKUP_KEEP = 7                 # 残す世代数
+BACKUP_PAGES_PER_STEP = 256     # バックアップAPIで1回にコピーするページ数
+
+# ─── フロントエンド（React ビルド）の配信 ─────────────────
+# 起動時に gzip / brotli 圧縮版をビルドディレクトリへ書き出す（書き込めなければメモリ上で圧縮）
+STATIC_PRECOMPRESS = os.environ.get("SURVEY_STATIC_PRECOMPRESS", "1") == "1"
+# このサイズ以下のファイルは圧縮版も含めてメモリに保持して返す（バイト）
+STATIC_MEMORY_MAX_BYTES = int(os.environ.get("SURVEY_STATIC_MEMORY_MAX_BYTES", str(256 * 1024)))
+
 # ─── メール設定 ─────────────────────────────────
 SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
 SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
@@ -46,6 +111,19 @@ SURVEY_QUESTIONS = [
 # スコアの閾値
 ALERT_THRESHOLD = 2.5  # これ以下でアラート
 CRITICAL_THRESHOLD = 1.5  # これ以下で緊急アラート
+FAVOURABLE_SCORE = 4  # これ以上を好意的回答とみなす
+UNFAVOURABLE_SCORE = 2  # これ以下を否定的回答とみなす
+SCORE_DROP_THRESHOLD = 1.0  # 前回からの総合スコア低下がこれ以上で要注意
+SCORE_DROP_BASELINE_SURVEYS = 3  # 比較基準とする過去サーベイ数（平均）
+
+# 階層別集計（全社 → グループ → 部門、勤続年数帯）
+MIN_GROUP_SIZE = int(os.environ.get("SURVEY_MIN_GROUP_SIZE", "5"))  # 回答者がこの人数未満の集団はスコアを伏せる
+# 部門名の先頭の番号（"01 有明院" → "01"）の上何桁でグループを分けるか
+DEPARTMENT_GROUP_DIGITS = 1
+# 部門番号の接頭辞 → グループ名（長く一致するものを優先。未定義は "グループ<番号>"、番号のない部門は "その他"）
+DEPARTMENT_GROUPS = {}
+# 勤続年数帯（この年数未満, ラベル）。勤続年数はサーベイの年 − 入社年
+TENURE_BANDS = [(1, "1年未満"), (3, "1〜3年"), (5, "3〜5年"), (10, "5〜10年"), (None, "10年以上")]
 
 # リマインド設定
 REMIND_DAYS_BEFORE_DEADLINE = [3, 1]  # 締切の何日前にリマインドするか
\ No newline at end of file
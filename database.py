@@ -2,19 +2,89 @@
 データベース管理モジュール
 従業員情報・サーベイ回答・トークン・対応記録を管理
 """
+import contextvars
+import os
+import queue
 import sqlite3
+import threading
+from collections import Counter, OrderedDict, namedtuple
 from contextlib import contextmanager
 from datetime import datetime
-from config import DATABASE_PATH
+from config import (
+    DATABASE_PATH, ARCHIVE_DIR, READ_POOL_SIZE, TENANT_POOL_LIMIT,
+    ALERT_THRESHOLD, CRITICAL_THRESHOLD, SURVEY_QUESTIONS,
+    SCORE_DROP_THRESHOLD, SCORE_DROP_BASELINE_SURVEYS,
+)
+from keywords import extract_terms
+
+SCORE_KEYS = [q["key"] for q in SURVEY_QUESTIONS]
+
+
+# 実行したSQLを受け取るコールバック（インデックス監査・プロファイル用）
+_trace_callback = None
+
+
+def set_trace_callback(callback):
+    """以降に開く接続で実行されるSQL文を callback(sql) に渡す（None で解除）"""
+    global _trace_callback
+    _trace_callback = callback
+
+
+# ─── 接続先の切り替え（テナント） ─────────────────────────
+
+# 現在のリクエスト・処理が使うデータディレクトリ（None なら単一テナントの既定パス）
+_data_dir = contextvars.ContextVar("survey_data_dir", default=None)
+
+
+def current_data_dir() -> str | None:
+    return _data_dir.get()
+
+
+def current_db_path() -> str:
+    data_dir = _data_dir.get()
+    return os.path.join(data_dir, "survey.db") if data_dir else DATABASE_PATH
+
+
+def data_path(name: str, default: str) -> str:
+    """テナント使用中はそのデータディレクトリ配下、そうでなければ既定のパス"""
+    data_dir = _data_dir.get()
+    return os.path.join(data_dir, name) if data_dir else default
 
 
 @contextmanager
-def get_db():
-    """データベース接続のコンテキストマネージャ"""
-    conn = sqlite3.connect(DATABASE_PATH)
+def use_data_dir(data_dir: str):
+    """ブロック内の接続・アーカイブ・スナップショットを data_dir 配下に向ける"""
+    token = _data_dir.set(data_dir)
+    try:
+        yield
+    finally:
+        _data_dir.reset(token)
+
+
+def _connect(path: str):
+    new_file = not os.path.exists(path)
+    conn = sqlite3.connect(path)
     conn.row_factory = sqlite3.Row
+    if _trace_callback:
+        conn.set_trace_callback(_trace_callback)
+    if new_file:
+        # 新規DBはヘッダが書かれる前に指定（アーカイブ後の空き領域を少しずつ返却できるようにする）
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+@contextmanager
+def get_db():
+    """データベース接続のコンテキストマネージャ（shared_connection() の中ではその接続を使う）"""
+    path = current_db_path()
+    shared = _shared.get()
+    if shared is not None and shared["path"] == path:
+        with _shared_block(shared) as conn:
+            yield conn
+        return
+    conn = _connect(path)
     try:
         yield conn
         conn.commit()
@@ -25,105 +95,278 @@ def get_db():
         conn.close()
 
 
+# ─── 共有接続（cli.py batch） ───────────────────────
+
+# 一括実行中に get_db / get_read_db が使う接続 {"path", "conn", "transaction", "depth"}
+_shared = contextvars.ContextVar("survey_shared_connection", default=None)
+
+
+@contextmanager
+def _shared_block(shared: dict):
+    """
+    共有接続での get_db 1ブロック分
+    最も外側のブロックは終了時にコミットし、入れ子のブロックと1トランザクション実行中のブロックは
+    セーブポイントにする（例外時はそのブロックの変更だけを取り消す）
+    """
+    conn = shared["conn"]
+    savepoint = shared["transaction"] or shared["depth"] > 0
+    if savepoint:
+        conn.execute("SAVEPOINT shared_block")
+    shared["depth"] += 1
+    try:
+        yield conn
+    except Exception:
+        if savepoint:
+            conn.execute("ROLLBACK TO shared_block")
+            conn.execute("RELEASE shared_block")
+        else:
+            conn.rollback()
+        raise
+    else:
+        if savepoint:
+            conn.execute("RELEASE shared_block")
+        else:
+            conn.commit()
+    finally:
+        shared["depth"] -= 1
+
+
+@contextmanager
+def shared_connection(transaction: bool = False):
+    """
+    ブロック内の get_db / get_read_db を1本の接続で処理する（接続・PRAGMA・ATTACH を1回で済ませる）
+    - transaction: ブロック全体を1つの書き込みトランザクションにする。例外で抜けるか、
+      呼び出し側が conn.rollback() すれば全て取り消す（その間は他の書き込みを待たせる）
+    """
+    path = current_db_path()
+    conn = _connect(path)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'survey_archives'").fetchone():
+        _attach_archives(conn)
+    if transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    token = _shared.set({"path": path, "conn": conn, "transaction": transaction, "depth": 0})
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _shared.reset(token)
+        conn.close()
+
+
+# ─── 読み取り専用接続（管理画面の集計用） ─────────────────
+
+# DBファイルごとの接続プール {パス: LifoQueue}（直近に返した接続から再利用）
+# テナント数が多くても開いたままのファイルが増えすぎないよう、最近使った TENANT_POOL_LIMIT 件に限る
+_read_pools = OrderedDict()
+_read_pools_lock = threading.Lock()
+# スレッド内で入れ子になった get_read_db() は同じ接続（同じスナップショット）を使う
+_read_local = threading.local()
+
+
+def _open_read_connection(path: str):
+    uri = "file:" + os.path.abspath(path).replace("?", "%3f").replace("#", "%23") + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def _read_pool(path: str) -> queue.LifoQueue:
+    evicted = []
+    with _read_pools_lock:
+        pool = _read_pools.get(path)
+        if pool is None:
+            pool = _read_pools[path] = queue.LifoQueue(maxsize=READ_POOL_SIZE)
+            while len(_read_pools) > TENANT_POOL_LIMIT:
+                evicted.append(_read_pools.popitem(last=False)[1])
+        else:
+            _read_pools.move_to_end(path)
+    for old in evicted:
+        _drain(old)
+    return pool
+
+
+def _drain(pool: queue.LifoQueue):
+    """プール中の接続を閉じる（使用中の接続は返却時に閉じられる）"""
+    while True:
+        try:
+            pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+def read_pool_stats() -> dict:
+    """{DBパス: 待機中の読み取り接続数}"""
+    with _read_pools_lock:
+        return {path: pool.qsize() for path, pool in _read_pools.items()}
+
+
+def _attach_archives(conn):
+    """アーカイブファイルを全てATTACH（トランザクション内ではATTACHできないため開始前に行う）"""
+    for r in conn.execute("SELECT DISTINCT file_name FROM survey_archives").fetchall():
+        attach_archive(conn, r["file_name"])
+
+
+@contextmanager
+def get_read_db():
+    """
+    読み取り専用接続のコンテキストマネージャ
+    mode=ro + query_only で開いた接続をプールから取り出し、ブロック全体を1つの読み取り
+    トランザクション（一貫したスナップショット）で実行する。WALモードなので書き込みロックを
+    取らず、回答送信をブロックしない
+    """
+    path = current_db_path()
+    shared = _shared.get()
+    if shared is not None and shared["path"] == path:
+        # 一括実行中は書き込み途中の内容も読めるよう共有接続を使う
+        yield shared["conn"]
+        return
+    if getattr(_read_local, "conn", None) is not None and _read_local.path == path:
+        yield _read_local.conn
+        return
+
+    pool = _read_pool(path)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open_read_connection(path)
+    conn.set_trace_callback(_trace_callback)
+    _attach_archives(conn)
+    conn.execute("BEGIN DEFERRED")
+    outer = getattr(_read_local, "conn", None), getattr(_read_local, "path", None)
+    _read_local.conn, _read_local.path = conn, path
+    try:
+        yield conn
+    finally:
+        _read_local.conn, _read_local.path = outer
+        conn.execute("ROLLBACK")
+        with _read_pools_lock:
+            pooled = _read_pools.get(path) is pool
+        try:
+            if not pooled:
+                raise queue.Full
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def close_read_pool(path: str = None):
+    """プール中の読み取り接続を閉じる（path 省略時は全て）"""
+    with _read_pools_lock:
+        paths = [path] if path else list(_read_pools)
+        pools = [_read_pools.pop(p) for p in paths if p in _read_pools]
+    for pool in pools:
+        _drain(pool)
+
+
+# ─── アーカイブ（年別DBファイル） ─────────────────────────
+
+# アーカイブへ移すテーブル（サーベイ単位で増え続けるもの）
+ARCHIVED_TABLES = ["survey_tokens", "responses", "email_logs", "alerts"]
+
+
+def archive_schema_name(year: str) -> str:
+    return f"archive_{year}"
+
+
+def attach_archive(conn, file_name: str) -> str:
+    """アーカイブファイルをATTACH（接続済みなら何もしない）してスキーマ名を返す"""
+    schema = archive_schema_name(os.path.splitext(file_name)[0].rsplit("_", 1)[-1])
+    attached = {r["name"] for r in conn.execute("PRAGMA database_list").fetchall()}
+    if schema not in attached:
+        conn.execute("ATTACH DATABASE ? AS " + schema, (os.path.join(data_path("archive", ARCHIVE_DIR), file_name),))
+    return schema
+
+
+def _survey_schema(conn, survey_id: int) -> str:
+    """サーベイのトークン・回答があるスキーマ（未アーカイブなら main）"""
+    row = conn.execute(
+        "SELECT file_name FROM survey_archives WHERE survey_id = ?", (survey_id,)
+    ).fetchone()
+    return attach_archive(conn, row["file_name"]) if row else "main"
+
+
+def _table_columns(conn, schema: str, table: str) -> list[str]:
+    return [r["name"] for r in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+
+def has_comment_index(conn, schema: str) -> bool:
+    """スキーマにコメントの全文検索索引（responses_fts）があるか（索引導入前のアーカイブにはない）"""
+    return conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'responses_fts'"
+    ).fetchone() is not None
+
+
+def _archive_schemas(conn) -> list[str]:
+    """全アーカイブファイルをATTACHしてスキーマ名を返す（ATTACH数の上限は SQLite の既定で10）"""
+    return [attach_archive(conn, r["file_name"]) for r in conn.execute(
+        "SELECT DISTINCT file_name FROM survey_archives ORDER BY file_name"
+    ).fetchall()]
+
+
+def _all_rows(conn, table: str) -> str:
+    """
+    アーカイブを含む全行を参照するテーブル名（ARCHIVED_TABLES のいずれか）
+    アーカイブがあれば全ファイルをATTACHして一時ビュー all_<テーブル> を作る
+    （後から main に追加された列がアーカイブ側になければ NULL として読む）
+    """
+    schemas = _archive_schemas(conn)
+    if not schemas:
+        return table
+    columns = _table_columns(conn, "main", table)
+    selects = [f"SELECT {', '.join(columns)} FROM main.{table}"]
+    for schema in schemas:
+        existing = set(_table_columns(conn, schema, table))
+        selects.append("SELECT " + ", ".join(c if c in existing else f"NULL AS {c}" for c in columns)
+                       + f" FROM {schema}.{table}")
+    conn.execute(f"DROP VIEW IF EXISTS temp.all_{table}")
+    conn.execute(f"CREATE TEMP VIEW all_{table} AS " + " UNION ALL ".join(selects))
+    return f"all_{table}"
+
+
+def _all_responses(conn) -> str:
+    """アーカイブを含む全回答を参照するテーブル名"""
+    return _all_rows(conn, "responses")
+
+
 def init_db():
-    """テーブルの初期化"""
-    with get_db() as conn:
-        conn.executescript("""
-            -- 従業員マスタ
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                department TEXT NOT NULL,
-                join_year INTEGER,
-                is_active INTEGER DEFAULT 1,
-                created_at TEXT DEFAULT (datetime('now', 'localtime')),
-                updated_at TEXT DEFAULT (datetime('now', 'localtime'))
-            );
-
-            -- サーベイ配信管理
-            CREATE TABLE IF NOT EXISTS surveys (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                year_month TEXT NOT NULL UNIQUE,  -- "2026-02" 形式
-                title TEXT NOT NULL,
-                start_date TEXT NOT NULL,
-                deadline TEXT NOT NULL,
-                extra_question_title TEXT,         -- 追加質問（4問目）
-                extra_question_description TEXT,
-                status TEXT DEFAULT 'draft',       -- draft / active / closed
-                created_at TEXT DEFAULT (datetime('now', 'localtime'))
-            );
-
-            -- トークン管理（従業員 × サーベイごとに1トークン）
-            CREATE TABLE IF NOT EXISTS survey_tokens (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                survey_id INTEGER NOT NULL,
-                employee_id INTEGER NOT NULL,
-                token TEXT NOT NULL UNIQUE,
-                is_used INTEGER DEFAULT 0,
-                sent_at TEXT,
-                reminded_at TEXT,
-                expires_at TEXT NOT NULL,
-                created_at TEXT DEFAULT (datetime('now', 'localtime')),
-                FOREIGN KEY (survey_id) REFERENCES surveys(id),
-                FOREIGN KEY (employee_id) REFERENCES employees(id),
-                UNIQUE(survey_id, employee_id)
-            );
-
-            -- 回答データ
-            CREATE TABLE IF NOT EXISTS responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                survey_id INTEGER NOT NULL,
-                employee_id INTEGER NOT NULL,
-                token_id INTEGER NOT NULL,
-                work_satisfaction REAL NOT NULL CHECK(work_satisfaction BETWEEN 1 AND 5),
-                relationships REAL NOT NULL CHECK(relationships BETWEEN 1 AND 5),
-                health REAL NOT NULL CHECK(health BETWEEN 1 AND 5),
-                extra_answer REAL,
-                comment TEXT DEFAULT '',
-                interview_request TEXT DEFAULT NULL,
-                submitted_at TEXT DEFAULT (datetime('now', 'localtime')),
-                FOREIGN KEY (survey_id) REFERENCES surveys(id),
-                FOREIGN KEY (employee_id) REFERENCES employees(id),
-                FOREIGN KEY (token_id) REFERENCES survey_tokens(id),
-                UNIQUE(survey_id, employee_id)
-            );
-
-            -- 対応記録
-            CREATE TABLE IF NOT EXISTS follow_up_notes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                survey_id INTEGER,
-                author TEXT NOT NULL,
-                note TEXT NOT NULL,
-                action_type TEXT DEFAULT 'memo',  -- memo / meeting / call / email
-                created_at TEXT DEFAULT (datetime('now', 'localtime')),
-                FOREIGN KEY (employee_id) REFERENCES employees(id),
-                FOREIGN KEY (survey_id) REFERENCES surveys(id)
-            );
-
-            -- メール送信ログ
-            CREATE TABLE IF NOT EXISTS email_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                survey_id INTEGER NOT NULL,
-                email_type TEXT NOT NULL,  -- invite / remind / alert
-                sent_at TEXT DEFAULT (datetime('now', 'localtime')),
-                status TEXT DEFAULT 'sent',
-                error_message TEXT,
-                FOREIGN KEY (employee_id) REFERENCES employees(id),
-                FOREIGN KEY (survey_id) REFERENCES surveys(id)
-            );
-
-            -- インデックス
-            CREATE INDEX IF NOT EXISTS idx_tokens_token ON survey_tokens(token);
-            CREATE INDEX IF NOT EXISTS idx_tokens_survey ON survey_tokens(survey_id);
-            CREATE INDEX IF NOT EXISTS idx_responses_survey ON responses(survey_id);
-            CREATE INDEX IF NOT EXISTS idx_responses_employee ON responses(employee_id);
-        """)
+    """スキーマを最新バージョンに更新（最新であれば user_version を確認するだけ）"""
+    import migrations
+    with get_db() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= migrations.LATEST_VERSION:
+            return
+        migrations.migrate(conn)
     print("[DB] テーブルの初期化が完了しました")
 
 
+# ─── 一括処理用の軽量レコード ───────────────────────
+# 従業員・トークン・回答の一覧は数万行になるため dict に変換せず、namedtuple（__slots__ のみで
+# 行ごとの __dict__ を持たない）で1行ずつ返す。JSON に出すときだけ _asdict() で dict にする
+
+EmployeeRecord = namedtuple("EmployeeRecord", "id name email department join_year")
+TokenRecord = namedtuple("TokenRecord", "id survey_id employee_id token sent_at is_used name email department")
+ResponseRecord = namedtuple(
+    "ResponseRecord",
+    "id employee_id name department join_year work_satisfaction relationships health "
+    "extra_answer comment interview_request submitted_at",
+)
+
+_EMPLOYEE_COLUMNS = "id, name, email, department, join_year"
+_TOKEN_COLUMNS = "t.id, t.survey_id, t.employee_id, t.token, t.sent_at, t.is_used, e.name, e.email, e.department"
+_RESPONSE_COLUMNS = """r.id, r.employee_id, e.name, e.department, e.join_year, r.work_satisfaction,
+                       r.relationships, r.health, r.extra_answer, r.comment, r.interview_request, r.submitted_at"""
+
+
+def _iter_records(conn, record, sql: str, params=()):
+    """SELECT の結果を sqlite3.Row を経由せず record で1行ずつ返すカーソル（列順は record と同じにする）"""
+    cursor = conn.cursor()
+    cursor.row_factory = lambda _, row: record._make(row)
+    return cursor.execute(sql, params)
+
+
 # ─── 従業員操作 ──────────────────────────────────
 
 def add_employee(name: str, email: str, department: str, join_year: int = None) -> int:
@@ -152,13 +395,18 @@ def import_employees_bulk(employees: list[dict]) -> int:
     return count
 
 
-def get_active_employees() -> list[dict]:
-    """有効な従業員一覧を取得"""
+def iter_active_employees():
+    """有効な従業員を部門・名前順に1人ずつ返す（EmployeeRecord）"""
     with get_db() as conn:
-        rows = conn.execute(
-            "SELECT * FROM employees WHERE is_active = 1 ORDER BY department, name"
-        ).fetchall()
-        return [dict(r) for r in rows]
+        yield from _iter_records(
+            conn, EmployeeRecord,
+            f"SELECT {_EMPLOYEE_COLUMNS} FROM employees WHERE is_active = 1 ORDER BY department, name",
+        )
+
+
+def get_active_employees() -> list[EmployeeRecord]:
+    """有効な従業員一覧を取得"""
+    return list(iter_active_employees())
 
 
 def get_employee_by_id(employee_id: int) -> dict | None:
@@ -170,6 +418,18 @@ def get_employee_by_id(employee_id: int) -> dict | None:
 
 # ─── サーベイ操作 ─────────────────────────────────
 
+def get_data_version(survey_id: int = None) -> tuple[int, int]:
+    """
+    変更カウンタ (全体, サーベイ) を取得（トリガーで書き込みのたびに進む）
+    全体はサーベイ一覧・従業員マスタの変更。survey_id 省略時のサーベイ側は 0
+    """
+    with get_read_db() as conn:
+        versions = dict(conn.execute(
+            "SELECT survey_id, version FROM survey_versions WHERE survey_id IN (0, ?)", (survey_id or 0,)
+        ).fetchall())
+    return versions.get(0, 0), versions.get(survey_id, 0) if survey_id else 0
+
+
 def create_survey(year_month: str, title: str, start_date: str, deadline: str,
                   extra_question_title: str = None, extra_question_desc: str = None) -> int:
     """新規サーベイを作成"""
@@ -183,6 +443,12 @@ def create_survey(year_month: str, title: str, start_date: str, deadline: str,
         return cursor.lastrowid
 
 
+def list_surveys() -> list[dict]:
+    with get_read_db() as conn:
+        rows = conn.execute("SELECT * FROM surveys ORDER BY year_month DESC").fetchall()
+        return [dict(r) for r in rows]
+
+
 def get_survey(survey_id: int) -> dict | None:
     with get_db() as conn:
         row = conn.execute("SELECT * FROM surveys WHERE id = ?", (survey_id,)).fetchone()
@@ -202,9 +468,11 @@ def activate_survey(survey_id: int):
 
 
 def close_survey(survey_id: int):
-    """サーベイを締め切る"""
+    """サーベイを締め切る（部門別集計も同一トランザクションで確定）"""
     with get_db() as conn:
         conn.execute("UPDATE surveys SET status = 'closed' WHERE id = ?", (survey_id,))
+        _refresh_rollups(conn, survey_id)
+        _refresh_score_drops(conn, survey_id)
 
 
 # ─── トークン操作 ─────────────────────────────────
@@ -220,6 +488,22 @@ def save_token(survey_id: int, employee_id: int, token: str, expires_at: str) ->
         return cursor.lastrowid
 
 
+def save_tokens(survey_id: int, tokens, expires_at: str) -> int:
+    """
+    トークンをまとめて保存（1トランザクション・executemany）
+    - tokens: (employee_id, token) を順に返すイテラブル（ジェネレータのまま渡せる）
+    - 戻り値: 保存した件数
+    """
+    with get_db() as conn:
+        cursor = conn.executemany(
+            """INSERT OR REPLACE INTO survey_tokens
+               (survey_id, employee_id, token, expires_at)
+               VALUES (?, ?, ?, ?)""",
+            ((survey_id, employee_id, token, expires_at) for employee_id, token in tokens),
+        )
+        return cursor.rowcount
+
+
 def get_token_info(token: str) -> dict | None:
     """トークンから従業員・サーベイ情報を取得"""
     with get_db() as conn:
@@ -236,6 +520,24 @@ def get_token_info(token: str) -> dict | None:
         return dict(row) if row else None
 
 
+def get_token_state(token: str) -> dict | None:
+    """
+    回答フォームの初期表示用に、トークン1件の状態と全体の変更カウンタを1回の検索で取得
+    （サーベイ側の情報は呼び出し側でカウンタごとにキャッシュする）
+    """
+    with get_read_db() as conn:
+        row = conn.execute(
+            """SELECT t.survey_id, t.is_used, t.expires_at, e.name as emp_name,
+                      COALESCE(v.version, 0) as version
+               FROM survey_tokens t
+               JOIN employees e ON t.employee_id = e.id
+               LEFT JOIN survey_versions v ON v.survey_id = 0
+               WHERE t.token = ?""",
+            (token,),
+        ).fetchone()
+        return dict(row) if row else None
+
+
 def mark_token_sent(token_id: int):
     with get_db() as conn:
         conn.execute(
@@ -244,6 +546,14 @@ def mark_token_sent(token_id: int):
         )
 
 
+def mark_token_reminded(token_id: int):
+    with get_db() as conn:
+        conn.execute(
+            "UPDATE survey_tokens SET reminded_at = datetime('now', 'localtime') WHERE id = ?",
+            (token_id,),
+        )
+
+
 def mark_token_used(token_id: int):
     with get_db() as conn:
         conn.execute(
@@ -252,58 +562,119 @@ def mark_token_used(token_id: int):
         )
 
 
-def get_unsent_tokens(survey_id: int) -> list[dict]:
+def iter_unsent_tokens(survey_id: int):
+    """未送信のトークンを1件ずつ返す（TokenRecord）"""
     with get_db() as conn:
-        rows = conn.execute(
-            """SELECT t.*, e.name, e.email, e.department
+        yield from _iter_records(
+            conn, TokenRecord,
+            f"""SELECT {_TOKEN_COLUMNS}
                FROM survey_tokens t
                JOIN employees e ON t.employee_id = e.id
                WHERE t.survey_id = ? AND t.sent_at IS NULL""",
             (survey_id,),
-        ).fetchall()
-        return [dict(r) for r in rows]
+        )
+
 
+def get_unsent_tokens(survey_id: int) -> list[TokenRecord]:
+    return list(iter_unsent_tokens(survey_id))
 
-def get_unreplied_tokens(survey_id: int) -> list[dict]:
+
+def get_unreplied_tokens(survey_id: int) -> list[TokenRecord]:
     """未回答者のトークン一覧"""
-    with get_db() as conn:
-        rows = conn.execute(
-            """SELECT t.*, e.name, e.email, e.department
+    with get_read_db() as conn:
+        return _iter_records(
+            conn, TokenRecord,
+            f"""SELECT {_TOKEN_COLUMNS}
                FROM survey_tokens t
                JOIN employees e ON t.employee_id = e.id
                WHERE t.survey_id = ? AND t.is_used = 0 AND t.sent_at IS NOT NULL""",
             (survey_id,),
         ).fetchall()
-        return [dict(r) for r in rows]
+
+
+def iter_survey_tokens(survey_id: int):
+    """サーベイの全トークンを部門・名前順に1件ずつ返す（TokenRecord。URL出力用）"""
+    with get_db() as conn:
+        schema = _survey_schema(conn, survey_id)
+        yield from _iter_records(
+            conn, TokenRecord,
+            f"""SELECT {_TOKEN_COLUMNS}
+               FROM {schema}.survey_tokens t
+               JOIN employees e ON t.employee_id = e.id
+               WHERE t.survey_id = ?
+               ORDER BY e.department, e.name""",
+            (survey_id,),
+        )
 
 
 # ─── 回答操作 ──────────────────────────────────
 
+def classify_alert(scores: dict) -> tuple[str, str, float] | None:
+    """
+    回答スコアからアラートを判定
+    - 戻り値: (severity, dimension, score) / 対象外ならNone
+    """
+    dimension = min(SCORE_KEYS, key=lambda k: scores[k])
+    score = scores[dimension]
+    if score >= ALERT_THRESHOLD:
+        return None
+    severity = "critical" if score < CRITICAL_THRESHOLD else "warning"
+    return severity, dimension, score
+
+
+def _insert_response(conn, survey_id: int, employee_id: int, token_id: int,
+                     work: float, relationships: float, health: float,
+                     extra: float = None, comment: str = "", interview_request: str = None,
+                     submitted_at: str = None) -> int:
+    """
+    回答1件を登録し、キーワード集計・部門 × 入社年の集計・アラートを更新（トークンの使用済み化は呼び出し側）
+    submitted_at 省略時は現在時刻
+    """
+    cursor = conn.execute(
+        """INSERT INTO responses
+           (survey_id, employee_id, token_id, work_satisfaction, relationships, health,
+            extra_answer, comment, interview_request, submitted_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, datetime('now', 'localtime')))""",
+        (survey_id, employee_id, token_id, work, relationships, health,
+         extra, comment, interview_request, submitted_at),
+    )
+    response_id = cursor.lastrowid
+    _count_comment_terms(conn, survey_id, employee_id, comment)
+    scores = {"work_satisfaction": work, "relationships": relationships, "health": health}
+    _add_cohort_rollups(conn, survey_id, employee_id, scores)
+    alert = classify_alert(scores)
+    if alert:
+        severity, dimension, score = alert
+        conn.execute(
+            """INSERT INTO alerts (response_id, survey_id, employee_id, severity, dimension, score)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (response_id, survey_id, employee_id, severity, dimension, score),
+        )
+    return response_id
+
+
 def save_response(survey_id: int, employee_id: int, token_id: int,
                   work: float, relationships: float, health: float,
                   extra: float = None, comment: str = "",
                   interview_request: str = None) -> int:
     with get_db() as conn:
-        cursor = conn.execute(
-            """INSERT INTO responses
-               (survey_id, employee_id, token_id, work_satisfaction, relationships, health,
-                extra_answer, comment, interview_request)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (survey_id, employee_id, token_id, work, relationships, health,
-             extra, comment, interview_request),
+        response_id = _insert_response(
+            conn, survey_id, employee_id, token_id, work, relationships, health,
+            extra, comment, interview_request,
         )
         conn.execute(
             "UPDATE survey_tokens SET is_used = 1 WHERE id = ?",
             (token_id,),
         )
-        return cursor.lastrowid
+        return response_id
 
 
 def get_responses(survey_id: int) -> list[dict]:
-    with get_db() as conn:
+    with get_read_db() as conn:
+        schema = _survey_schema(conn, survey_id)
         rows = conn.execute(
-            """SELECT r.*, e.name, e.department
-               FROM responses r
+            f"""SELECT r.*, e.name, e.department, e.join_year
+               FROM {schema}.responses r
                JOIN employees e ON r.employee_id = e.id
                WHERE r.survey_id = ?
                ORDER BY r.submitted_at DESC""",
@@ -312,12 +683,27 @@ def get_responses(survey_id: int) -> list[dict]:
         return [dict(r) for r in rows]
 
 
+def iter_responses(survey_id: int):
+    """サーベイの回答を get_responses と同じ並び順で1件ずつ返す（ResponseRecord。CSV出力用）"""
+    with get_db() as conn:
+        schema = _survey_schema(conn, survey_id)
+        yield from _iter_records(
+            conn, ResponseRecord,
+            f"""SELECT {_RESPONSE_COLUMNS}
+               FROM {schema}.responses r
+               JOIN employees e ON r.employee_id = e.id
+               WHERE r.survey_id = ?
+               ORDER BY r.submitted_at DESC""",
+            (survey_id,),
+        )
+
+
 def get_employee_history(employee_id: int) -> list[dict]:
-    """従業員の回答履歴（全月分）"""
+    """従業員の回答履歴（全月分・アーカイブ含む）"""
     with get_db() as conn:
         rows = conn.execute(
-            """SELECT r.*, s.year_month, s.title as survey_title
-               FROM responses r
+            f"""SELECT r.*, s.year_month, s.title as survey_title
+               FROM {_all_responses(conn)} r
                JOIN surveys s ON r.survey_id = s.id
                WHERE r.employee_id = ?
                ORDER BY s.year_month ASC""",
@@ -326,50 +712,231 @@ def get_employee_history(employee_id: int) -> list[dict]:
         return [dict(r) for r in rows]
 
 
+# ─── コメントのキーワード集計 ───────────────────────────
+
+def _add_term_counts(conn, survey_id: int, department: str, counts):
+    conn.executemany(
+        """INSERT INTO comment_terms (survey_id, department, term, n) VALUES (?, ?, ?, ?)
+           ON CONFLICT (survey_id, department, term) DO UPDATE SET n = n + excluded.n""",
+        ((survey_id, department, term, n) for term, n in counts.items()),
+    )
+
+
+def _add_comment_counts(conn, counts):
+    conn.executemany(
+        """INSERT INTO comment_counts (survey_id, department, n) VALUES (?, ?, ?)
+           ON CONFLICT (survey_id, department) DO UPDATE SET n = n + excluded.n""",
+        ((survey_id, department, n) for (survey_id, department), n in counts.items()),
+    )
+
+
+def _count_comment_terms(conn, survey_id: int, employee_id: int, comment: str):
+    """回答1件分のコメント数・キーワードを回答時点の部門に加算"""
+    if not comment:
+        return
+    department = conn.execute(
+        "SELECT department FROM employees WHERE id = ?", (employee_id,)
+    ).fetchone()["department"]
+    _add_comment_counts(conn, {(survey_id, department): 1})
+    terms = extract_terms(comment)
+    if terms:
+        _add_term_counts(conn, survey_id, department, dict.fromkeys(terms, 1))
+
+
+def _backfill_comment_terms(conn, rows):
+    """既存コメントを集計（rows: survey_id, department, comment の行）"""
+    counts = {}
+    for survey_id, department, comment in rows:
+        counts.setdefault((survey_id, department), Counter()).update(extract_terms(comment))
+    for (survey_id, department), c in counts.items():
+        _add_term_counts(conn, survey_id, department, c)
+
+
+def _backfill_comment_counts(conn, rows):
+    """既存コメントを数える（rows: survey_id, department の行）"""
+    _add_comment_counts(conn, Counter(tuple(r) for r in rows))
+
+
+def get_comment_terms(survey_id: int, department: str = None, limit: int = None) -> dict:
+    """
+    サーベイ（部門指定可）のキーワード出現数
+    - 戻り値: {"comment_count": コメント数, "terms": [{"term", "n"}, ...]}（出現数の多い順）
+    - コメント数・出現数とも回答時点の部門で数える（comment_counts / comment_terms）
+      comment_counts の導入前にアーカイブしたサーベイだけは、コメント数を現在の部門で回答から数える
+    """
+    where, params = ["survey_id = ?"], [survey_id]
+    if department is not None:
+        where.append("department = ?")
+        params.append(department)
+    with get_db() as conn:
+        counted = conn.execute(
+            "SELECT 1 FROM comment_counts WHERE survey_id = ? LIMIT 1", (survey_id,)
+        ).fetchone()
+        if counted:
+            comment_count = conn.execute(
+                f"SELECT COALESCE(SUM(n), 0) FROM comment_counts WHERE {' AND '.join(where)}", params,
+            ).fetchone()[0]
+        else:
+            response_where = ["r.survey_id = ?", "r.comment <> ''"]
+            if department is not None:
+                response_where.append("e.department = ?")
+            comment_count = conn.execute(
+                f"""SELECT COUNT(*) FROM {_survey_schema(conn, survey_id)}.responses r
+                    JOIN employees e ON r.employee_id = e.id
+                    WHERE {" AND ".join(response_where)}""",
+                params,
+            ).fetchone()[0]
+        rows = conn.execute(
+            f"""SELECT term, SUM(n) as n FROM comment_terms
+                WHERE {" AND ".join(where)}
+                GROUP BY term
+                ORDER BY n DESC, term
+                {"LIMIT " + str(int(limit)) if limit else ""}""",
+            params,
+        ).fetchall()
+        return {"comment_count": comment_count, "terms": [dict(r) for r in rows]}
+
+
+# ─── コメント検索 ────────────────────────────────
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_comments(query: str, survey_id: int = None, department: str = None,
+                    min_score: float = None, max_score: float = None,
+                    limit: int = 50) -> list[dict]:
+    """
+    自由記述コメントを全文検索（関連度順、アーカイブ済みのサーベイを含む）
+    - 空白区切りの語をすべて含むコメントを返す
+    - trigram の制約で3文字未満の語は部分一致（LIKE）で絞り込む
+    - score は3設問の平均
+    - 回答のあるスキーマ（main・各アーカイブ）ごとにそれぞれの索引で検索し、関連度順にまとめる
+    """
+    terms = query.split()
+    if not terms:
+        return []
+    with get_db() as conn:
+        if survey_id is not None:
+            schemas = [_survey_schema(conn, survey_id)]
+        else:
+            schemas = ["main"] + _archive_schemas(conn)
+        rows = []
+        for schema in schemas:
+            rows += _search_schema(conn, schema, terms, survey_id, department, min_score, max_score, limit)
+    rows.sort(key=lambda r: r["rank"])
+    return [{k: v for k, v in r.items() if k != "rank"} for r in rows[:limit]]
+
+
+def _like(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _search_schema(conn, schema: str, terms: list[str], survey_id: int, department: str,
+                   min_score: float, max_score: float, limit: int) -> list[dict]:
+    """1スキーマ分のコメント検索（rank: 小さいほど上位）"""
+    # 索引のないアーカイブ（索引導入前に作成）は全語を部分一致で絞り込む
+    fts = has_comment_index(conn, schema)
+    indexed = [t for t in terms if len(t) >= 3] if fts else []
+    short = [t for t in terms if t not in indexed]
+
+    score = " + ".join(f"r.{k}" for k in SCORE_KEYS)
+    where, params = [], []
+    if indexed:
+        where.append("responses_fts MATCH ?")
+        params.append(" AND ".join(_fts_phrase(t) for t in indexed))
+    for t in short:
+        where.append("r.comment LIKE ? ESCAPE '\\'")
+        params.append(_like(t))
+    if survey_id is not None:
+        where.append("r.survey_id = ?")
+        params.append(survey_id)
+    if department is not None:
+        where.append("e.department = ?")
+        params.append(department)
+    if min_score is not None:
+        where.append(f"({score}) / {len(SCORE_KEYS)}.0 >= ?")
+        params.append(min_score)
+    if max_score is not None:
+        where.append(f"({score}) / {len(SCORE_KEYS)}.0 <= ?")
+        params.append(max_score)
+
+    if indexed:
+        source = f"{schema}.responses_fts JOIN {schema}.responses r ON r.id = responses_fts.rowid"
+        snippet = "snippet(responses_fts, 0, '【', '】', '…', 24)"
+        rank = "bm25(responses_fts)"
+        order = rank
+    else:
+        source = f"{schema}.responses r"
+        snippet = "r.comment"
+        # 新しい順（julianday の符号を反転して bm25 と同じく小さいほど上位にする）
+        rank = "-julianday(r.submitted_at)"
+        order = "r.submitted_at DESC"
+
+    rows = conn.execute(
+        f"""SELECT r.id as response_id, r.survey_id, s.year_month, r.employee_id,
+                   e.name, e.department, {", ".join(f"r.{k}" for k in SCORE_KEYS)},
+                   round(({score}) / {len(SCORE_KEYS)}.0, 2) as score,
+                   r.comment, {snippet} as snippet, r.submitted_at, {rank} as rank
+            FROM {source}
+            JOIN employees e ON r.employee_id = e.id
+            JOIN surveys s ON r.survey_id = s.id
+            WHERE {" AND ".join(where)}
+            ORDER BY {order}
+            LIMIT ?""",
+        params + [limit],
+    ).fetchall()
+    # 全文検索の結果（bm25 順）を先に、部分一致のみの結果（新しい順）を後に並べる
+    return [{**dict(r), "rank": (0 if indexed else 1, r["rank"])} for r in rows]
+
+
 # ─── 分析・集計 ──────────────────────────────────
 
 def get_survey_stats(survey_id: int) -> dict:
     """サーベイの集計データを取得"""
-    with get_db() as conn:
+    with get_read_db() as conn:
+        schema = _survey_schema(conn, survey_id)
+
         # 全体統計
         total = conn.execute(
-            "SELECT COUNT(*) as cnt FROM survey_tokens WHERE survey_id = ? AND sent_at IS NOT NULL",
+            f"SELECT COUNT(*) as cnt FROM {schema}.survey_tokens WHERE survey_id = ? AND sent_at IS NOT NULL",
             (survey_id,),
         ).fetchone()["cnt"]
 
         responded = conn.execute(
-            "SELECT COUNT(*) as cnt FROM responses WHERE survey_id = ?",
+            f"SELECT COUNT(*) as cnt FROM {schema}.responses WHERE survey_id = ?",
             (survey_id,),
         ).fetchone()["cnt"]
 
         avg = conn.execute(
-            """SELECT
+            f"""SELECT
                  AVG(work_satisfaction) as avg_work,
                  AVG(relationships) as avg_rel,
                  AVG(health) as avg_health
-               FROM responses WHERE survey_id = ?""",
+               FROM {schema}.responses WHERE survey_id = ?""",
             (survey_id,),
         ).fetchone()
 
-        # アラート対象
-        from config import ALERT_THRESHOLD
+        # アラート対象（回答時に判定済み）
         alerts = conn.execute(
-            """SELECT r.*, e.name, e.department
-               FROM responses r
-               JOIN employees e ON r.employee_id = e.id
-               WHERE r.survey_id = ?
-                 AND (r.work_satisfaction < ? OR r.relationships < ? OR r.health < ?)""",
-            (survey_id, ALERT_THRESHOLD, ALERT_THRESHOLD, ALERT_THRESHOLD),
+            f"""SELECT r.*, e.name, e.department,
+                      a.id as alert_id, a.severity, a.dimension, a.status as alert_status
+               FROM {schema}.alerts a
+               JOIN {schema}.responses r ON a.response_id = r.id
+               JOIN employees e ON a.employee_id = e.id
+               WHERE a.survey_id = ?
+               ORDER BY a.score ASC""",
+            (survey_id,),
         ).fetchall()
 
         # 部門別集計
         dept_stats = conn.execute(
-            """SELECT e.department,
+            f"""SELECT e.department,
                  COUNT(*) as count,
                  AVG(r.work_satisfaction) as avg_work,
                  AVG(r.relationships) as avg_rel,
                  AVG(r.health) as avg_health
-               FROM responses r
+               FROM {schema}.responses r
                JOIN employees e ON r.employee_id = e.id
                WHERE r.survey_id = ?
                GROUP BY e.department
@@ -379,7 +946,7 @@ def get_survey_stats(survey_id: int) -> dict:
 
         # 面談希望者数
         interview_count = conn.execute(
-            "SELECT COUNT(*) as cnt FROM responses WHERE survey_id = ? AND interview_request = 'yes'",
+            f"SELECT COUNT(*) as cnt FROM {schema}.responses WHERE survey_id = ? AND interview_request = 'yes'",
             (survey_id,),
         ).fetchone()["cnt"]
 
@@ -397,6 +964,335 @@ def get_survey_stats(survey_id: int) -> dict:
         }
 
 
+# ─── 月次推移（集計済みデータ） ────────────────────────
+
+def _refresh_rollups(conn, survey_id: int):
+    """サーベイ × 部門 × 設問ごとの件数・合計・二乗和を再計算"""
+    conn.execute("DELETE FROM survey_rollups WHERE survey_id = ?", (survey_id,))
+    for key in SCORE_KEYS:
+        conn.execute(
+            f"""INSERT INTO survey_rollups (survey_id, department, dimension, n, total, total_sq)
+                SELECT r.survey_id, e.department, ?, COUNT(*), SUM(r.{key}), SUM(r.{key} * r.{key})
+                FROM responses r
+                JOIN employees e ON r.employee_id = e.id
+                WHERE r.survey_id = ?
+                GROUP BY e.department""",
+            (key, survey_id),
+        )
+
+
+def get_rollups(department: str = None, since: str = None, until: str = None) -> list[dict]:
+    """
+    締切済みサーベイの集計を年月 × 設問ごとに取得
+    department 省略時は全社（全部門の合計）
+    """
+    where, params = ["s.status = 'closed'"], []
+    if department is not None:
+        where.append("r.department = ?")
+        params.append(department)
+    if since is not None:
+        where.append("s.year_month >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("s.year_month <= ?")
+        params.append(until)
+    with get_db() as conn:
+        rows = conn.execute(
+            f"""SELECT s.id as survey_id, s.year_month, r.dimension,
+                       SUM(r.n) as n, SUM(r.total) as total, SUM(r.total_sq) as total_sq
+                FROM survey_rollups r
+                JOIN surveys s ON r.survey_id = s.id
+                WHERE {" AND ".join(where)}
+                GROUP BY s.id, r.dimension
+                ORDER BY s.year_month ASC""",
+            params,
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+def get_department_rollups(survey_id: int) -> list[dict]:
+    """サーベイの部門 × 設問ごとの集計"""
+    with get_db() as conn:
+        rows = conn.execute(
+            "SELECT * FROM survey_rollups WHERE survey_id = ? ORDER BY department",
+            (survey_id,),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+def get_previous_closed_survey(survey_id: int) -> dict | None:
+    """指定サーベイの直前に締め切られたサーベイ（year_month順）"""
+    with get_db() as conn:
+        row = conn.execute(
+            """SELECT * FROM surveys
+               WHERE status = 'closed'
+                 AND year_month < (SELECT year_month FROM surveys WHERE id = ?)
+               ORDER BY year_month DESC LIMIT 1""",
+            (survey_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+
+# ─── 部門 × 入社年の集計（回答ごとに加算） ──────────────
+# グループ・勤続年数帯への振り分けは設定で変わるため、表示時に hierarchy.py で畳み込む
+# 部門・入社年は回答時点の従業員マスタの値（入社年が未登録なら 0）
+
+_COHORT_UPSERT = """INSERT INTO cohort_rollups (survey_id, department, join_year, dimension, n, total, total_sq)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(survey_id, department, join_year, dimension) DO UPDATE SET
+        n = n + excluded.n, total = total + excluded.total, total_sq = total_sq + excluded.total_sq"""
+
+
+def _add_cohort_rollups(conn, survey_id: int, employee_id: int, scores: dict):
+    """回答1件分を部門 × 入社年の集計に加算"""
+    employee = conn.execute(
+        "SELECT department, COALESCE(join_year, 0) FROM employees WHERE id = ?", (employee_id,)
+    ).fetchone()
+    if employee is None:
+        return
+    conn.executemany(_COHORT_UPSERT, [
+        (survey_id, employee[0], employee[1], key, 1, scores[key], scores[key] * scores[key])
+        for key in SCORE_KEYS
+    ])
+
+
+def _backfill_cohort_rollups(conn, rows):
+    """
+    既存の回答を部門 × 入社年の集計に加算
+    rows: id, survey_id, department, join_year, 各設問スコア の行
+    """
+    cells = {}
+    for r in rows:
+        for key in SCORE_KEYS:
+            cell = cells.setdefault((r["survey_id"], r["department"], r["join_year"], key), [0, 0.0, 0.0])
+            cell[0] += 1
+            cell[1] += r[key]
+            cell[2] += r[key] * r[key]
+    conn.executemany(_COHORT_UPSERT, [(*k, *v) for k, v in cells.items()])
+
+
+def _refresh_cohort_rollups(conn, survey_id: int):
+    """サーベイ1件分の部門 × 入社年の集計を回答から作り直す（アーカイブ済みも可）"""
+    schema = _survey_schema(conn, survey_id)
+    conn.execute("DELETE FROM cohort_rollups WHERE survey_id = ?", (survey_id,))
+    for key in SCORE_KEYS:
+        conn.execute(
+            f"""INSERT INTO cohort_rollups (survey_id, department, join_year, dimension, n, total, total_sq)
+                SELECT r.survey_id, e.department, COALESCE(e.join_year, 0), ?,
+                       COUNT(*), SUM(r.{key}), SUM(r.{key} * r.{key})
+                FROM {schema}.responses r
+                JOIN employees e ON r.employee_id = e.id
+                WHERE r.survey_id = ?
+                GROUP BY e.department, COALESCE(e.join_year, 0)""",
+            (key, survey_id),
+        )
+    # 集計表はトリガーの対象外なので、応答キャッシュ用のカウンタをここで進める
+    conn.execute(
+        """INSERT INTO survey_versions (survey_id, version) VALUES (?, 1)
+           ON CONFLICT(survey_id) DO UPDATE SET version = version + 1""",
+        (survey_id,),
+    )
+
+
+def get_cohort_rollups(survey_id: int) -> list[dict]:
+    """サーベイの部門 × 入社年 × 設問ごとの件数・合計・二乗和"""
+    with get_read_db() as conn:
+        rows = conn.execute(
+            "SELECT * FROM cohort_rollups WHERE survey_id = ?", (survey_id,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+# ─── 従業員別スコア低下 ───────────────────────────
+
+def _compute_score_drops(conn, survey_id: int) -> list[dict]:
+    """
+    対象サーベイの回答者について、過去の回答との差をウィンドウ関数で一括算出
+    - 前回（LAG）と直近 SCORE_DROP_BASELINE_SURVEYS 回の平均を比較基準にする
+    """
+    prev_cols = ", ".join(f"LAG(r.{k}) OVER w as prev_{k}" for k in SCORE_KEYS)
+    overall = " + ".join(f"r.{k}" for k in SCORE_KEYS)
+    rows = conn.execute(
+        f"""WITH history AS (
+                SELECT r.survey_id, r.employee_id, {", ".join(f"r.{k}" for k in SCORE_KEYS)},
+                       ({overall}) / {len(SCORE_KEYS)}.0 as overall,
+                       LAG(r.survey_id) OVER w as previous_survey_id,
+                       LAG(({overall}) / {len(SCORE_KEYS)}.0) OVER w as previous_overall,
+                       AVG(({overall}) / {len(SCORE_KEYS)}.0) OVER (
+                           w ROWS BETWEEN {SCORE_DROP_BASELINE_SURVEYS} PRECEDING AND 1 PRECEDING
+                       ) as baseline_overall,
+                       {prev_cols}
+                FROM {_all_responses(conn)} r
+                JOIN surveys s ON r.survey_id = s.id
+                WHERE r.employee_id IN (
+                    SELECT employee_id FROM {_survey_schema(conn, survey_id)}.responses WHERE survey_id = ?
+                )
+                  AND s.year_month <= (SELECT year_month FROM surveys WHERE id = ?)
+                WINDOW w AS (PARTITION BY r.employee_id ORDER BY s.year_month)
+            )
+            SELECT h.*, e.name, e.department
+            FROM history h
+            JOIN employees e ON h.employee_id = e.id
+            WHERE h.survey_id = ? AND h.previous_survey_id IS NOT NULL""",
+        (survey_id, survey_id, survey_id),
+    ).fetchall()
+
+    drops = []
+    for r in rows:
+        dimension = max(SCORE_KEYS, key=lambda k: r[f"prev_{k}"] - r[k])
+        drops.append({
+            "survey_id": survey_id,
+            "employee_id": r["employee_id"],
+            "name": r["name"],
+            "department": r["department"],
+            "previous_survey_id": r["previous_survey_id"],
+            "previous_overall": round(r["previous_overall"], 2),
+            "baseline_overall": round(r["baseline_overall"], 2),
+            "overall": round(r["overall"], 2),
+            "drop_amount": round(r["previous_overall"] - r["overall"], 2),
+            "baseline_drop": round(r["baseline_overall"] - r["overall"], 2),
+            "dimension": dimension,
+            "dimension_drop": round(r[f"prev_{dimension}"] - r[dimension], 2),
+        })
+    return drops
+
+
+def _refresh_score_drops(conn, survey_id: int):
+    conn.execute("DELETE FROM score_drops WHERE survey_id = ?", (survey_id,))
+    conn.executemany(
+        """INSERT INTO score_drops
+           (survey_id, employee_id, previous_survey_id, previous_overall, baseline_overall,
+            overall, drop_amount, baseline_drop, dimension, dimension_drop)
+           VALUES (:survey_id, :employee_id, :previous_survey_id, :previous_overall, :baseline_overall,
+                   :overall, :drop_amount, :baseline_drop, :dimension, :dimension_drop)""",
+        _compute_score_drops(conn, survey_id),
+    )
+
+
+def get_score_drops(survey_id: int, min_drop: float = SCORE_DROP_THRESHOLD,
+                    limit: int = None) -> list[dict]:
+    """
+    前回からスコアが大きく低下した従業員（低下幅の大きい順）
+    締切済みサーベイは確定済みの結果を、回答受付中のサーベイはその場で算出
+    """
+    with get_db() as conn:
+        status = conn.execute("SELECT status FROM surveys WHERE id = ?", (survey_id,)).fetchone()
+        if not status:
+            return []
+        if status["status"] == "closed":
+            rows = [dict(r) for r in conn.execute(
+                f"""SELECT d.*, e.name, e.department
+                    FROM score_drops d
+                    JOIN employees e ON d.employee_id = e.id
+                    WHERE d.survey_id = ? AND d.drop_amount >= ?
+                    ORDER BY d.drop_amount DESC
+                    {"LIMIT " + str(int(limit)) if limit else ""}""",
+                (survey_id, min_drop),
+            ).fetchall()]
+        else:
+            rows = sorted(
+                (d for d in _compute_score_drops(conn, survey_id) if d["drop_amount"] >= min_drop),
+                key=lambda d: d["drop_amount"], reverse=True,
+            )[:limit]
+        return rows
+
+
+# ─── アラート ──────────────────────────────────
+
+def _backfill_alerts(conn, rows):
+    """
+    既存の回答からアラートを再判定して登録
+    rows: id, survey_id, employee_id, 各設問スコア, submitted_at の行
+    同じ従業員 × サーベイの対応記録があるもの・締切済みサーベイのもの（移行前に対応済みの扱い）は
+    handled で登録し、未対応一覧に過去の案件が並ばないようにする
+    """
+    closed = {}
+    for r in rows:
+        alert = classify_alert(dict(r))
+        if alert is None:
+            continue
+        severity, dimension, score = alert
+        note = conn.execute(
+            """SELECT id, created_at FROM follow_up_notes
+               WHERE employee_id = ? AND survey_id = ? ORDER BY id DESC LIMIT 1""",
+            (r["employee_id"], r["survey_id"]),
+        ).fetchone()
+        if r["survey_id"] not in closed:
+            closed[r["survey_id"]] = conn.execute(
+                "SELECT status = 'closed' FROM surveys WHERE id = ?", (r["survey_id"],)
+            ).fetchone()[0]
+        status = "handled" if note or closed[r["survey_id"]] else "open"
+        conn.execute(
+            """INSERT OR IGNORE INTO alerts
+               (response_id, survey_id, employee_id, severity, dimension, score, status,
+                follow_up_note_id, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (r["id"], r["survey_id"], r["employee_id"], severity, dimension, score, status,
+             note["id"] if note else None, r["submitted_at"], note["created_at"] if note else r["submitted_at"]),
+        )
+
+
+def get_alert(alert_id: int) -> dict | None:
+    with get_db() as conn:
+        row = conn.execute("SELECT * FROM alerts WHERE id = ?", (alert_id,)).fetchone()
+        return dict(row) if row else None
+
+
+def get_alert_by_response(response_id: int) -> dict | None:
+    """回答IDに紐づくアラート（従業員・サーベイ情報付き）"""
+    with get_db() as conn:
+        row = conn.execute(
+            """SELECT a.*, e.name, e.email, e.department, s.year_month, s.title as survey_title
+               FROM alerts a
+               JOIN employees e ON a.employee_id = e.id
+               JOIN surveys s ON a.survey_id = s.id
+               WHERE a.response_id = ?""",
+            (response_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+
+def get_alerts(survey_id: int = None, status: str = None) -> list[dict]:
+    """アラート一覧（サーベイ・対応状況で絞り込み、アーカイブ済みのサーベイを含む）"""
+    where, params = [], []
+    if survey_id is not None:
+        where.append("a.survey_id = ?")
+        params.append(survey_id)
+    if status is not None:
+        where.append("a.status = ?")
+        params.append(status)
+    with get_db() as conn:
+        if survey_id is not None:
+            schema = _survey_schema(conn, survey_id)
+            alerts, responses = f"{schema}.alerts", f"{schema}.responses"
+        else:
+            alerts, responses = _all_rows(conn, "alerts"), _all_responses(conn)
+        rows = conn.execute(
+            f"""SELECT a.*, e.name, e.department, s.year_month,
+                       r.work_satisfaction, r.relationships, r.health, r.comment
+                FROM {alerts} a
+                JOIN employees e ON a.employee_id = e.id
+                JOIN surveys s ON a.survey_id = s.id
+                JOIN {responses} r ON a.response_id = r.id
+                {"WHERE " + " AND ".join(where) if where else ""}
+                ORDER BY CASE a.severity WHEN 'critical' THEN 0 ELSE 1 END, a.created_at DESC""",
+            params,
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+def update_alert_status(alert_id: int, status: str, follow_up_note_id: int = None):
+    """アラートの対応状況を更新（acknowledged / handled）"""
+    with get_db() as conn:
+        conn.execute(
+            """UPDATE alerts
+               SET status = ?, follow_up_note_id = COALESCE(?, follow_up_note_id),
+                   updated_at = datetime('now', 'localtime')
+               WHERE id = ?""",
+            (status, follow_up_note_id, alert_id),
+        )
+
+
 # ─── 対応記録 ──────────────────────────────────
 
 def add_follow_up_note(employee_id: int, author: str, note: str,
@@ -423,6 +1319,20 @@ def get_follow_up_notes(employee_id: int) -> list[dict]:
         return [dict(r) for r in rows]
 
 
+# ─── メール送信ログ ───────────────────────────────
+
+def log_email(employee_id: int, survey_id: int, email_type: str, status: str = "sent",
+              error_message: str = None) -> int:
+    """メール送信結果を記録（email_type: invite / remind / alert、status: sent / failed）"""
+    with get_db() as conn:
+        cursor = conn.execute(
+            """INSERT INTO email_logs (employee_id, survey_id, email_type, status, error_message)
+               VALUES (?, ?, ?, ?, ?)""",
+            (employee_id, survey_id, email_type, status, error_message),
+        )
+        return cursor.lastrowid
+
+
 if __name__ == "__main__":
     init_db()
     print("[DB] データベースの初期化が完了しました")
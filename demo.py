@@ -48,7 +48,7 @@ def run_demo():
     print(f"   → {result['total']}名分のURLを生成")
     print("\n   サンプルURL:")
     for t in result["tokens"][:3]:
-        print(f"   {t['name']:<12} → {t['url']}")
+        print(f"   {t.name:<12} → {t.url}")
     print(f"   ... 他 {result['total'] - 3}名")
 
     # ── Step 5: 案内メール送信 ──────────────────
@@ -78,7 +78,7 @@ def run_demo():
             comment = random.choice(comments)
             try:
                 sm.submit_response(
-                    token=t["token"],
+                    token=t.token,
                     work=work, relationships=rel, health=health,
                     comment=comment,
                 )
@@ -107,8 +107,7 @@ def run_demo():
     if stats["alerts"]:
         print(f"\n   ⚠️ アラート対象者:")
         for a in stats["alerts"][:5]:
-            min_s = min(a["work_satisfaction"], a["relationships"], a["health"])
-            level = "🔴" if min_s < 1.5 else "🟡"
+            level = "🔴" if a["severity"] == "critical" else "🟡"
             print(f"      {level} {a['name']}（{a['department']}） 仕事:{a['work_satisfaction']:.1f} 関係:{a['relationships']:.1f} 健康:{a['health']:.1f}")
             if a.get("comment"):
                 print(f"         💬 {a['comment']}")
@@ -0,0 +1,165 @@
+"""
+メール配信分析モジュール
+email_logs とトークン・回答から、サーベイごとの配信レポートを作る
+
+- 種類（invite / remind / alert）× 状態（sent / failed）の件数
+- リマインドを送った人のうち、その後に回答した人の割合（リマインド → 回答の転換率）
+- 案内メール送信から回答までの時間の分布
+- 送信に繰り返し失敗しているアドレス（全サーベイ・アーカイブ分を含めた失敗回数）
+
+いずれもサーベイID・従業員IDのインデックスで対象行だけを集計するため、
+ログが毎月増えても1サーベイ分の行数に比例した時間で済む
+"""
+import database as db
+
+# 案内メールから回答までの時間の区切り（時間, ラベル）
+RESPONSE_TIME_BUCKETS = [
+    (1, "1時間以内"),
+    (6, "6時間以内"),
+    (24, "24時間以内"),
+    (72, "3日以内"),
+    (168, "7日以内"),
+    (None, "7日超"),
+]
+# この回数以上失敗したアドレスを「繰り返し失敗」とする
+REPEATED_FAILURE_MIN = 2
+
+
+def _bucket_case(column: str) -> str:
+    whens = " ".join(f"WHEN {column} < {hours} THEN {i}" for i, (hours, _) in enumerate(RESPONSE_TIME_BUCKETS) if hours)
+    return f"CASE {whens} ELSE {len(RESPONSE_TIME_BUCKETS) - 1} END"
+
+
+def _counts(conn, schema: str, survey_id: int) -> dict:
+    counts = {}
+    for r in conn.execute(
+        f"""SELECT email_type, status, COUNT(*) as n FROM {schema}.email_logs
+            WHERE survey_id = ? GROUP BY email_type, status""",
+        (survey_id,),
+    ).fetchall():
+        entry = counts.setdefault(r["email_type"], {"sent": 0, "failed": 0})
+        entry[r["status"]] = r["n"]
+    for entry in counts.values():
+        total = sum(entry.values())
+        entry["failure_rate"] = round(entry.get("failed", 0) / total * 100, 1) if total else 0
+    return counts
+
+
+def _reminder_conversion(conn, schema: str, survey_id: int) -> dict:
+    """リマインド（最初に送れた日時）から回答までの転換"""
+    row = conn.execute(
+        f"""WITH reminders AS (
+                SELECT employee_id, MIN(reminded_at) as reminded_at FROM (
+                    SELECT employee_id, sent_at as reminded_at FROM {schema}.email_logs
+                    WHERE survey_id = ? AND email_type = 'remind' AND status = 'sent'
+                    UNION ALL
+                    SELECT employee_id, reminded_at FROM {schema}.survey_tokens
+                    WHERE survey_id = ? AND reminded_at IS NOT NULL
+                ) GROUP BY employee_id
+            )
+            SELECT COUNT(*) as reminded,
+                   COUNT(r.id) as responded,
+                   COALESCE(SUM(r.submitted_at >= m.reminded_at), 0) as responded_after,
+                   AVG(CASE WHEN r.submitted_at >= m.reminded_at
+                            THEN (julianday(r.submitted_at) - julianday(m.reminded_at)) * 24 END) as avg_hours
+            FROM reminders m
+            LEFT JOIN {schema}.responses r ON r.survey_id = ? AND r.employee_id = m.employee_id""",
+        (survey_id, survey_id, survey_id),
+    ).fetchone()
+    return {
+        "reminded": row["reminded"],
+        "responded_after_reminder": row["responded_after"],
+        "conversion_rate": round(row["responded_after"] / row["reminded"] * 100, 1) if row["reminded"] else 0,
+        "avg_hours_to_respond": round(row["avg_hours"], 1) if row["avg_hours"] is not None else None,
+    }
+
+
+def _response_times(conn, schema: str, survey_id: int) -> dict:
+    """案内メール（トークンの送信日時）から回答までの時間の分布"""
+    rows = conn.execute(
+        f"""SELECT {_bucket_case("hours")} as bucket, COUNT(*) as n, SUM(hours) as total
+            FROM (
+                SELECT (julianday(r.submitted_at) - julianday(t.sent_at)) * 24 as hours
+                FROM {schema}.responses r
+                JOIN {schema}.survey_tokens t ON t.id = r.token_id
+                WHERE r.survey_id = ? AND t.sent_at IS NOT NULL
+            )
+            WHERE hours >= 0
+            GROUP BY bucket""",
+        (survey_id,),
+    ).fetchall()
+    by_bucket = {r["bucket"]: r["n"] for r in rows}
+    n = sum(by_bucket.values())
+    total = sum(r["total"] for r in rows)
+    return {
+        "responses": n,
+        "avg_hours": round(total / n, 1) if n else None,
+        "buckets": [
+            {"label": label, "count": by_bucket.get(i, 0), "ratio": round(by_bucket.get(i, 0) / n * 100, 1) if n else 0}
+            for i, (_, label) in enumerate(RESPONSE_TIME_BUCKETS)
+        ],
+    }
+
+
+def _failures(conn, schema: str, survey_id: int) -> list[dict]:
+    """このサーベイで送信に失敗した従業員と、全期間の失敗回数"""
+    # GROUP BY の + は employee_id 順のインデックスで全失敗ログを走査させず、サーベイIDで絞らせるため
+    failed = conn.execute(
+        f"""SELECT l.employee_id, e.name, e.email, e.department,
+                   COUNT(*) as failures, MAX(l.sent_at) as last_failed_at, l.error_message
+            FROM {schema}.email_logs l
+            JOIN employees e ON e.id = l.employee_id
+            WHERE l.survey_id = ? AND l.status = 'failed'
+            GROUP BY +l.employee_id""",
+        (survey_id,),
+    ).fetchall()
+    if not failed:
+        return []
+
+    ids = [r["employee_id"] for r in failed]
+    placeholders = ", ".join("?" * len(ids))
+    schemas = [r["name"] for r in conn.execute("PRAGMA database_list").fetchall()
+               if r["name"] == "main" or r["name"].startswith("archive_")]
+    totals = dict.fromkeys(ids, 0)
+    for s in schemas:
+        for r in conn.execute(
+            f"""SELECT employee_id, COUNT(*) as n FROM {s}.email_logs
+                WHERE status = 'failed' AND employee_id IN ({placeholders})
+                GROUP BY employee_id""",
+            ids,
+        ).fetchall():
+            totals[r["employee_id"]] += r["n"]
+
+    result = [
+        {**dict(r), "total_failures": totals[r["employee_id"]],
+         "repeated": totals[r["employee_id"]] >= REPEATED_FAILURE_MIN}
+        for r in failed
+    ]
+    result.sort(key=lambda f: (-f["total_failures"], f["employee_id"]))
+    return result
+
+
+def get_delivery_report(survey_id: int) -> dict:
+    """
+    サーベイの配信レポート
+    - 戻り値: {"survey_id", "tokens", "emails", "reminders", "response_times", "failures", "repeated_failures"}
+    """
+    with db.get_read_db() as conn:
+        if not conn.execute("SELECT 1 FROM surveys WHERE id = ?", (survey_id,)).fetchone():
+            raise ValueError(f"サーベイID {survey_id} が見つかりません")
+        schema = db._survey_schema(conn, survey_id)
+        tokens = conn.execute(
+            f"""SELECT COUNT(*) as total, COUNT(sent_at) as invited, COALESCE(SUM(is_used), 0) as responded
+                FROM {schema}.survey_tokens WHERE survey_id = ?""",
+            (survey_id,),
+        ).fetchone()
+        failures = _failures(conn, schema, survey_id)
+        return {
+            "survey_id": survey_id,
+            "tokens": dict(tokens),
+            "emails": _counts(conn, schema, survey_id),
+            "reminders": _reminder_conversion(conn, schema, survey_id),
+            "response_times": _response_times(conn, schema, survey_id),
+            "failures": len(failures),
+            "repeated_failures": [f for f in failures if f["repeated"]],
+        }
@@ -10,25 +10,51 @@ const WEATHER_OPTIONS = [
 
 const token = window.location.pathname.split("/").pop();
 
-const QUESTIONS = [
-  { key: "work", num: 1, title: "仕事満足度", description: "現在の仕事内容や業務量に対する満足度はいかがですか？", icon: "💼" },
-  { key: "relationship", num: 2, title: "人間関係", description: "上司・同僚との関係性やチームの雰囲気はいかがですか？", icon: "🤝" },
-  { key: "health", num: 3, title: "健康", description: "心身の健康状態はいかがですか？（体調・睡眠・ストレスなど）", icon: "💪" },
+// 設問は /api/survey/bootstrap から受け取る（取得できないときはこの3問で表示する）
+const DEFAULT_QUESTIONS = [
+  { key: "work_satisfaction", title: "仕事満足度", description: "現在の仕事内容や業務量に対する満足度はいかがですか？" },
+  { key: "relationships", title: "人間関係", description: "上司・同僚との関係性やチームの雰囲気はいかがですか？" },
+  { key: "health", title: "健康", description: "心身の健康状態はいかがですか？（体調・睡眠・ストレスなど）" },
 ];
 
+const QUESTION_ICONS = { work_satisfaction: "💼", relationships: "🤝", health: "💪" };
+
+const withDisplay = (questions) =>
+  questions.map((q, i) => ({ ...q, num: i + 1, icon: QUESTION_ICONS[q.key] || "📝" }));
+
+const formatMonth = (yearMonth) => {
+  const [y, m] = yearMonth.split("-");
+  return `${y}年${Number(m)}月度`;
+};
+
 export default function SurveyPage() {
   const [step, setStep] = useState("intro"); // intro | survey | interview | comment | done
-  const [answers, setAnswers] = useState({ work: null, relationship: null, health: null });
+  const [boot, setBoot] = useState(null); // { status: "ready" | "invalid", survey, message }
+  const [questions, setQuestions] = useState(withDisplay(DEFAULT_QUESTIONS));
+  const [answers, setAnswers] = useState({});
   const [interviewRequest, setInterviewRequest] = useState(null); // "yes" | "no"
   const [comment, setComment] = useState("");
   const [currentQ, setCurrentQ] = useState(0);
   const [fadeIn, setFadeIn] = useState(true);
   const [progress, setProgress] = useState(0);
 
+  const answeredCount = questions.filter(q => answers[q.key] != null).length;
+
+  useEffect(() => {
+    fetch(`/api/survey/bootstrap/${token}`)
+      .then(res => res.json())
+      .then(data => {
+        if (data.survey) setQuestions(withDisplay(data.survey.questions));
+        setBoot(data.valid === false
+          ? { status: "invalid", survey: data.survey, message: data.message }
+          : { status: "ready", survey: data.survey });
+      })
+      .catch(() => setBoot({ status: "ready" }));
+  }, []);
+
   useEffect(() => {
-    const answered = Object.values(answers).filter(v => v !== null).length;
-    setProgress((answered / 3) * 100);
-  }, [answers]);
+    setProgress((answeredCount / questions.length) * 100);
+  }, [answeredCount, questions]);
 
   const transition = (callback) => {
     setFadeIn(false);
@@ -37,7 +63,7 @@ export default function SurveyPage() {
 
   const selectAnswer = (key, value) => {
     setAnswers({ ...answers, [key]: value });
-    if (currentQ < 2) {
+    if (currentQ < questions.length - 1) {
       setTimeout(() => transition(() => setCurrentQ(currentQ + 1)), 350);
     } else {
       setTimeout(() => transition(() => setStep("interview")), 350);
@@ -56,9 +82,7 @@ export default function SurveyPage() {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
           token,
-          work_satisfaction: answers.work,
-          relationships: answers.relationship,
-          health: answers.health,
+          ...Object.fromEntries(questions.map(q => [q.key, answers[q.key] ?? null])),
           comment,
           interview_request: interviewRequest,
         }),
@@ -74,7 +98,7 @@ export default function SurveyPage() {
     }
   };
 
-  const allAnswered = Object.values(answers).filter(v => v !== null).length === 3;
+  const allAnswered = questions.every(q => q.required === false || answers[q.key] != null);
 
   return (
     <div style={styles.wrapper}>
@@ -88,7 +112,7 @@ export default function SurveyPage() {
             <div style={styles.logo}>G</div>
             <div>
               <div style={styles.logoTitle}>パルスサーベイ</div>
-              <div style={styles.logoSub}>2026年4月度</div>
+              <div style={styles.logoSub}>{boot?.survey ? formatMonth(boot.survey.year_month) : ""}</div>
             </div>
           </div>
           {step === "survey" && (
@@ -96,7 +120,7 @@ export default function SurveyPage() {
               <div style={styles.progressBar}>
                 <div style={{ ...styles.progressFill, width: `${progress}%` }} />
               </div>
-              <span style={styles.progressText}>{Object.values(answers).filter(v => v !== null).length}/3</span>
+              <span style={styles.progressText}>{answeredCount}/{questions.length}</span>
             </div>
           )}
         </header>
@@ -105,14 +129,26 @@ export default function SurveyPage() {
         <main style={{ ...styles.main, opacity: fadeIn ? 1 : 0, transform: fadeIn ? "translateY(0)" : "translateY(8px)" }}>
 
           {/* ── Intro ── */}
-          {step === "intro" && (
+          {step === "intro" && boot?.status === "invalid" && (
+            <div style={styles.introCard}>
+              <div style={styles.introIconWrap}>
+                <span style={{ fontSize: 48 }}>🔒</span>
+              </div>
+              <h1 style={styles.introTitle}>{boot.message}</h1>
+              <p style={styles.introDesc}>
+                {boot.survey ? boot.survey.title : "メールに記載されたURLをご確認ください。"}
+              </p>
+            </div>
+          )}
+
+          {step === "intro" && boot?.status !== "invalid" && (
             <div style={styles.introCard}>
               <div style={styles.introIconWrap}>
                 <span style={{ fontSize: 48 }}>📋</span>
               </div>
               <h1 style={styles.introTitle}>今月のコンディションを教えてください</h1>
               <p style={styles.introDesc}>
-                3つの質問にお天気マークで答えるだけ。<br />所要時間は約1分です。
+                {questions.length}つの質問にお天気マークで答えるだけ。<br />所要時間は約1分です。
               </p>
               <div style={styles.trustBadges}>
                 <TrustItem icon="🔒" text="人事担当およびCUCの担当者のみ閲覧" />
@@ -129,28 +165,28 @@ export default function SurveyPage() {
           {step === "survey" && (
             <div>
               <div style={styles.qTabs}>
-                {QUESTIONS.map((q, i) => (
+                {questions.map((q, i) => (
                   <button key={q.key} onClick={() => transition(() => setCurrentQ(i))}
-                    style={{ ...styles.qTab, ...(currentQ === i ? styles.qTabActive : {}), ...(answers[q.key] !== null ? styles.qTabDone : {}) }}>
-                    <span style={{ fontSize: 14 }}>{answers[q.key] !== null ? "✓" : q.num}</span>
+                    style={{ ...styles.qTab, ...(currentQ === i ? styles.qTabActive : {}), ...(answers[q.key] != null ? styles.qTabDone : {}) }}>
+                    <span style={{ fontSize: 14 }}>{answers[q.key] != null ? "✓" : q.num}</span>
                     <span style={styles.qTabLabel}>{q.title}</span>
                   </button>
                 ))}
               </div>
               <div style={styles.questionCard}>
                 <div style={styles.qHeader}>
-                  <span style={{ fontSize: 32 }}>{QUESTIONS[currentQ].icon}</span>
+                  <span style={{ fontSize: 32 }}>{questions[currentQ].icon}</span>
                   <div>
-                    <div style={styles.qNum}>質問 {QUESTIONS[currentQ].num}</div>
-                    <h2 style={styles.qTitle}>{QUESTIONS[currentQ].title}</h2>
+                    <div style={styles.qNum}>質問 {questions[currentQ].num}</div>
+                    <h2 style={styles.qTitle}>{questions[currentQ].title}</h2>
                   </div>
                 </div>
-                <p style={styles.qDesc}>{QUESTIONS[currentQ].description}</p>
+                <p style={styles.qDesc}>{questions[currentQ].description}</p>
                 <div style={styles.weatherGrid}>
                   {WEATHER_OPTIONS.map(w => {
-                    const isSelected = answers[QUESTIONS[currentQ].key] === w.value;
+                    const isSelected = answers[questions[currentQ].key] === w.value;
                     return (
-                      <button key={w.value} onClick={() => selectAnswer(QUESTIONS[currentQ].key, w.value)}
+                      <button key={w.value} onClick={() => selectAnswer(questions[currentQ].key, w.value)}
                         style={{ ...styles.weatherCard, background: isSelected ? w.activeBg : w.bg, borderColor: isSelected ? w.activeBg : w.border, transform: isSelected ? "scale(1.05)" : "scale(1)", boxShadow: isSelected ? `0 8px 24px ${w.activeBg}44` : "0 2px 8px rgba(0,0,0,0.04)" }}>
                         <span style={{ fontSize: 36 }}>{w.icon}</span>
                         <span style={{ fontSize: 12, fontWeight: 600, marginTop: 4, color: isSelected ? w.activeText : "#475569" }}>{w.label}</span>
@@ -163,10 +199,10 @@ export default function SurveyPage() {
                     <button onClick={() => transition(() => setCurrentQ(currentQ - 1))} style={styles.navBtnBack}>← 前の質問</button>
                   )}
                   <div style={{ flex: 1 }} />
-                  {currentQ < 2 ? (
+                  {currentQ < questions.length - 1 ? (
                     <button onClick={() => transition(() => setCurrentQ(currentQ + 1))}
-                      disabled={answers[QUESTIONS[currentQ].key] === null}
-                      style={{ ...styles.navBtnNext, opacity: answers[QUESTIONS[currentQ].key] !== null ? 1 : 0.4 }}>
+                      disabled={answers[questions[currentQ].key] == null}
+                      style={{ ...styles.navBtnNext, opacity: answers[questions[currentQ].key] != null ? 1 : 0.4 }}>
                       次の質問 →
                     </button>
                   ) : (
@@ -222,7 +258,7 @@ export default function SurveyPage() {
                 </button>
               </div>
               <div style={styles.qNav}>
-                <button onClick={() => transition(() => { setStep("survey"); setCurrentQ(2); })} style={styles.navBtnBack}>← 戻る</button>
+                <button onClick={() => transition(() => { setStep("survey"); setCurrentQ(questions.length - 1); })} style={styles.navBtnBack}>← 戻る</button>
               </div>
             </div>
           )}
@@ -244,7 +280,7 @@ export default function SurveyPage() {
               <div style={styles.summaryWrap}>
                 <div style={styles.summaryTitle}>回答内容の確認</div>
                 <div style={styles.summaryGrid}>
-                  {QUESTIONS.map(q => {
+                  {questions.map(q => {
                     const w = WEATHER_OPTIONS.find(o => o.value === answers[q.key]);
                     return (
                       <div key={q.key} style={styles.summaryItem}>
@@ -282,7 +318,7 @@ export default function SurveyPage() {
                 今月のサーベイは完了です。<br />いただいた回答は、職場環境の改善に役立てさせていただきます。
               </p>
               <div style={styles.doneSummary}>
-                {QUESTIONS.map(q => {
+                {questions.map(q => {
                   const w = WEATHER_OPTIONS.find(o => o.value === answers[q.key]);
                   return (
                     <div key={q.key} style={styles.doneSummaryRow}>
@@ -0,0 +1,173 @@
+"""
+階層別集計モジュール
+全社 → グループ → 部門 と勤続年数帯ごとのスコアを、少人数の集団を伏せて返す
+
+- 回答の登録時に 部門 × 入社年 の件数・合計・二乗和（cohort_rollups）へ加算しておき、
+  表示時はサーベイ1件分のセルを1回読んで全階層を1パスで畳み込む（回答を読み直さない）
+- グループは部門名の先頭の番号（config.DEPARTMENT_GROUPS / DEPARTMENT_GROUP_DIGITS）、
+  勤続年数帯は サーベイの年 − 入社年（config.TENURE_BANDS）で表示時に決めるので、設定を変えても作り直し不要
+- 回答者が MIN_GROUP_SIZE 人未満の集団は人数・スコアを伏せる。兄弟のうち1つだけを伏せると
+  親との差から逆算できるため、その場合は次に人数の少ない兄弟も伏せる
+"""
+import math
+import re
+
+import config
+import database as db
+
+OTHER_GROUP = "その他"
+UNKNOWN_TENURE = "不明"
+_DEPARTMENT_CODE = re.compile(r"^\s*(\d+)")
+
+
+def department_group(department: str) -> tuple[str, str]:
+    """部門名 → (グループのキー, グループ名)"""
+    m = _DEPARTMENT_CODE.match(department)
+    if not m:
+        return OTHER_GROUP, OTHER_GROUP
+    code = m.group(1)
+    for prefix in sorted(config.DEPARTMENT_GROUPS, key=len, reverse=True):
+        if code.startswith(prefix):
+            return prefix, config.DEPARTMENT_GROUPS[prefix]
+    key = code[:config.DEPARTMENT_GROUP_DIGITS]
+    return key, f"グループ{key}"
+
+
+def tenure_band(year: int, join_year: int) -> str:
+    """サーベイの年と入社年（0 は未登録）から勤続年数帯のラベル"""
+    if not join_year:
+        return UNKNOWN_TENURE
+    tenure = max(year - join_year, 0)
+    for limit, label in config.TENURE_BANDS:
+        if limit is None or tenure < limit:
+            return label
+    return config.TENURE_BANDS[-1][1]
+
+
+def _add(acc: dict, key, cell: dict):
+    sums = acc.setdefault(key, {}).setdefault(cell["dimension"], [0, 0.0, 0.0])
+    sums[0] += cell["n"]
+    sums[1] += cell["total"]
+    sums[2] += cell["total_sq"]
+
+
+def _node(name: str, sums: dict) -> dict:
+    """{設問: [件数, 合計, 二乗和]} → 人数・平均・標準偏差"""
+    avg, sd = {}, {}
+    for key in db.SCORE_KEYS:
+        n, total, total_sq = sums.get(key, (0, 0.0, 0.0))
+        if not n:
+            avg[key] = sd[key] = None
+            continue
+        var = (total_sq - total * total / n) / (n - 1) if n > 1 else 0.0
+        avg[key] = round(total / n, 2)
+        sd[key] = round(math.sqrt(max(var, 0.0)), 2)
+    means = [v for v in avg.values() if v is not None]
+    return {
+        "name": name,
+        "n": max((s[0] for s in sums.values()), default=0),
+        "suppressed": False,
+        "avg": avg,
+        "sd": sd,
+        "overall": round(sum(means) / len(means), 2) if means else None,
+    }
+
+
+def suppressed_keys(sizes: dict, min_size: int) -> set:
+    """
+    兄弟の集団 {キー: 人数} のうち伏せるもののキー
+    最小人数未満が1つだけなら、親との差から逆算できないよう次に人数の少ない兄弟も伏せる
+    """
+    small = {k for k, n in sizes.items() if n < min_size}
+    if len(small) == 1 and len(sizes) > 1:
+        small.add(min((k for k in sizes if k not in small), key=lambda k: sizes[k]))
+    return small
+
+
+def _suppress(nodes: list[dict], min_size: int) -> int:
+    """兄弟の集団に最小人数を適用し、伏せた数を返す"""
+    hidden = suppressed_keys({i: x["n"] for i, x in enumerate(nodes)}, min_size)
+    for i in hidden:
+        nodes[i].update(n=None, suppressed=True, avg=None, sd=None, overall=None)
+    return len(hidden)
+
+
+def rebuild(survey_id: int) -> dict:
+    """サーベイ1件分の部門 × 入社年の集計を回答から作り直す（従業員マスタの修正後・アーカイブ済みの初回など）"""
+    if not db.get_survey(survey_id):
+        raise ValueError(f"サーベイID {survey_id} が見つかりません")
+    with db.get_db() as conn:
+        db._refresh_cohort_rollups(conn, survey_id)
+        cells = conn.execute(
+            "SELECT COUNT(*) FROM cohort_rollups WHERE survey_id = ?", (survey_id,)
+        ).fetchone()[0]
+    return {"survey_id": survey_id, "cells": cells}
+
+
+def _needs_rebuild(survey_id: int) -> bool:
+    """集計が空なのに回答がある（移行前にアーカイブしたサーベイ）"""
+    with db.get_read_db() as conn:
+        schema = db._survey_schema(conn, survey_id)
+        return conn.execute(
+            f"SELECT 1 FROM {schema}.responses WHERE survey_id = ? LIMIT 1", (survey_id,)
+        ).fetchone() is not None
+
+
+def get_hierarchy(survey_id: int, min_group_size: int = None) -> dict:
+    """
+    サーベイの階層別集計
+    - min_group_size: 伏せる人数の基準（config.MIN_GROUP_SIZE より小さい値は指定できない）
+    - 戻り値: {"survey_id", "year_month", "min_group_size", "company", "groups": [{..., "departments": [...]}],
+               "tenure": [...], "suppressed": 伏せた集団の数}
+    """
+    min_size = max(config.MIN_GROUP_SIZE, int(min_group_size or 0))
+    survey = db.get_survey(survey_id)
+    if not survey:
+        raise ValueError(f"サーベイID {survey_id} が見つかりません")
+    cells = db.get_cohort_rollups(survey_id)
+    if not cells and _needs_rebuild(survey_id):
+        rebuild(survey_id)
+        cells = db.get_cohort_rollups(survey_id)
+
+    year = int(survey["year_month"][:4])
+    company, groups, departments, tenure = {}, {}, {}, {}
+    group_names, group_of = {}, {}
+    for cell in cells:
+        department = cell["department"]
+        if department not in group_of:
+            key, name = department_group(department)
+            group_of[department], group_names[key] = key, name
+        _add(company, None, cell)
+        _add(groups, group_of[department], cell)
+        _add(departments, department, cell)
+        _add(tenure, tenure_band(year, cell["join_year"]), cell)
+
+    top = _node("全社", company.get(None, {}))
+    suppressed = _suppress([top], min_size)
+    group_nodes = []
+    for key in sorted(groups):
+        node = {"key": key, **_node(group_names[key], groups[key])}
+        node["departments"] = [
+            _node(d, departments[d]) for d in sorted(group_of) if group_of[d] == key
+        ]
+        suppressed += _suppress(node["departments"], min_size)
+        group_nodes.append(node)
+    suppressed += _suppress(group_nodes, min_size)
+    # 伏せたグループの部門を出すと合計から逆算できるので、部門もすべて伏せる
+    for node in group_nodes:
+        if node["suppressed"]:
+            suppressed += _suppress([d for d in node["departments"] if not d["suppressed"]], math.inf)
+
+    order = [label for _, label in config.TENURE_BANDS] + [UNKNOWN_TENURE]
+    tenure_nodes = [_node(label, tenure[label]) for label in order if label in tenure]
+    suppressed += _suppress(tenure_nodes, min_size)
+
+    return {
+        "survey_id": survey_id,
+        "year_month": survey["year_month"],
+        "min_group_size": min_size,
+        "company": top,
+        "groups": group_nodes,
+        "tenure": tenure_nodes,
+        "suppressed": suppressed,
+    }
@@ -0,0 +1,232 @@
+"""
+インデックス監査スクリプト
+大規模なテスト用DBを生成し、database.py などの各関数が実行するSQLを
+EXPLAIN QUERY PLAN で確認して、インデックスを使わない全件走査がないかを検査する
+（違反があれば終了コード1。スキーマ変更時の回帰チェックとして使う）
+
+  python index_audit.py [--employees 5000] [--surveys 12] [--verbose]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import database as db
+import migrations
+
+# 全件走査しても問題ない小さなテーブル（サーベイ数に比例する程度）
+SMALL_TABLES = {"surveys", "survey_archives"}
+
+COMMENTS = [
+    "", "", "", "",
+    "業務量が多く、キャパオーバー気味です",
+    "チーム内のコミュニケーションに課題を感じます",
+    "新しいスキルの習得を進めています",
+    "ワークライフバランスは概ね良好です",
+    "リモートで孤立感を感じることがあります",
+]
+
+_ALIAS_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+([\w.]+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_SQL_KEYWORDS = {"where", "join", "left", "inner", "on", "group", "order", "limit", "cross", "using"}
+
+
+def generate_database(path: str, employees: int, surveys: int, seed: int = 0):
+    """監査用の大規模DBを生成（最新の1件のみ受付中、それ以外は締切済み）"""
+    rng = random.Random(seed)
+    db.DATABASE_PATH = path
+    db.init_db()
+    with db.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO employees (name, email, department, join_year) VALUES (?, ?, ?, ?)",
+            ((f"社員{i}", f"user{i}@example.com", f"{i % 40:02d} 部門{i % 40}", 2000 + i % 26)
+             for i in range(employees)),
+        )
+        for m in range(surveys):
+            year_month = f"{2020 + m // 12}-{m % 12 + 1:02d}"
+            status = "active" if m == surveys - 1 else "closed"
+            survey_id = conn.execute(
+                "INSERT INTO surveys (year_month, title, start_date, deadline, status) VALUES (?, ?, ?, ?, ?)",
+                (year_month, year_month, f"{year_month}-01", f"{year_month}-14", status),
+            ).lastrowid
+            conn.executemany(
+                """INSERT INTO survey_tokens (survey_id, employee_id, token, is_used, sent_at, expires_at)
+                   VALUES (?, ?, ?, 0, ?, '2099-12-31 00:00:00')""",
+                ((survey_id, e, f"t{survey_id}-{e}", f"{year_month}-01 09:00:00" if e % 50 else None)
+                 for e in range(1, employees + 1)),
+            )
+            rows = []
+            for token_id, employee_id in conn.execute(
+                "SELECT id, employee_id FROM survey_tokens WHERE survey_id = ?", (survey_id,)
+            ).fetchall():
+                if rng.random() < 0.9:
+                    rows.append((survey_id, employee_id, token_id,
+                                 rng.randint(1, 5), rng.randint(1, 5), rng.randint(1, 5),
+                                 rng.choice(COMMENTS), rng.choice([None, None, "yes", "no"]),
+                                 f"{year_month}-{rng.randint(1, 14):02d} 12:00:00"))
+            conn.executemany(
+                """INSERT INTO responses (survey_id, employee_id, token_id, work_satisfaction,
+                   relationships, health, comment, interview_request, submitted_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            conn.execute(
+                "UPDATE survey_tokens SET is_used = 1 WHERE id IN (SELECT token_id FROM responses WHERE survey_id = ?)",
+                (survey_id,),
+            )
+            conn.executemany(
+                "INSERT INTO email_logs (employee_id, survey_id, email_type, status) VALUES (?, ?, ?, ?)",
+                ((e, survey_id, t, "failed" if rng.random() < 0.02 else "sent")
+                 for e in range(1, employees + 1) for t in ("invite", "remind")),
+            )
+        conn.executemany(
+            "INSERT INTO follow_up_notes (employee_id, survey_id, author, note) VALUES (?, ?, '人事', 'メモ')",
+            ((rng.randint(1, employees), rng.randint(1, surveys)) for _ in range(employees // 5)),
+        )
+        # アラート・キーワード・集計は移行時と同じバックフィルで作る
+        for name in migrations.BACKFILLS:
+            conn.execute("DELETE FROM schema_backfills WHERE name = ?", (name,))
+            migrations.schedule_backfill(conn, name)
+        conn.commit()
+        migrations.run_backfills(conn)
+        # 過去のアラートは対応済み（未対応は直近分のみ）という実運用に近い分布にする
+        # （バックフィルは締切済みサーベイのアラートを対応済みで登録するので、直近分は未対応に戻す）
+        conn.execute("UPDATE alerts SET status = CASE WHEN survey_id < ? THEN 'handled' ELSE 'open' END",
+                     (surveys - 1,))
+        conn.execute("ANALYZE")
+
+
+def _workload(surveys: int) -> list[tuple]:
+    """監査対象の呼び出し一覧 (ラベル, 関数)"""
+    import analytics
+    import email_report
+    import hierarchy
+    import timeline
+    import trends
+
+    closed, active = surveys - 1, surveys
+    token = f"t{active}-7"
+    alert = db.get_alerts(survey_id=closed, status="open")[0]
+    response_id = alert["response_id"]
+    return [
+        ("get_active_employees", lambda: db.get_active_employees()),
+        ("get_employee_by_id", lambda: db.get_employee_by_id(7)),
+        ("get_survey", lambda: db.get_survey(active)),
+        ("get_survey_by_month", lambda: db.get_survey_by_month("2020-01")),
+        ("get_token_info", lambda: db.get_token_info(token)),
+        ("get_unsent_tokens", lambda: db.get_unsent_tokens(active)),
+        ("get_unreplied_tokens", lambda: db.get_unreplied_tokens(active)),
+        ("mark_token_sent", lambda: db.mark_token_sent(1)),
+        ("mark_token_used", lambda: db.mark_token_used(1)),
+        ("get_responses", lambda: db.get_responses(active)),
+        ("get_employee_history", lambda: db.get_employee_history(7)),
+        ("get_survey_stats", lambda: db.get_survey_stats(active)),
+        ("get_rollups", lambda: db.get_rollups()),
+        ("get_rollups(department)", lambda: db.get_rollups(department="01 部門1", since="2020-03")),
+        ("get_department_rollups", lambda: db.get_department_rollups(closed)),
+        ("get_previous_closed_survey", lambda: db.get_previous_closed_survey(closed)),
+        ("get_score_drops(closed)", lambda: db.get_score_drops(closed)),
+        ("get_score_drops(active)", lambda: db.get_score_drops(active)),
+        ("get_comment_terms", lambda: db.get_comment_terms(closed, department="01 部門1")),
+        ("search_comments", lambda: db.search_comments("キャパオーバー", survey_id=closed, max_score=3)),
+        ("search_comments(short)", lambda: db.search_comments("課題", survey_id=closed)),
+        ("get_alerts(open)", lambda: db.get_alerts(status="open")),
+        ("get_alerts(survey)", lambda: db.get_alerts(survey_id=closed)),
+        ("get_alert", lambda: db.get_alert(alert["id"])),
+        ("get_alert_by_response", lambda: db.get_alert_by_response(response_id)),
+        ("update_alert_status", lambda: db.update_alert_status(alert["id"], "acknowledged")),
+        ("get_follow_up_notes", lambda: db.get_follow_up_notes(7)),
+        ("email_report(closed)", lambda: email_report.get_delivery_report(closed)),
+        ("email_report(active)", lambda: email_report.get_delivery_report(active)),
+        ("hierarchy.get_hierarchy", lambda: hierarchy.get_hierarchy(closed)),
+        ("hierarchy.rebuild", lambda: hierarchy.rebuild(active)),
+        ("timeline.get_timeline", lambda: timeline.get_timeline(7, limit=20)),
+        ("timeline.get_timeline(cursor)", lambda: timeline.get_timeline(
+            7, cursor=timeline.get_timeline(7, limit=5)["next_cursor"], limit=20)),
+        ("analytics.load_scores", lambda: analytics.load_scores(active)),
+        ("trends.get_trends", lambda: trends.get_trends()),
+        ("trends.get_comment_themes", lambda: trends.get_comment_themes(closed)),
+        ("close_survey", lambda: db.close_survey(closed)),
+    ]
+
+
+def _table_aliases(sql: str, tables: set) -> dict:
+    """SQL中の FROM / JOIN から {別名: 実テーブル} を作る"""
+    aliases = {}
+    for table, alias in _ALIAS_PATTERN.findall(sql):
+        table = table.split(".")[-1]
+        if table not in tables:
+            continue
+        aliases[table] = table
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def audit(workload: list[tuple], verbose: bool = False) -> list[dict]:
+    """各呼び出しのSQLを収集し、全件走査を含む実行計画を違反として返す"""
+    with db.get_db() as conn:
+        tables = {r["name"] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    violations = []
+    for label, func in workload:
+        statements = []
+        db.set_trace_callback(statements.append)
+        try:
+            func()
+        finally:
+            db.set_trace_callback(None)
+
+        with db.get_db() as conn:
+            for sql in dict.fromkeys(statements):
+                if not re.match(r"\s*(SELECT|WITH|UPDATE|DELETE|INSERT)", sql, re.IGNORECASE):
+                    continue
+                if sql.lstrip().upper().startswith("INSERT") and "SELECT" not in sql.upper():
+                    continue
+                for table in db.ARCHIVED_TABLES:
+                    if f"all_{table}" in sql:
+                        db._all_rows(conn, table)
+                plan = [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+                aliases = _table_aliases(sql, tables)
+                for detail in plan:
+                    m = re.match(r"SCAN (\w+)$", detail)
+                    if m and aliases.get(m.group(1)) and aliases[m.group(1)] not in SMALL_TABLES:
+                        violations.append({"label": label, "sql": " ".join(sql.split()), "detail": detail})
+                if verbose:
+                    print(f"\n[{label}] {' '.join(sql.split())[:160]}")
+                    for detail in plan:
+                        print(f"    {detail}")
+    return violations
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="インデックス監査（EXPLAIN QUERY PLAN）")
+    parser.add_argument("--employees", type=int, default=5000)
+    parser.add_argument("--surveys", type=int, default=12)
+    parser.add_argument("--verbose", action="store_true", help="全クエリの実行計画を表示")
+    args = parser.parse_args(argv)
+
+    original_path = db.DATABASE_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        generate_database(os.path.join(tmp, "audit.db"), args.employees, args.surveys)
+        print(f"[監査] {args.employees}名 × {args.surveys}サーベイのDBを生成 ({time.perf_counter() - start:.1f}s)")
+        try:
+            violations = audit(_workload(args.surveys), verbose=args.verbose)
+        finally:
+            db.close_read_pool()
+            db.DATABASE_PATH = original_path
+
+    if violations:
+        print(f"\n❌ インデックスを使わない全件走査: {len(violations)}件")
+        for v in violations:
+            print(f"  [{v['label']}] {v['detail']}\n      {v['sql'][:200]}")
+        return 1
+    print("✅ 全クエリがインデックスを使用しています")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""
+回答の一括取り込みモジュール
+紙・キオスク端末で集めた回答を CSV / NDJSON からまとめて登録する
+
+- 行の指定: token 列、または employee_id / email 列 + survey_id（列か引数）
+- スコアはチャンク単位でまとめて検証（NumPy があればベクトル演算）
+- トークンの使用済み化と回答登録はチャンクごとに1トランザクション
+- 1行ごとの結果（登録した回答ID / エラー理由）を返し、エラーがあっても他の行は続行する
+- 締切済みサーベイへの取り込み時は集計・スコア低下を再計算し、スナップショットを破棄する
+
+CSV の列（NDJSON はキーが同じオブジェクトを1行ずつ）:
+  token | employee_id | email, survey_id, work_satisfaction, relationships, health,
+  extra_answer, comment, interview_request, submitted_at
+"""
+import csv
+import io
+import json
+import math
+from datetime import datetime
+
+import config
+import database as db
+import snapshot
+import survey_manager as sm
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHUNK_SIZE = 500
+FORMATS = ("csv", "ndjson")
+SCORE_LABELS = {q["key"]: q["title"] for q in config.SURVEY_QUESTIONS}
+EXTRA_LABEL = "追加質問"
+INTERVIEW_VALUES = (None, "yes", "no")
+
+
+# ─── 読み込み ──────────────────────────────────
+
+def detect_format(name: str = None, content_type: str = None) -> str:
+    """ファイル名・Content-Type から形式を判定（既定は csv）"""
+    hint = (content_type or "") + " " + (name or "")
+    return "ndjson" if "ndjson" in hint or "jsonl" in hint or hint.rstrip().endswith(".json") else "csv"
+
+
+def iter_rows(stream, fmt: str = "csv"):
+    """
+    テキストストリームから (行番号, dict | エラー文字列) を順に返す
+    行番号は CSV ならヘッダーを除いた1始まり、NDJSON なら空行を除いた1始まり
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"形式は {', '.join(FORMATS)} のいずれかを指定してください")
+    if fmt == "csv":
+        for i, row in enumerate(csv.DictReader(stream), 1):
+            yield i, {k.strip(): v for k, v in row.items() if k}
+        return
+    i = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        i += 1
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield i, f"JSONとして読めません: {e.msg}"
+            continue
+        yield i, row if isinstance(row, dict) else "オブジェクトではありません"
+
+
+def _chunks(rows, size: int):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ─── 検証 ──────────────────────────────────────
+
+def _to_float(value) -> float:
+    if value is None or value == "":
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _score_errors(rows: list[dict]) -> list[str | None]:
+    """チャンク内の全行のスコアをまとめて検証（1〜5、extra_answer は空欄可）"""
+    keys = list(SCORE_LABELS) + ["extra_answer"]
+    columns = {key: [_to_float(r.get(key)) for r in rows] for key in keys}
+    if np is not None:
+        bad = {}
+        for key, values in columns.items():
+            arr = np.asarray(values, dtype=np.float64)
+            in_range = (arr >= 1) & (arr <= 5)
+            bad[key] = ~in_range if key != "extra_answer" else ~(in_range | np.isnan(arr))
+        bad = {key: mask.tolist() for key, mask in bad.items()}
+    else:
+        bad = {
+            key: [not (1 <= v <= 5) and not (key == "extra_answer" and math.isnan(v)) for v in values]
+            for key, values in columns.items()
+        }
+
+    errors = []
+    for i in range(len(rows)):
+        invalid = [SCORE_LABELS.get(key, EXTRA_LABEL) for key in keys if bad[key][i]]
+        errors.append(f"スコアが不正です（1〜5）: {', '.join(invalid)}" if invalid else None)
+    for i, row in enumerate(rows):
+        for key in keys:
+            row[key] = None if math.isnan(columns[key][i]) else columns[key][i]
+    return errors
+
+
+def _row_error(row: dict) -> str | None:
+    """スコア以外の項目の検証"""
+    row["interview_request"] = row.get("interview_request") or None
+    if row["interview_request"] not in INTERVIEW_VALUES:
+        return "interview_request は yes / no / 空欄のいずれかです"
+    if row.get("submitted_at"):
+        try:
+            row["submitted_at"] = datetime.fromisoformat(str(row["submitted_at"])).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return "submitted_at の日時形式が不正です"
+    else:
+        row["submitted_at"] = None
+    row["comment"] = str(row.get("comment") or "")
+    return None
+
+
+# ─── トークンの解決 ───────────────────────────────
+
+_TOKEN_COLUMNS = """t.id, t.survey_id, t.employee_id, t.is_used, s.status as survey_status,
+                    a.survey_id IS NOT NULL as archived"""
+_TOKEN_JOINS = """JOIN surveys s ON t.survey_id = s.id
+                  LEFT JOIN survey_archives a ON a.survey_id = t.survey_id"""
+
+
+def _resolve_tokens(conn, rows: list[dict], survey_id: int = None) -> list[dict | str]:
+    """各行をトークン行に解決（見つからなければエラー文字列）"""
+    by_token = [r["token"] for r in rows if r.get("token")]
+    tokens = {}
+    if by_token:
+        placeholders = ", ".join("?" * len(by_token))
+        for t in conn.execute(
+            f"SELECT t.token, {_TOKEN_COLUMNS} FROM survey_tokens t {_TOKEN_JOINS} WHERE t.token IN ({placeholders})",
+            by_token,
+        ).fetchall():
+            tokens[t["token"]] = dict(t)
+
+    emails = [r["email"] for r in rows if not r.get("token") and not r.get("employee_id") and r.get("email")]
+    employee_ids = {}
+    if emails:
+        placeholders = ", ".join("?" * len(emails))
+        employee_ids = dict(conn.execute(
+            f"SELECT email, id FROM employees WHERE email IN ({placeholders})", emails
+        ).fetchall())
+
+    resolved, keyed = [], {}
+    for r in rows:
+        if r.get("token"):
+            resolved.append(tokens.get(r["token"], "トークンが見つかりません"))
+            continue
+        sid = r.get("survey_id") or survey_id
+        if r.get("employee_id"):
+            eid = r["employee_id"]
+        elif r.get("email"):
+            eid = employee_ids.get(r["email"])
+            if eid is None:
+                resolved.append("メールアドレスに該当する従業員がいません")
+                continue
+        else:
+            resolved.append("token / employee_id / email のいずれかが必要です")
+            continue
+        if not sid:
+            resolved.append("survey_id が必要です")
+            continue
+        try:
+            key = (int(sid), int(eid))
+        except (TypeError, ValueError):
+            resolved.append("survey_id / employee_id は整数で指定してください")
+            continue
+        keyed[key] = None
+        resolved.append(key)
+
+    for (sid, eid) in keyed:
+        t = conn.execute(
+            f"SELECT {_TOKEN_COLUMNS} FROM survey_tokens t {_TOKEN_JOINS} WHERE t.survey_id = ? AND t.employee_id = ?",
+            (sid, eid),
+        ).fetchone()
+        keyed[(sid, eid)] = dict(t) if t else "この従業員のトークンがありません（配信準備前）"
+    return [keyed[r] if isinstance(r, tuple) else r for r in resolved]
+
+
+def _token_error(token: dict) -> str | None:
+    if token["archived"]:
+        return "アーカイブ済みのサーベイです"
+    if token["survey_status"] not in ("active", "closed"):
+        return "配信前のサーベイです"
+    if token["is_used"]:
+        return "回答済みです"
+    return None
+
+
+# ─── 取り込み ──────────────────────────────────
+
+def ingest(rows, survey_id: int = None, dry_run: bool = False, notify: bool = True,
+           chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    (行番号, dict | エラー文字列) の列を取り込む（iter_rows の戻り値をそのまま渡せる）
+    - dry_run: 検証のみ（登録しない）
+    - notify: 登録したアラートでフック（アラートメール等）を呼ぶ
+    - 戻り値: {"total", "inserted", "failed", "alerts", "refreshed_surveys", "rows": [...]}
+    """
+    results, alerts, closed = [], [], set()
+    for chunk in _chunks(rows, chunk_size):
+        parsed = [(n, r) for n, r in chunk if isinstance(r, dict)]
+        results.extend({"row": n, "status": "error", "error": r} for n, r in chunk if not isinstance(r, dict))
+        if not parsed:
+            continue
+        score_errors = _score_errors([r for _, r in parsed])
+
+        with db.get_db() as conn:
+            # 同時に受け付ける回答送信とトークンを取り合わないよう、解決から登録までを1トランザクションで行う
+            conn.execute("BEGIN" if dry_run else "BEGIN IMMEDIATE")
+            tokens = _resolve_tokens(conn, [r for _, r in parsed], survey_id)
+            claimed, touched = set(), set()
+            for (n, row), score_error, token in zip(parsed, score_errors, tokens):
+                error = score_error or _row_error(row)
+                if error is None and isinstance(token, str):
+                    error = token
+                if error is None:
+                    error = _token_error(token) or ("同じファイル内で重複しています" if token["id"] in claimed else None)
+                if error:
+                    results.append({"row": n, "status": "error", "error": error})
+                    continue
+                claimed.add(token["id"])
+                if dry_run:
+                    results.append({"row": n, "status": "ok", "response_id": None})
+                    continue
+                if not conn.execute(
+                    "UPDATE survey_tokens SET is_used = 1 WHERE id = ? AND is_used = 0", (token["id"],)
+                ).rowcount:
+                    results.append({"row": n, "status": "error", "error": "回答済みです"})
+                    continue
+                response_id = db._insert_response(
+                    conn, token["survey_id"], token["employee_id"], token["id"],
+                    row["work_satisfaction"], row["relationships"], row["health"],
+                    row["extra_answer"], row["comment"], row["interview_request"], row["submitted_at"],
+                )
+                results.append({"row": n, "status": "ok", "response_id": response_id})
+                if db.classify_alert(row):
+                    alerts.append(response_id)
+                if token["survey_status"] == "closed":
+                    touched.add(token["survey_id"])
+
+            # 締切済みサーベイは締切時に確定した集計を同じトランザクションで取り直す
+            for sid in sorted(touched):
+                db._refresh_rollups(conn, sid)
+                db._refresh_score_drops(conn, sid)
+            closed |= touched
+            if dry_run:
+                conn.rollback()
+
+    for sid in sorted(closed):
+        snapshot.remove_snapshot(sid)
+    if notify and sm._alert_hooks:
+        for response_id in alerts:
+            sm._run_alert_hooks(db.get_alert_by_response(response_id))
+
+    results.sort(key=lambda r: r["row"])
+    inserted = sum(1 for r in results if r["status"] == "ok")
+    return {
+        "dry_run": dry_run,
+        "total": len(results),
+        "inserted": inserted,
+        "failed": len(results) - inserted,
+        "alerts": len(alerts),
+        "refreshed_surveys": sorted(closed),
+        "rows": results,
+    }
+
+
+def ingest_stream(stream, fmt: str = "csv", **kwargs) -> dict:
+    """テキスト / バイナリのストリームから取り込む"""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    return ingest(iter_rows(stream, fmt), **kwargs)
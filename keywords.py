@@ -0,0 +1,31 @@
+"""
+自由記述コメントのキーワード抽出モジュール
+形態素解析器に頼らず、文字種（漢字・カタカナ・英数字）の連続をキーワードとみなす
+例: "業務量が多く、キャパオーバー気味です" → {"業務量", "キャパオーバー", "気味"}
+"""
+import re
+import unicodedata
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 20
+
+# 漢字の連続 / カタカナ（長音含む）の連続 / 英数字の連続
+_TERM_PATTERN = re.compile(r"[一-龯々〆ヵヶ]+|[ァ-ヺー]+|[A-Za-z][A-Za-z0-9]*")
+
+STOPWORDS = {
+    "感じ", "思い", "気持", "自分", "今月", "先月", "最近", "特", "特に",
+    "the", "and", "for", "with",
+}
+
+
+def extract_terms(text: str) -> set[str]:
+    """コメントからキーワードを抽出（1コメント内の重複は除く）"""
+    if not text:
+        return set()
+    text = unicodedata.normalize("NFKC", text)
+    terms = set()
+    for m in _TERM_PATTERN.finditer(text):
+        term = m.group().lower().lstrip("ー")
+        if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH and term not in STOPWORDS:
+            terms.add(term)
+    return terms
@@ -0,0 +1,252 @@
+"""
+データベース保守モジュール
+WALのチェックポイント・PRAGMA optimize・インクリメンタルVACUUM・オンラインバックアップを
+回答送信を止めない単位に分けて実行する（CLI から、または app.py のバックグラウンドスレッドから）
+
+- チェックポイントは短い busy_timeout で行い、読み取り中の接続があれば待たずに次回へ回す
+- VACUUM は空きページを少しずつ返却する（auto_vacuum=INCREMENTAL のDBのみ）
+- バックアップは sqlite3 のバックアップAPIで数百ページずつコピーする
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import config
+import database as db
+
+# 保守用接続のロック待ち（ミリ秒）。超えたら諦めて回答送信を優先する
+BUSY_TIMEOUT_MS = 100
+# インクリメンタルVACUUM 1回で返却するページ数（1回ごとにコミット）
+VACUUM_PAGES_PER_STEP = 256
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def _file_size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _sizes() -> dict:
+    return {
+        "db_bytes": _file_size(db.current_db_path()),
+        "wal_bytes": _file_size(db.current_db_path() + "-wal"),
+    }
+
+
+def _timed(func, *args, **kwargs) -> dict:
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return {**result, "seconds": round(time.perf_counter() - start, 3)}
+
+
+# ─── 個別処理 ──────────────────────────────────
+
+def checkpoint(mode: str = "PASSIVE") -> dict:
+    """
+    WALをDB本体へ書き戻す
+    - PASSIVE: 他の接続を待たずに書き戻せる分だけ
+    - TRUNCATE: 全て書き戻してWALファイルを0バイトにする（読み取り中の接続があれば busy=1 で終了）
+    """
+    mode = mode.upper()
+    if mode not in ("PASSIVE", "TRUNCATE"):
+        raise ValueError("mode は PASSIVE / TRUNCATE のいずれかを指定してください")
+    before = _sizes()["wal_bytes"]
+    with db.get_db() as conn:
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        busy, log_pages, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    after = _sizes()["wal_bytes"]
+    return {
+        "mode": mode.lower(),
+        "busy": bool(busy),
+        "wal_pages": log_pages,
+        "checkpointed_pages": checkpointed,
+        "wal_bytes_before": before,
+        "wal_bytes_after": after,
+        "freed_bytes": max(before - after, 0),
+    }
+
+
+def optimize() -> dict:
+    """PRAGMA optimize（統計が古くなったテーブルだけ ANALYZE される）"""
+    with db.get_db() as conn:
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA optimize")
+    return {}
+
+
+def incremental_vacuum(max_pages: int = None) -> dict:
+    """
+    空きページをファイルから返却（アーカイブ後など大量削除のあとに実行）
+    VACUUM_PAGES_PER_STEP ページごとにコミットし、書き込みロックを長く保持しない
+    """
+    with db.get_db() as conn:
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        mode = AUTO_VACUUM_MODES[conn.execute("PRAGMA auto_vacuum").fetchone()[0]]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if mode != "incremental":
+            return {
+                "auto_vacuum": mode,
+                "skipped": "auto_vacuum=INCREMENTAL ではありません（enable_incremental_vacuum を実行してください）",
+                "free_pages": free_before,
+            }
+        remaining, steps = free_before if max_pages is None else min(free_before, max_pages), 0
+        while remaining > 0:
+            step = min(remaining, VACUUM_PAGES_PER_STEP)
+            # execute() は1ステップ（1ページ）で止まるため executescript で最後まで実行する（自動コミット）
+            conn.executescript(f"PRAGMA incremental_vacuum({step});")
+            remaining -= step
+            steps += 1
+        free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "auto_vacuum": mode,
+        "steps": steps,
+        "free_pages_before": free_before,
+        "free_pages_after": free_after,
+        "freed_bytes": (free_before - free_after) * page_size,
+    }
+
+
+def enable_incremental_vacuum() -> dict:
+    """
+    既存DBを auto_vacuum=INCREMENTAL に切り替える（1回だけ実行）
+    切り替えには全体の VACUUM が必要でその間は書き込みが止まるため、利用の少ない時間帯に行う
+    """
+    before = _sizes()["db_bytes"]
+    with db.get_db() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return {"auto_vacuum": "incremental", "changed": False}
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    return {
+        "auto_vacuum": "incremental",
+        "changed": True,
+        "freed_bytes": max(before - _sizes()["db_bytes"], 0),
+    }
+
+
+def backup(output: str = None, pages_per_step: int = None) -> dict:
+    """
+    稼働中のDBをオンラインでバックアップ
+    バックアップAPIで pages_per_step ページずつコピーし、一時ファイルに書き終えてから置き換える
+    古いバックアップは BACKUP_KEEP 世代だけ残す（出力先を指定した場合は整理しない）
+    """
+    pages_per_step = pages_per_step or config.BACKUP_PAGES_PER_STEP
+    backup_dir = db.data_path("backups", config.BACKUP_DIR)
+    if output is None:
+        output = os.path.join(backup_dir, f"survey-{datetime.now():%Y%m%d-%H%M%S}.db")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    tmp_path = output + ".tmp"
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+
+    with db.get_db() as src:
+        dest = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dest, pages=pages_per_step, progress=progress, sleep=0.001)
+            pages = dest.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            dest.close()
+    os.replace(tmp_path, output)
+
+    removed = []
+    if os.path.dirname(os.path.abspath(output)) == os.path.abspath(backup_dir):
+        removed = _prune_backups(backup_dir)
+    return {
+        "output": output,
+        "pages": pages,
+        "steps": steps,
+        "bytes": _file_size(output),
+        "removed": removed,
+    }
+
+
+def _prune_backups(backup_dir: str) -> list[str]:
+    files = sorted(
+        f for f in os.listdir(backup_dir) if f.startswith("survey-") and f.endswith(".db")
+    )
+    removed = files[:-config.BACKUP_KEEP] if config.BACKUP_KEEP > 0 else []
+    for f in removed:
+        os.remove(os.path.join(backup_dir, f))
+    return removed
+
+
+# ─── まとめて実行 ─────────────────────────────────
+
+def run_maintenance(truncate: bool = True, vacuum: bool = True, with_backup: bool = False) -> dict:
+    """
+    定期保守を一通り実行
+    チェックポイント(PASSIVE) → optimize → インクリメンタルVACUUM → チェックポイント(TRUNCATE) → バックアップ
+    - 戻り値: {"tasks": {処理名: 結果（seconds 付き）}, "seconds", "db_bytes", "wal_bytes"}
+    """
+    start = time.perf_counter()
+    tasks = {"checkpoint": _timed(checkpoint, "PASSIVE"), "optimize": _timed(optimize)}
+    if vacuum:
+        tasks["incremental_vacuum"] = _timed(incremental_vacuum)
+    if truncate:
+        tasks["checkpoint_truncate"] = _timed(checkpoint, "TRUNCATE")
+    if with_backup:
+        tasks["backup"] = _timed(backup)
+    return {"tasks": tasks, "seconds": round(time.perf_counter() - start, 3), **_sizes()}
+
+
+# ─── バックグラウンド実行 ───────────────────────────
+
+_scheduler = None
+_last_report = None
+
+
+def _run_all(with_backup: bool) -> dict:
+    """既定のDBと全テナントのDBを順に保守"""
+    import tenants
+    report = {"finished_at": None, **run_maintenance(with_backup=with_backup)}
+    if config.MULTI_TENANT:
+        report["tenants"] = {}
+        for tenant_id in tenants.list_tenants():
+            with tenants.use_tenant(tenant_id):
+                report["tenants"][tenant_id] = run_maintenance(with_backup=with_backup)
+    report["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    return report
+
+
+def _scheduler_loop(interval: int, backup_interval: int, stop: threading.Event):
+    global _last_report
+    last_backup = time.monotonic()
+    while not stop.wait(interval):
+        with_backup = backup_interval > 0 and time.monotonic() - last_backup >= backup_interval
+        try:
+            _last_report = _run_all(with_backup)
+            if with_backup:
+                last_backup = time.monotonic()
+        except Exception as e:
+            print(f"[保守] エラー: {e}")
+
+
+def start_scheduler(interval: int = None, backup_interval: int = None) -> threading.Event | None:
+    """
+    定期保守スレッドを開始（interval 秒ごと。0 なら起動しない）
+    - 戻り値: 停止用の Event（set() で停止）
+    """
+    global _scheduler
+    interval = config.MAINTENANCE_INTERVAL if interval is None else interval
+    backup_interval = config.BACKUP_INTERVAL if backup_interval is None else backup_interval
+    if interval <= 0 or _scheduler is not None:
+        return None
+    stop = threading.Event()
+    _scheduler = threading.Thread(
+        target=_scheduler_loop, args=(interval, backup_interval, stop),
+        name="db-maintenance", daemon=True,
+    )
+    _scheduler.start()
+    print(f"[保守] {interval}秒ごとに定期保守を実行します")
+    return stop
+
+
+def get_last_report() -> dict | None:
+    """バックグラウンドで最後に実行した保守の結果"""
+    return _last_report
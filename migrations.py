@@ -0,0 +1,578 @@
+"""
+スキーマ移行モジュール
+PRAGMA user_version をスキーマのバージョンとして、未適用の移行ステップだけを順に適用する
+新設テーブルへの既存データの反映（バックフィル）は schema_backfills に登録し、
+id 順の小さなバッチごとにコミットして進める（途中で止まっても続きから再開できる）
+"""
+import sqlite3
+import time
+
+import config
+import database as db
+
+# 段階的バックフィルの進捗（移行処理自体の管理用テーブル）
+BACKFILL_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_backfills (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL DEFAULT 0,  -- 処理済みの最大id
+        max_id INTEGER NOT NULL,             -- 登録時点の最大id（以降の行は通常の書き込み経路で反映済み）
+        done INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT DEFAULT (datetime('now', 'localtime'))
+    )
+"""
+
+
+# ─── v1: 基本スキーマ ─────────────────────────────
+
+SCHEMA_V1 = """
+    -- 従業員マスタ
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        department TEXT NOT NULL,
+        join_year INTEGER,
+        is_active INTEGER DEFAULT 1,
+        created_at TEXT DEFAULT (datetime('now', 'localtime')),
+        updated_at TEXT DEFAULT (datetime('now', 'localtime'))
+    );
+
+    -- サーベイ配信管理
+    CREATE TABLE IF NOT EXISTS surveys (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        year_month TEXT NOT NULL UNIQUE,  -- "2026-02" 形式
+        title TEXT NOT NULL,
+        start_date TEXT NOT NULL,
+        deadline TEXT NOT NULL,
+        extra_question_title TEXT,         -- 追加質問（4問目）
+        extra_question_description TEXT,
+        status TEXT DEFAULT 'draft',       -- draft / active / closed
+        created_at TEXT DEFAULT (datetime('now', 'localtime'))
+    );
+
+    -- トークン管理（従業員 × サーベイごとに1トークン）
+    CREATE TABLE IF NOT EXISTS survey_tokens (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        survey_id INTEGER NOT NULL,
+        employee_id INTEGER NOT NULL,
+        token TEXT NOT NULL UNIQUE,
+        is_used INTEGER DEFAULT 0,
+        sent_at TEXT,
+        reminded_at TEXT,
+        expires_at TEXT NOT NULL,
+        created_at TEXT DEFAULT (datetime('now', 'localtime')),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id),
+        FOREIGN KEY (employee_id) REFERENCES employees(id),
+        UNIQUE(survey_id, employee_id)
+    );
+
+    -- 回答データ
+    CREATE TABLE IF NOT EXISTS responses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        survey_id INTEGER NOT NULL,
+        employee_id INTEGER NOT NULL,
+        token_id INTEGER NOT NULL,
+        work_satisfaction REAL NOT NULL CHECK(work_satisfaction BETWEEN 1 AND 5),
+        relationships REAL NOT NULL CHECK(relationships BETWEEN 1 AND 5),
+        health REAL NOT NULL CHECK(health BETWEEN 1 AND 5),
+        extra_answer REAL,
+        comment TEXT DEFAULT '',
+        interview_request TEXT DEFAULT NULL,
+        submitted_at TEXT DEFAULT (datetime('now', 'localtime')),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id),
+        FOREIGN KEY (employee_id) REFERENCES employees(id),
+        FOREIGN KEY (token_id) REFERENCES survey_tokens(id),
+        UNIQUE(survey_id, employee_id)
+    );
+
+    -- 対応記録
+    CREATE TABLE IF NOT EXISTS follow_up_notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id INTEGER NOT NULL,
+        survey_id INTEGER,
+        author TEXT NOT NULL,
+        note TEXT NOT NULL,
+        action_type TEXT DEFAULT 'memo',  -- memo / meeting / call / email
+        created_at TEXT DEFAULT (datetime('now', 'localtime')),
+        FOREIGN KEY (employee_id) REFERENCES employees(id),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id)
+    );
+
+    -- メール送信ログ
+    CREATE TABLE IF NOT EXISTS email_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id INTEGER NOT NULL,
+        survey_id INTEGER NOT NULL,
+        email_type TEXT NOT NULL,  -- invite / remind / alert
+        sent_at TEXT DEFAULT (datetime('now', 'localtime')),
+        status TEXT DEFAULT 'sent',
+        error_message TEXT,
+        FOREIGN KEY (employee_id) REFERENCES employees(id),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id)
+    );
+
+    -- アラート（回答時に判定して記録）
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        response_id INTEGER NOT NULL UNIQUE,
+        survey_id INTEGER NOT NULL,
+        employee_id INTEGER NOT NULL,
+        severity TEXT NOT NULL,            -- critical / warning
+        dimension TEXT NOT NULL,           -- 最もスコアが低かった設問キー
+        score REAL NOT NULL,
+        status TEXT DEFAULT 'open',        -- open / acknowledged / handled
+        follow_up_note_id INTEGER,
+        created_at TEXT DEFAULT (datetime('now', 'localtime')),
+        updated_at TEXT DEFAULT (datetime('now', 'localtime')),
+        FOREIGN KEY (response_id) REFERENCES responses(id),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id),
+        FOREIGN KEY (employee_id) REFERENCES employees(id),
+        FOREIGN KEY (follow_up_note_id) REFERENCES follow_up_notes(id)
+    );
+
+    -- アーカイブ済みサーベイ（トークン・回答・メールログは年別DBへ移動）
+    CREATE TABLE IF NOT EXISTS survey_archives (
+        survey_id INTEGER PRIMARY KEY,
+        file_name TEXT NOT NULL,           -- ARCHIVE_DIR 内のファイル名
+        token_count INTEGER NOT NULL,
+        response_count INTEGER NOT NULL,
+        email_log_count INTEGER NOT NULL,
+        archived_at TEXT DEFAULT (datetime('now', 'localtime')),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id)
+    );
+
+    -- 締切済みサーベイの集計（サーベイ × 部門 × 設問）
+    CREATE TABLE IF NOT EXISTS survey_rollups (
+        survey_id INTEGER NOT NULL,
+        department TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        total REAL NOT NULL,
+        total_sq REAL NOT NULL,
+        PRIMARY KEY (survey_id, department, dimension),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id)
+    ) WITHOUT ROWID;
+
+    -- 従業員ごとの前回比スコア低下（締切時に確定）
+    CREATE TABLE IF NOT EXISTS score_drops (
+        survey_id INTEGER NOT NULL,
+        employee_id INTEGER NOT NULL,
+        previous_survey_id INTEGER NOT NULL,
+        previous_overall REAL NOT NULL,
+        baseline_overall REAL NOT NULL,   -- 直近数回の平均
+        overall REAL NOT NULL,
+        drop_amount REAL NOT NULL,        -- 前回 − 今回
+        baseline_drop REAL NOT NULL,      -- 直近平均 − 今回
+        dimension TEXT NOT NULL,          -- 最も低下した設問キー
+        dimension_drop REAL NOT NULL,
+        PRIMARY KEY (survey_id, employee_id),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id),
+        FOREIGN KEY (employee_id) REFERENCES employees(id)
+    ) WITHOUT ROWID;
+
+    -- インデックス
+    CREATE INDEX IF NOT EXISTS idx_alerts_status ON alerts(status, severity, created_at);
+    CREATE INDEX IF NOT EXISTS idx_alerts_survey ON alerts(survey_id, status);
+    CREATE INDEX IF NOT EXISTS idx_responses_employee_scores
+        ON responses(employee_id, survey_id, work_satisfaction, relationships, health);
+    CREATE INDEX IF NOT EXISTS idx_score_drops_rank ON score_drops(survey_id, drop_amount DESC);
+
+    -- コメントのキーワード出現数（サーベイ × 部門 × 語、回答時に加算）
+    CREATE TABLE IF NOT EXISTS comment_terms (
+        survey_id INTEGER NOT NULL,
+        department TEXT NOT NULL,
+        term TEXT NOT NULL,
+        n INTEGER NOT NULL,               -- その語を含むコメント数
+        PRIMARY KEY (survey_id, department, term),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id)
+    ) WITHOUT ROWID;
+
+    -- 自由記述コメントの全文検索（trigramで日本語も部分一致検索）
+    CREATE VIRTUAL TABLE IF NOT EXISTS responses_fts USING fts5(
+        comment, content='responses', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS responses_fts_insert AFTER INSERT ON responses BEGIN
+        INSERT INTO responses_fts(rowid, comment) VALUES (new.id, new.comment);
+    END;
+    CREATE TRIGGER IF NOT EXISTS responses_fts_delete AFTER DELETE ON responses BEGIN
+        INSERT INTO responses_fts(responses_fts, rowid, comment) VALUES ('delete', old.id, old.comment);
+    END;
+    CREATE TRIGGER IF NOT EXISTS responses_fts_update AFTER UPDATE OF comment ON responses BEGIN
+        INSERT INTO responses_fts(responses_fts, rowid, comment) VALUES ('delete', old.id, old.comment);
+        INSERT INTO responses_fts(rowid, comment) VALUES (new.id, new.comment);
+    END;
+
+"""
+
+# 問い合わせパターンに合わせたインデックス（旧来の単一列インデックスを置き換える）
+INDEXES_V1 = [
+    # 未送信・未回答・送信数（get_unsent_tokens / get_unreplied_tokens / get_survey_stats）
+    "CREATE INDEX IF NOT EXISTS idx_tokens_survey_sent ON survey_tokens(survey_id, sent_at, is_used)",
+    # 回答一覧の並び順（get_responses）
+    "CREATE INDEX IF NOT EXISTS idx_responses_survey_submitted ON responses(survey_id, submitted_at)",
+    # 面談希望者数（get_survey_stats）
+    "CREATE INDEX IF NOT EXISTS idx_responses_interview ON responses(survey_id) WHERE interview_request = 'yes'",
+    # 有効な従業員一覧（get_active_employees）
+    "CREATE INDEX IF NOT EXISTS idx_employees_active ON employees(department, name) WHERE is_active = 1",
+    # 部門での絞り込み（コメント検索・キーワード集計）
+    "CREATE INDEX IF NOT EXISTS idx_employees_department ON employees(department)",
+    # 対応記録（get_follow_up_notes）
+    "CREATE INDEX IF NOT EXISTS idx_notes_employee ON follow_up_notes(employee_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_notes_survey ON follow_up_notes(survey_id)",
+    # メールログ
+    "CREATE INDEX IF NOT EXISTS idx_email_logs_survey ON email_logs(survey_id, email_type, status)",
+    "CREATE INDEX IF NOT EXISTS idx_email_logs_employee ON email_logs(employee_id, sent_at)",
+    # アラート（従業員別）
+    "CREATE INDEX IF NOT EXISTS idx_alerts_employee ON alerts(employee_id, created_at)",
+]
+
+# v1 以前のインデックス（上記の複合インデックス・UNIQUE制約の自動インデックスと重複）
+DROPPED_INDEXES_V1 = ["idx_tokens_token", "idx_tokens_survey", "idx_responses_survey", "idx_responses_employee"]
+
+# 新設時にバックフィルが必要なテーブル → バックフィル名
+NEW_TABLE_BACKFILLS_V1 = {
+    "alerts": "alerts",
+    "comment_terms": "comment_terms",
+    "survey_rollups": "closed_surveys",
+    "score_drops": "closed_surveys",
+}
+
+
+# 初期のDBにない列（CREATE TABLE IF NOT EXISTS では追加されない）
+COLUMNS_V1 = {
+    "responses": {"interview_request": "TEXT DEFAULT NULL"},
+}
+
+
+def _migrate_v1(conn):
+    existing = _table_names(conn)
+    _execute_script(conn, SCHEMA_V1)
+    for table, columns in COLUMNS_V1.items():
+        present = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        for name, decl in columns.items():
+            if name not in present:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+    for name in DROPPED_INDEXES_V1:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    for sql in INDEXES_V1:
+        conn.execute(sql)
+    for table, name in NEW_TABLE_BACKFILLS_V1.items():
+        if table not in existing:
+            schedule_backfill(conn, name)
+    # FTSの再構築はSQLite内部で一括処理され十分速いので同じトランザクションで行う
+    if "responses_fts" not in existing:
+        conn.execute("INSERT INTO responses_fts(responses_fts) VALUES ('rebuild')")
+
+
+# ─── v2: 変更カウンタ ─────────────────────────────
+
+# サーベイごとの変更カウンタ（管理画面APIの ETag・応答キャッシュの判定用）
+# survey_id = 0 はサーベイ一覧・従業員マスタの変更（全サーベイの応答に影響する）
+SCHEMA_V2 = """
+    CREATE TABLE IF NOT EXISTS survey_versions (
+        survey_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+"""
+
+# カウンタを進めるテーブル → サーベイIDの列（None は survey_id = 0）
+VERSIONED_TABLES_V2 = {
+    "responses": "survey_id",
+    "survey_tokens": "survey_id",
+    "alerts": "survey_id",
+    "survey_archives": "survey_id",
+    "surveys": None,
+    "employees": None,
+}
+
+
+def _version_trigger(table: str, event: str, column: str | None) -> str:
+    survey_id = f"{'OLD' if event == 'DELETE' else 'NEW'}.{column}" if column else "0"
+    return f"""CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+        INSERT INTO survey_versions (survey_id, version) VALUES ({survey_id}, 1)
+            ON CONFLICT(survey_id) DO UPDATE SET version = version + 1;
+    END"""
+
+
+def _migrate_v2(conn):
+    _execute_script(conn, SCHEMA_V2)
+    for table, column in VERSIONED_TABLES_V2.items():
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(_version_trigger(table, event, column))
+
+
+# ─── v3: タイムライン ─────────────────────────────
+
+# 従業員ごとの時系列（timeline.py）。アラート・対応記録・メールログは v1 の
+# (employee_id, 日時) インデックスをそのまま使う
+INDEXES_V3 = [
+    "CREATE INDEX IF NOT EXISTS idx_responses_employee_submitted ON responses(employee_id, submitted_at)",
+]
+
+
+def _migrate_v3(conn):
+    for sql in INDEXES_V3:
+        conn.execute(sql)
+
+
+# ─── v4: メール配信分析 ────────────────────────────
+
+# 配信レポート（email_report.py）の集計をインデックスだけで行う
+INDEXES_V4 = [
+    # 種類・状態ごとの件数と、従業員ごとの最初のリマインド日時（カバリングインデックス）
+    "CREATE INDEX IF NOT EXISTS idx_email_logs_survey_type ON email_logs(survey_id, email_type, status, employee_id, sent_at)",
+    # 従業員ごとの送信失敗回数（失敗は全体のごく一部なので部分インデックス）
+    "CREATE INDEX IF NOT EXISTS idx_email_logs_failed ON email_logs(employee_id, sent_at) WHERE status = 'failed'",
+]
+# 上の idx_email_logs_survey_type の先頭列と重複
+DROPPED_INDEXES_V4 = ["idx_email_logs_survey"]
+
+
+def _migrate_v4(conn):
+    for name in DROPPED_INDEXES_V4:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    for sql in INDEXES_V4:
+        conn.execute(sql)
+
+
+# ─── v5: 階層別集計 ─────────────────────────────
+
+# サーベイ × 部門 × 入社年 × 設問の件数・合計・二乗和（回答の登録時に加算、hierarchy.py で使う）
+SCHEMA_V5 = """
+    CREATE TABLE IF NOT EXISTS cohort_rollups (
+        survey_id INTEGER NOT NULL,
+        department TEXT NOT NULL,
+        join_year INTEGER NOT NULL,  -- 未登録は 0
+        dimension TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        total REAL NOT NULL,
+        total_sq REAL NOT NULL,
+        PRIMARY KEY (survey_id, department, join_year, dimension),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id)
+    ) WITHOUT ROWID;
+"""
+
+
+def _migrate_v5(conn):
+    existing = _table_names(conn)
+    _execute_script(conn, SCHEMA_V5)
+    if "cohort_rollups" not in existing:
+        schedule_backfill(conn, "cohort_rollups")
+
+
+# ─── v6: コメント数 ─────────────────────────────
+
+# サーベイ × 部門のコメント数（キーワード出現率の分母）。comment_terms と同じく回答時点の部門で加算する
+SCHEMA_V6 = """
+    CREATE TABLE IF NOT EXISTS comment_counts (
+        survey_id INTEGER NOT NULL,
+        department TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (survey_id, department),
+        FOREIGN KEY (survey_id) REFERENCES surveys(id)
+    ) WITHOUT ROWID;
+"""
+
+
+def _migrate_v6(conn):
+    existing = _table_names(conn)
+    _execute_script(conn, SCHEMA_V6)
+    if "comment_counts" not in existing:
+        schedule_backfill(conn, "comment_counts")
+
+
+# (バージョン, 説明, 適用関数) をバージョン順に並べる
+# 適用関数は1トランザクション内で呼ばれる（executescript は暗黙にコミットするので使わない）
+MIGRATIONS = [
+    (1, "基本スキーマ・アラート・集計・全文検索・インデックス整理", _migrate_v1),
+    (2, "サーベイごとの変更カウンタ（応答キャッシュ用）", _migrate_v2),
+    (3, "従業員タイムライン用インデックス", _migrate_v3),
+    (4, "メール配信分析用インデックス", _migrate_v4),
+    (5, "部門 × 入社年の集計（階層別集計用）", _migrate_v5),
+    (6, "サーベイ × 部門のコメント数（キーワード集計用）", _migrate_v6),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ─── バックフィル ───────────────────────────────
+
+def _index_closed_surveys(conn, rows):
+    for (survey_id,) in rows:
+        db._refresh_rollups(conn, survey_id)
+        db._refresh_score_drops(conn, survey_id)
+
+
+# 名前 → (最大idを求めるテーブル, 対象行を id 順に取得するSQL, 処理関数)
+# SQLのプレースホルダは (last_id, max_id, バッチサイズ) の順
+BACKFILLS = {
+    "alerts": (
+        "responses",
+        """SELECT id, survey_id, employee_id, work_satisfaction, relationships, health, submitted_at
+           FROM responses WHERE id > ? AND id <= ? ORDER BY id LIMIT ?""",
+        db._backfill_alerts,
+    ),
+    "comment_terms": (
+        "responses",
+        """SELECT r.id, r.survey_id, e.department, r.comment
+           FROM responses r
+           JOIN employees e ON r.employee_id = e.id
+           WHERE r.id > ? AND r.id <= ? AND r.comment <> ''
+           ORDER BY r.id LIMIT ?""",
+        lambda conn, rows: db._backfill_comment_terms(conn, [tuple(r)[1:] for r in rows]),
+    ),
+    # 未アーカイブの回答のみ（アーカイブ済みサーベイは get_comment_terms が回答から数える）
+    "comment_counts": (
+        "responses",
+        """SELECT r.id, r.survey_id, e.department
+           FROM responses r
+           JOIN employees e ON r.employee_id = e.id
+           WHERE r.id > ? AND r.id <= ? AND r.comment <> ''
+           ORDER BY r.id LIMIT ?""",
+        lambda conn, rows: db._backfill_comment_counts(conn, [tuple(r)[1:] for r in rows]),
+    ),
+    # 未アーカイブの回答のみ（アーカイブ済みサーベイは hierarchy.rebuild で作り直せる）
+    "cohort_rollups": (
+        "responses",
+        """SELECT r.id, r.survey_id, e.department, COALESCE(e.join_year, 0) as join_year,
+                  r.work_satisfaction, r.relationships, r.health
+           FROM responses r
+           JOIN employees e ON r.employee_id = e.id
+           WHERE r.id > ? AND r.id <= ?
+           ORDER BY r.id LIMIT ?""",
+        db._backfill_cohort_rollups,
+    ),
+    "closed_surveys": (
+        "surveys",
+        "SELECT id FROM surveys WHERE id > ? AND id <= ? AND status = 'closed' ORDER BY id LIMIT ?",
+        _index_closed_surveys,
+    ),
+}
+
+
+def schedule_backfill(conn, name: str):
+    """バックフィルを登録（対象は登録時点までの行。以降の行は書き込み時に反映される）"""
+    table = BACKFILLS[name][0]
+    max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+    if max_id == 0:
+        return
+    conn.execute(
+        "INSERT OR IGNORE INTO schema_backfills (name, max_id) VALUES (?, ?)", (name, max_id)
+    )
+
+
+def run_backfills(conn, batch_size: int = None) -> list[dict]:
+    """
+    未完了のバックフィルをバッチ単位で実行
+    各バッチは処理と進捗の更新を1トランザクションでコミットするため、
+    書き込みロックは短時間で解放され、中断しても重複なく再開できる
+    """
+    batch_size = batch_size or config.MIGRATION_BATCH_SIZE
+    results = []
+    pending = conn.execute(
+        "SELECT name, last_id, max_id FROM schema_backfills WHERE done = 0 ORDER BY rowid"
+    ).fetchall()
+    for name, last_id, max_id in pending:
+        _, select_sql, process = BACKFILLS[name]
+        start, processed, batches = time.perf_counter(), 0, 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(select_sql, (last_id, max_id, batch_size)).fetchall()
+            if rows:
+                process(conn, rows)
+                last_id = rows[-1][0]
+            done = len(rows) < batch_size
+            conn.execute(
+                "UPDATE schema_backfills SET last_id = ?, done = ? WHERE name = ?",
+                (max_id if done else last_id, int(done), name),
+            )
+            conn.commit()
+            processed += len(rows)
+            batches += 1
+            if done:
+                break
+        results.append({
+            "name": name, "rows": processed, "batches": batches,
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+    return results
+
+
+# ─── 実行 ──────────────────────────────────────
+
+def _execute_script(conn, script: str):
+    """複数のSQL文をトランザクションを維持したまま1文ずつ実行（トリガー内の ; も考慮）"""
+    statement = ""
+    for part in script.split(";"):
+        statement += part + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \n;"):
+                conn.execute(statement)
+            statement = ""
+
+
+def _table_names(conn) -> set:
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def get_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn) -> dict:
+    """
+    未適用の移行ステップを順に適用し、残っているバックフィルを実行
+    ステップごとに スキーマ変更 + バックフィル登録 + user_version 更新 を1トランザクションで行う
+    - 戻り値: {"from_version", "to_version", "applied": [...], "backfills": [...]}
+    """
+    from_version = get_version(conn)
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= get_version(conn):
+            continue
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(BACKFILL_TABLE)
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append({
+            "version": version, "description": description,
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+    backfills = run_backfills(conn) if _has_backfill_table(conn) else []
+    if applied or backfills:
+        conn.execute("ANALYZE")
+    return {
+        "from_version": from_version,
+        "to_version": get_version(conn),
+        "applied": applied,
+        "backfills": backfills,
+    }
+
+
+def _has_backfill_table(conn) -> bool:
+    return "schema_backfills" in _table_names(conn)
+
+
+def get_status() -> dict:
+    """現在のスキーマバージョンと未適用ステップ・バックフィルの進捗"""
+    with db.get_db() as conn:
+        version = get_version(conn)
+        backfills = []
+        if _has_backfill_table(conn):
+            backfills = [dict(r) for r in conn.execute(
+                "SELECT name, last_id, max_id, done, created_at FROM schema_backfills ORDER BY rowid"
+            ).fetchall()]
+    return {
+        "version": version,
+        "latest_version": LATEST_VERSION,
+        "pending": [
+            {"version": v, "description": d} for v, d, _ in MIGRATIONS if v > version
+        ],
+        "backfills": backfills,
+    }
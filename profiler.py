@@ -0,0 +1,114 @@
+"""
+サンプリングプロファイラ
+稼働中のワーカーで指定秒数だけ全スレッドのスタックを一定間隔で採り、
+フレームグラフ用の collapsed 形式（"a;b;c 件数" の行）で返す（/api/admin/profile・cli.py profile）
+
+- 別スレッドで sys._current_frames() を読むだけなので、採取中も処理は止めず、採取していないときの負荷はない
+- このリポジトリのモジュール（app / survey_manager / database ...）を含まないスタック
+  （接続待ちのサーバースレッドなど）は数えない
+- 同時に採取できるのは1つだけ
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import config
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+_lock = threading.Lock()
+
+
+# コードオブジェクト → (ラベル, このリポジトリのフレームか)。サンプルごとの文字列処理を避ける
+_labels = {}
+
+
+def _label(frame) -> tuple[str, bool]:
+    code = frame.f_code
+    entry = _labels.get(code)
+    if entry is None:
+        module = frame.f_globals.get("__name__") or "?"
+        if module == "__main__":
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        # collapsed 形式では ";" と空白が区切りになるので使わない
+        label = f"{module}:{getattr(code, 'co_qualname', code.co_name)}".replace(";", ":").replace(" ", "_")
+        entry = _labels[code] = (label, os.path.dirname(code.co_filename) == _PROJECT_DIR)
+    return entry
+
+
+def _stack(frame) -> str | None:
+    """フレーム → "根;...;葉"（このリポジトリのフレームを含まなければ None）"""
+    labels, ours = [], False
+    while frame is not None:
+        label, own = _label(frame)
+        labels.append(label)
+        ours = ours or own
+        frame = frame.f_back
+    if not ours:
+        return None
+    labels.reverse()
+    return ";".join(labels)
+
+
+def _sample(stop: threading.Event, interval: float, skip: set, result: dict):
+    stacks, threads = result["stacks"], set()
+    skip.add(threading.get_ident())
+    busy = 0.0
+    while not stop.wait(interval):
+        t = time.perf_counter()
+        for ident, frame in sys._current_frames().items():
+            if ident in skip:
+                continue
+            stack = _stack(frame)
+            if stack:
+                stacks[stack] += 1
+                threads.add(ident)
+        result["samples"] += 1
+        busy += time.perf_counter() - t
+    result["threads"] = len(threads)
+    result["overhead_ms"] = round(busy * 1000, 1)
+
+
+@contextmanager
+def sampling(interval_ms: int = None, include_current: bool = True):
+    """
+    ブロックの間スタックを採取する
+    - include_current: 呼び出し元のスレッドも数える（CLI でコマンドを実行するとき）
+    - 戻り値（ブロック終了後に埋まる）: {"interval_ms", "seconds", "samples", "threads", "overhead_ms", "stacks": Counter}
+    """
+    interval_ms = interval_ms or config.PROFILE_INTERVAL_MS
+    if interval_ms < 1:
+        raise ValueError("採取間隔は1ミリ秒以上を指定してください")
+    if not _lock.acquire(blocking=False):
+        raise ValueError("別のプロファイルを採取中です")
+    result = {"interval_ms": interval_ms, "seconds": 0.0, "samples": 0, "threads": 0,
+              "overhead_ms": 0.0, "stacks": Counter()}
+    stop = threading.Event()
+    skip = set() if include_current else {threading.get_ident()}
+    sampler = threading.Thread(target=_sample, args=(stop, interval_ms / 1000, skip, result),
+                               name="profiler", daemon=True)
+    start = time.perf_counter()
+    try:
+        sampler.start()
+        yield result
+    finally:
+        stop.set()
+        sampler.join()
+        result["seconds"] = round(time.perf_counter() - start, 2)
+        _lock.release()
+
+
+def profile(seconds: float, interval_ms: int = None) -> dict:
+    """このプロセスの他のスレッドを seconds 秒間採取する（管理API用）"""
+    if not 0 < seconds <= config.PROFILE_MAX_SECONDS:
+        raise ValueError(f"秒数は0より大きく{config.PROFILE_MAX_SECONDS}以下で指定してください")
+    with sampling(interval_ms, include_current=False) as result:
+        time.sleep(seconds)
+    return result
+
+
+def collapsed(result: dict) -> str:
+    """採取結果 → collapsed 形式（flamegraph.pl / speedscope / inferno でそのまま読める）"""
+    return "".join(f"{stack} {n}\n" for stack, n in result["stacks"].most_common())
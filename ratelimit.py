@@ -0,0 +1,207 @@
+"""
+回答者向けAPIの流量制限モジュール
+認証のない /api/survey/validate・submit を、スキャナーやクライアントの再送ループから守る
+
+- トークンごと・クライアントIPごとのトークンバケット（RATE_LIMIT_TOKEN → RATE_LIMIT_IP の順に判定）。超過は 429 + Retry-After
+- RATE_LIMIT_STORE を指定すると、バケットを小さなSQLiteファイルに置いて同じホストの全ワーカーで共有する
+  （ロック待ちが長い・書き込めないときはワーカーごとのメモリで判定する）
+- 処理中の件数と応答時間の移動平均で過負荷を判定し、DBに届く前に 503 + Retry-After で断る
+  validate（読み取り・再試行できる）を先に断り、submit は処理中の件数が上限に達するまで通す
+"""
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request
+
+import config
+
+MAX_KEYS = 100_000        # メモリ上に保持するバケット数の上限（古いものから捨てる）
+EWMA_ALPHA = 0.2          # 応答時間の移動平均の重み
+LATENCY_HALF_LIFE = 5.0   # リクエストがない間に移動平均を減衰させる半減期（秒）
+STORE_TTL = 3600          # 共有ストアで更新のないバケットを消すまでの秒数
+STORE_CLEANUP_EVERY = 1000
+
+STORE_SCHEMA = """CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    allowed INTEGER NOT NULL
+) WITHOUT ROWID"""
+
+# SET の式はすべて更新前の値で評価されるので、回復後の残量から取り出せたかを allowed に残す
+_REFILLED = "MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate)"
+_TAKE_SQL = f"""INSERT INTO buckets (key, tokens, updated, allowed) VALUES (:key, :capacity - 1, :now, 1)
+    ON CONFLICT(key) DO UPDATE SET
+        tokens = {_REFILLED} - ({_REFILLED} >= 1),
+        allowed = {_REFILLED} >= 1,
+        updated = :now
+    RETURNING tokens, allowed"""
+
+# {キー: (残り, 更新時刻)}
+_buckets = OrderedDict()
+_lock = threading.Lock()
+_stats = {"allowed": 0, "limited": 0, "shed": 0}
+_in_flight = 0
+_latency = [0.0, 0.0]  # [応答時間の移動平均(ms), 更新時刻]
+_local = threading.local()
+_store_calls = 0
+
+
+# ─── トークンバケット ─────────────────────────────
+
+def _take_memory(key: str, capacity: float, rate: float, now: float) -> float:
+    with _lock:
+        tokens, updated = _buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        _buckets[key] = (tokens, now)
+        while len(_buckets) > MAX_KEYS:
+            _buckets.popitem(last=False)
+    return 0.0 if allowed else (1 - tokens) / rate
+
+
+def _store():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        # 待たずにメモリへフォールバックできるよう、ロック待ちは短くする
+        conn = sqlite3.connect(config.RATE_LIMIT_STORE, timeout=0.05, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(STORE_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _take_store(key: str, capacity: float, rate: float, now: float) -> float:
+    global _store_calls
+    conn = _store()
+    tokens, allowed = conn.execute(
+        _TAKE_SQL, {"key": key, "capacity": capacity, "rate": rate, "now": now}
+    ).fetchone()
+    with _lock:
+        _store_calls += 1
+        cleanup = _store_calls % STORE_CLEANUP_EVERY == 0
+    if cleanup:
+        conn.execute("DELETE FROM buckets WHERE updated < ?", (now - STORE_TTL,))
+    return 0.0 if allowed else (1 - tokens) / rate
+
+
+def take(key: str, limit: tuple[float, float]) -> float:
+    """
+    バケットから1回分を取り出す
+    - limit: (バースト回数, 1秒あたりの回復数)
+    - 戻り値: 取り出せれば 0、取り出せなければ次に取り出せるまでの秒数
+    """
+    capacity, rate = limit
+    now = time.time()
+    if config.RATE_LIMIT_STORE:
+        try:
+            return _take_store(key, capacity, rate, now)
+        except sqlite3.Error:
+            pass
+    return _take_memory(key, capacity, rate, now)
+
+
+def client_ip() -> str:
+    if config.RATE_LIMIT_TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or "-"
+
+
+# ─── 過負荷の判定 ────────────────────────────────
+
+def _latency_ms(now: float) -> float:
+    ewma, updated = _latency
+    return ewma * 0.5 ** ((now - updated) / LATENCY_HALF_LIFE) if updated else 0.0
+
+
+def _record(elapsed_ms: float):
+    global _in_flight
+    now = time.monotonic()
+    with _lock:
+        _in_flight -= 1
+        current = _latency_ms(now)
+        _latency[:] = [current + EWMA_ALPHA * (elapsed_ms - current) if _latency[1] else elapsed_ms, now]
+
+
+def _overloaded(priority: str) -> bool:
+    limit = config.SHED_MAX_IN_FLIGHT
+    if priority == "submit":
+        return _in_flight >= limit
+    if _in_flight >= limit // 2:
+        return True
+    return config.SHED_LATENCY_MS > 0 and _latency_ms(time.monotonic()) > config.SHED_LATENCY_MS
+
+
+def _reject(status: int, message: str, retry_after: float):
+    _count("shed" if status == 503 else "limited")
+    response = jsonify({"error": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _count(name: str):
+    with _lock:
+        _stats[name] += 1
+
+
+def limited(priority: str = "validate"):
+    """
+    回答者向けAPIに流量制限と過負荷時の遮断をかけるデコレータ
+    - priority: "submit"（処理中の件数が上限に達するまで通す）/ "validate"（過負荷の兆候で先に断る）
+    トークンは URL の token 引数か JSON 本文の token から取る
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            global _in_flight
+            if not config.RATE_LIMIT_ENABLED:
+                return func(*args, **kwargs)
+            if _overloaded(priority):
+                return _reject(503, "ただいま混み合っています。しばらくしてから再度お試しください",
+                               config.SHED_RETRY_AFTER)
+            # 同じトークンの再送ループはトークンごとの制限で止め、NAT配下で共有するIPの枠を消費させない
+            token = kwargs.get("token") or (request.get_json(silent=True) or {}).get("token")
+            wait = take(f"token:{token}", config.RATE_LIMIT_TOKEN) if isinstance(token, str) else 0.0
+            if not wait:
+                wait = take(f"ip:{client_ip()}", config.RATE_LIMIT_IP)
+            if wait:
+                return _reject(429, "リクエストが多すぎます。しばらくしてから再度お試しください", wait)
+
+            with _lock:
+                _in_flight += 1
+                _stats["allowed"] += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record((time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
+
+
+def clear():
+    """メモリ上のバケットと統計を破棄（共有ストアはそのまま）"""
+    with _lock:
+        _buckets.clear()
+        _stats.update(allowed=0, limited=0, shed=0)
+        _latency[:] = [0.0, 0.0]
+
+
+def stats() -> dict:
+    """通過・制限・遮断の件数と、処理中の件数・応答時間の移動平均"""
+    with _lock:
+        return {
+            **_stats,
+            "in_flight": _in_flight,
+            "latency_ms": round(_latency_ms(time.monotonic()), 1),
+            "buckets": len(_buckets),
+            "store": config.RATE_LIMIT_STORE or None,
+        }
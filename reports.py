@@ -0,0 +1,256 @@
+"""
+部門別レポートの一括作成モジュール
+月末に配る部門ごとのレポート（HTML / CSV）と全社サマリーを1回の実行でまとめて書き出す
+
+- サーベイの回答・部門ごとの対象者数は最初に1回だけ読み込む（スナップショットがあればそちらから）
+- 部門ごとの集計と HTML / CSV の書き出しはプロセスプールに分けて並列に行う（部門数が増えてもコア数に応じて短縮）
+- 回答者が MIN_GROUP_SIZE 人未満の部門は、HTML にスコア・コメントを載せない（CSV は人事向けの回答一覧）
+  そうした部門が1つだけだと全社との差から逆算できるため、hierarchy と同じく次に人数の少ない部門の
+  スコア・面談希望数も伏せる（全社サマリー・summary.csv・部門の HTML のすべてで）
+
+出力先: REPORT_DIR/<年月>/index.html, summary.csv, <部門>.html, <部門>.csv
+"""
+import csv
+import html
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import config
+import database as db
+import hierarchy
+import snapshot
+
+# 回答1件を表すタプルの列（CSV の列順も同じ）
+FIELDS = ["name", "department", "join_year", *db.SCORE_KEYS, "extra_answer",
+          "comment", "interview_request", "submitted_at"]
+_DEPARTMENT = FIELDS.index("department")
+_SCORES = [FIELDS.index(k) for k in db.SCORE_KEYS]
+_EXTRA = FIELDS.index("extra_answer")
+_COMMENT = FIELDS.index("comment")
+_INTERVIEW = FIELDS.index("interview_request")
+TITLES = {q["key"]: q["title"] for q in config.SURVEY_QUESTIONS}
+
+_UNSAFE_NAME = re.compile(r'[\\/:*?"<>|\s]+')
+
+_STYLE = """body{font-family:sans-serif;margin:2em;color:#222}table{border-collapse:collapse;margin:1em 0}
+th,td{border:1px solid #ccc;padding:4px 10px;text-align:right}th:first-child,td:first-child{text-align:left}
+.note{color:#888}.up{color:#1a7f37}.down{color:#cf222e}li{margin:.3em 0}"""
+
+
+def file_stem(department: str) -> str:
+    """部門名 → ファイル名（記号・空白を _ に置き換え）"""
+    return _UNSAFE_NAME.sub("_", department).strip("_") or "department"
+
+
+# ─── 読み込み ──────────────────────────────────
+
+def load_survey_data(survey_id: int) -> dict:
+    """
+    レポートに必要なデータを1回で読み込む
+    - 戻り値: {"survey": {...}, "rows": {部門: [回答タプル, ...]}, "targets": {部門: 対象者数}}
+    """
+    survey = db.get_survey(survey_id)
+    if not survey:
+        raise ValueError(f"サーベイID {survey_id} が見つかりません")
+    snap = snapshot.open_snapshot(survey_id)
+    if snap:
+        source = (tuple(r[k] for k in FIELDS) for r in snapshot.iter_responses(snap))
+    else:
+        source = (tuple(getattr(r, k) for k in FIELDS) for r in db.iter_responses(survey_id))
+    rows = {}
+    for row in source:
+        rows.setdefault(row[_DEPARTMENT], []).append(row)
+
+    with db.get_read_db() as conn:
+        schema = db._survey_schema(conn, survey_id)
+        targets = dict(conn.execute(
+            f"""SELECT e.department, COUNT(*) FROM {schema}.survey_tokens t
+                JOIN employees e ON e.id = t.employee_id
+                WHERE t.survey_id = ? GROUP BY e.department""",
+            (survey_id,),
+        ).fetchall())
+    return {"survey": survey, "rows": rows, "targets": targets}
+
+
+# ─── 集計 ──────────────────────────────────────
+
+def summarize(rows: list[tuple], targets: int) -> dict:
+    """回答タプルの一覧 → 件数・回答率・設問ごとの平均 / 標準偏差 / 1〜5の分布"""
+    n = len(rows)
+    scores = {}
+    for key, i in zip(db.SCORE_KEYS, _SCORES):
+        values = [r[i] for r in rows]
+        mean = sum(values) / n if n else None
+        var = sum((v - mean) ** 2 for v in values) / (n - 1) if n > 1 else 0.0
+        histogram = [0] * 5
+        for v in values:
+            histogram[min(max(math.floor(v + 0.5), 1), 5) - 1] += 1
+        scores[key] = {
+            "avg": round(mean, 2) if mean is not None else None,
+            "sd": round(math.sqrt(var), 2),
+            "histogram": histogram,
+        }
+    extras = [r[_EXTRA] for r in rows if r[_EXTRA] is not None]
+    avgs = [s["avg"] for s in scores.values() if s["avg"] is not None]
+    return {
+        "n": n,
+        "targets": targets,
+        "response_rate": round(n / targets * 100, 1) if targets else 0,
+        "scores": scores,
+        "overall": round(sum(avgs) / len(avgs), 2) if avgs else None,
+        "extra_avg": round(sum(extras) / len(extras), 2) if extras else None,
+        "interview_requests": sum(1 for r in rows if r[_INTERVIEW] == "yes"),
+    }
+
+
+# ─── 書き出し ──────────────────────────────────
+
+def _page(title: str, body: str) -> str:
+    return (f'<!DOCTYPE html>\n<html lang="ja"><head><meta charset="utf-8"><title>{html.escape(title)}</title>'
+            f"<style>{_STYLE}</style></head>\n<body>\n<h1>{html.escape(title)}</h1>\n{body}\n</body></html>\n")
+
+
+def _diff(value, base) -> str:
+    if value is None or base is None:
+        return ""
+    d = round(value - base, 2)
+    cls = "up" if d > 0 else "down" if d < 0 else ""
+    return f'<span class="{cls}">{d:+.2f}</span>'
+
+
+def _score_table(summary: dict, company: dict = None) -> str:
+    """設問ごとの平均・標準偏差・分布の表（company を渡すと全社比の列を付ける）"""
+    head = "<tr><th>設問</th><th>平均</th>" + ("<th>全社比</th>" if company else "") + "<th>標準偏差</th>" + "".join(
+        f"<th>{b}</th>" for b in range(1, 6)) + "</tr>"
+    body = "".join(
+        f"<tr><td>{html.escape(TITLES[key])}</td><td>{s['avg']:.2f}</td>"
+        + (f"<td>{_diff(s['avg'], company['scores'][key]['avg'])}</td>" if company else "")
+        + f"<td>{s['sd']:.2f}</td>" + "".join(f"<td>{c}</td>" for c in s["histogram"]) + "</tr>"
+        for key, s in summary["scores"].items()
+    )
+    return f"<table>{head}{body}</table>"
+
+
+def _write_csv(path: str, rows: list[tuple]):
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
+
+
+def render_department(task: tuple) -> dict:
+    """
+    部門1件分の HTML / CSV を書き出す（プロセスプールのワーカーで実行）
+    task: (サーベイ, 部門, 回答タプル一覧, 対象者数, 全社の集計, 出力先ディレクトリ, 最小人数, スコアを伏せるか)
+    """
+    survey, department, rows, targets, company, out_dir, min_size, hidden = task
+    summary = summarize(rows, targets)
+    stem = file_stem(department)
+    parts = [f"<p>{html.escape(survey['title'])}（{survey['year_month']}）</p>",
+             f"<p>回答 {summary['n']} / {summary['targets']}名（回答率 {summary['response_rate']}%）</p>"]
+    if summary["n"] < min_size:
+        parts.append(f'<p class="note">回答者が{min_size}名未満のため、スコアとコメントは表示しません。</p>')
+    elif hidden:
+        parts.append('<p class="note">他の部門の結果から逆算できるため、スコアと面談希望数は表示しません。</p>')
+    if not hidden:
+        parts.append(f"<p>総合 {summary['overall']:.2f}（全社比 {_diff(summary['overall'], company['overall'])}）"
+                     f" 面談希望 {summary['interview_requests']}名</p>")
+        parts.append(_score_table(summary, company))
+        if summary["extra_avg"] is not None and survey.get("extra_question_title"):
+            parts.append(f"<p>{html.escape(survey['extra_question_title'])}: {summary['extra_avg']:.2f}</p>")
+    if summary["n"] >= min_size:
+        comments = [r[_COMMENT] for r in rows if r[_COMMENT]]
+        if comments:
+            parts.append("<h2>コメント</h2><ul>" + "".join(f"<li>{html.escape(c)}</li>" for c in comments) + "</ul>")
+    with open(os.path.join(out_dir, f"{stem}.html"), "w", encoding="utf-8") as f:
+        f.write(_page(f"{department} パルスサーベイ結果", "\n".join(parts)))
+    _write_csv(os.path.join(out_dir, f"{stem}.csv"), rows)
+    return {"department": department, "file": stem, "hidden": hidden, **summary}
+
+
+def _write_summary(out_dir: str, survey: dict, company: dict, departments: list[dict]):
+    rows = []
+    for d in departments:
+        hidden = d["hidden"]
+        cells = "".join(
+            f"<td>{'—' if hidden else format(d['scores'][k]['avg'], '.2f')}</td>" for k in db.SCORE_KEYS
+        )
+        overall = "—" if hidden else f"{d['overall']:.2f}"
+        rows.append(f'<tr><td><a href="{html.escape(d["file"])}.html">{html.escape(d["department"])}</a></td>'
+                    f"<td>{d['n']}</td><td>{d['response_rate']}%</td><td>{overall}</td>{cells}</tr>")
+    head = "<tr><th>部門</th><th>回答</th><th>回答率</th><th>総合</th>" + "".join(
+        f"<th>{html.escape(TITLES[k])}</th>" for k in db.SCORE_KEYS) + "</tr>"
+    body = (f"<p>回答 {company['n']} / {company['targets']}名（回答率 {company['response_rate']}%）"
+            f" 総合 {company['overall'] if company['overall'] is not None else '—'}</p>"
+            + (_score_table(company) if company["n"] else "")
+            + f"<h2>部門別</h2><table>{head}{''.join(rows)}</table>")
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(_page(f"{survey['title']} 全社サマリー", body))
+
+    with open(os.path.join(out_dir, "summary.csv"), "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["department", "responses", "targets", "response_rate", "overall",
+                         *db.SCORE_KEYS, "interview_requests"])
+        for d in [{"department": "全社", "hidden": False, **company}] + departments:
+            hidden = d["hidden"]
+            writer.writerow([d["department"], d["n"], d["targets"], d["response_rate"],
+                             None if hidden else d["overall"],
+                             *(None if hidden else d["scores"][k]["avg"] for k in db.SCORE_KEYS),
+                             None if hidden else d["interview_requests"]])
+
+
+def generate_reports(survey_id: int, out_dir: str = None, workers: int = None, on_progress=None) -> dict:
+    """
+    全部門のレポートと全社サマリーを書き出す
+    - out_dir: 出力先（省略時は REPORT_DIR/<年月>）
+    - workers: 並列プロセス数（省略時はCPU数、1 ならプールを使わず順に処理）
+    - on_progress: 部門ごとに on_progress(完了数, 部門数, 部門名) を呼ぶ
+    - 戻り値: {"survey_id", "out_dir", "departments", "responses", "workers", "load_seconds", "seconds"}
+    """
+    start = time.perf_counter()
+    data = load_survey_data(survey_id)
+    survey = data["survey"]
+    loaded = time.perf_counter()
+
+    out_dir = out_dir or os.path.join(config.REPORT_DIR, survey["year_month"])
+    os.makedirs(out_dir, exist_ok=True)
+    min_size = config.MIN_GROUP_SIZE
+    all_rows = [r for rows in data["rows"].values() for r in rows]
+    company = summarize(all_rows, sum(data["targets"].values()))
+    departments = sorted(set(data["targets"]) | set(data["rows"]))
+    # 回答のない部門は伏せるスコアがないので、回答のある部門の中で補完的に伏せる
+    hidden = hierarchy.suppressed_keys({d: len(rows) for d, rows in data["rows"].items()}, min_size)
+    tasks = [
+        (survey, d, data["rows"].get(d, []), data["targets"].get(d, 0), company, out_dir, min_size,
+         d not in data["rows"] or d in hidden)
+        for d in departments
+    ]
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    results = []
+    if workers == 1:
+        for task in tasks:
+            results.append(render_department(task))
+            if on_progress:
+                on_progress(len(results), len(tasks), task[1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in as_completed([pool.submit(render_department, task) for task in tasks]):
+                results.append(future.result())
+                if on_progress:
+                    on_progress(len(results), len(tasks), results[-1]["department"])
+    results.sort(key=lambda r: r["department"])
+    _write_summary(out_dir, survey, company, results)
+
+    return {
+        "survey_id": survey_id,
+        "out_dir": out_dir,
+        "departments": len(results),
+        "responses": company["n"],
+        "workers": workers,
+        "load_seconds": round(loaded - start, 3),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
@@ -0,0 +1,124 @@
+"""
+管理画面APIの応答キャッシュモジュール
+サーベイごとの変更カウンタ（survey_versions、トリガーで更新）から ETag を作り、
+- If-None-Match が一致すれば集計せずに 304 を返す
+- 一致しなくてもカウンタが変わっていなければ、シリアライズ済みのJSONをそのまま返す
+ダッシュボードを開いたままのポーリングは、変更がなければカウンタを1行読むだけで済む
+
+キャッシュは DBファイル（テナント）× URL ごとに、RESPONSE_CACHE_MAX_BYTES までLRUで保持する
+"""
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+import config
+import database as db
+import tenants
+
+# {(DBパス, URL): (変更カウンタ, ETag, JSON本文)}
+_cache = OrderedDict()
+_cache_bytes = 0
+_lock = threading.Lock()
+_stats = {"hits": 0, "not_modified": 0, "misses": 0}
+
+
+def _etag(version: tuple[int, int], survey_id: int | None) -> str:
+    # ヘッダーでテナントを切り替える場合は同じURLになるので、テナントIDも含める
+    tenant_id = tenants.current_tenant() or "-"
+    return f"{tenant_id}.{survey_id or 0}.{version[0]}.{version[1]}"
+
+
+def _get(key, version):
+    global _cache_bytes
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] != version:
+            del _cache[key]
+            _cache_bytes -= len(entry[2])
+            return None
+        _cache.move_to_end(key)
+        return entry
+
+
+def _put(key, version, etag: str, body: bytes):
+    global _cache_bytes
+    limit = config.RESPONSE_CACHE_MAX_BYTES
+    # 上限の1/4を超える本文は入れない（他の応答をまとめて追い出さないように）
+    if len(body) > limit // 4:
+        return
+    with _lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= len(old[2])
+        _cache[key] = (version, etag, body)
+        _cache_bytes += len(body)
+        while _cache_bytes > limit:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted[2])
+
+
+def _count(name: str):
+    with _lock:
+        _stats[name] += 1
+
+
+def _respond(etag: str, body: bytes = None) -> Response:
+    response = Response(body, mimetype="application/json") if body is not None else Response(status=304)
+    response.set_etag(etag)
+    # 共有キャッシュには置かせず、ブラウザには毎回 ETag で確認させる
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def cached(survey_arg: str = None):
+    """
+    GET の JSON 応答を変更カウンタで検証・キャッシュするデコレータ（require_admin_auth の内側に付ける）
+    - survey_arg: URL のサーベイID引数名（省略時は全体のカウンタのみで判定）
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            survey_id = kwargs.get(survey_arg) if survey_arg else None
+            # 集計の前にカウンタを読む（集計中の書き込みは次回のカウンタ不一致で拾う）
+            version = db.get_data_version(survey_id)
+            etag = _etag(version, survey_id)
+            if request.if_none_match.contains(etag):
+                _count("not_modified")
+                return _respond(etag)
+
+            key = (db.current_db_path(), request.full_path)
+            if config.RESPONSE_CACHE_MAX_BYTES > 0:
+                entry = _get(key, version)
+                if entry is not None:
+                    _count("hits")
+                    return _respond(entry[1], entry[2])
+
+            _count("misses")
+            response = make_response(func(*args, **kwargs))
+            if response.status_code != 200 or not response.is_json:
+                return response
+            body = response.get_data()
+            if config.RESPONSE_CACHE_MAX_BYTES > 0:
+                _put(key, version, etag, body)
+            return _respond(etag, body)
+        return wrapper
+    return decorator
+
+
+def clear(db_path: str = None):
+    """キャッシュを破棄（db_path 省略時は全て）"""
+    global _cache_bytes
+    with _lock:
+        for key in [k for k in _cache if db_path is None or k[0] == db_path]:
+            _cache_bytes -= len(_cache.pop(key)[2])
+
+
+def stats() -> dict:
+    """キャッシュの件数・バイト数・ヒット数"""
+    with _lock:
+        return {"entries": len(_cache), "bytes": _cache_bytes, **_stats}
@@ -0,0 +1,189 @@
+"""
+締切済みサーベイのスナップショット管理モジュール
+締切後は変更されない回答データを列指向の固定長配列ファイルに書き出し、
+分析・出力処理は survey.db ではなくメモリマップしたファイルから読む
+
+ファイル形式:
+  MAGIC(8) | ヘッダ長(uint32) | ヘッダJSON | 列データ（各列8バイト境界）
+  - 数値列: float64 / int32 のリトルエンディアン配列
+  - カテゴリ列: int32 のコード配列 + ヘッダ内の辞書
+  - 文字列列: uint32 のオフセット配列（行数+1）+ UTF-8 バイト列
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import config
+import database as db
+
+MAGIC = b"PSNAP01\0"
+_HEADER_LEN = struct.Struct("<I")
+
+SCORE_COLUMNS = db.SCORE_KEYS + ["extra_answer"]
+CATEGORY_COLUMNS = ["department", "join_year", "interview_request"]
+TEXT_COLUMNS = ["name", "comment", "submitted_at"]
+
+# 開いたスナップショット {path: (mtime, 内容)}
+_open_snapshots = {}
+
+
+def _snapshot_dir() -> str:
+    return db.data_path("snapshots", config.SNAPSHOT_DIR)
+
+
+def snapshot_path(survey_id: int) -> str:
+    return os.path.join(_snapshot_dir(), f"survey_{survey_id}.snap")
+
+
+def has_snapshot(survey_id: int) -> bool:
+    return os.path.exists(snapshot_path(survey_id))
+
+
+def _to_bytes(arr: array) -> bytes:
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _pad(buf: bytearray):
+    buf.extend(b"\0" * (-len(buf) % 8))
+
+
+def write_snapshot(survey_id: int) -> dict:
+    """
+    締切済みサーベイの回答をスナップショットファイルに書き出す
+    - 戻り値: {"path", "rows", "bytes"}
+    """
+    survey = db.get_survey(survey_id)
+    if not survey:
+        raise ValueError(f"サーベイID {survey_id} が見つかりません")
+    if survey["status"] != "closed":
+        raise ValueError("スナップショットは締切済みのサーベイのみ作成できます")
+
+    rows = db.get_responses(survey_id)
+    columns, body = {}, bytearray()
+
+    def add(name: str, data: bytes, **meta):
+        columns[name] = {"offset": len(body), "size": len(data), **meta}
+        body.extend(data)
+        _pad(body)
+
+    add("employee_id", _to_bytes(array("i", (r["employee_id"] for r in rows))), type="i4")
+    for name in SCORE_COLUMNS:
+        values = (math.nan if r[name] is None else r[name] for r in rows)
+        add(name, _to_bytes(array("d", values)), type="f8")
+    for name in CATEGORY_COLUMNS:
+        labels, index, codes = [], {}, array("i")
+        for r in rows:
+            if r[name] not in index:
+                index[r[name]] = len(labels)
+                labels.append(r[name])
+            codes.append(index[r[name]])
+        add(name, _to_bytes(codes), type="category", labels=labels)
+    for name in TEXT_COLUMNS:
+        encoded = [(r[name] or "").encode("utf-8") for r in rows]
+        offsets = array("I", [0])
+        for e in encoded:
+            offsets.append(offsets[-1] + len(e))
+        add(f"{name}.offsets", _to_bytes(offsets), type="u4")
+        add(name, b"".join(encoded), type="text")
+
+    header = json.dumps({
+        "survey_id": survey_id,
+        "year_month": survey["year_month"],
+        "rows": len(rows),
+        "columns": columns,
+    }, ensure_ascii=False).encode("utf-8")
+    prefix = bytearray(MAGIC + _HEADER_LEN.pack(len(header)) + header)
+    _pad(prefix)
+
+    os.makedirs(_snapshot_dir(), exist_ok=True)
+    path = snapshot_path(survey_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(prefix)
+        f.write(body)
+    os.replace(tmp_path, path)
+    _open_snapshots.pop(path, None)
+    return {"path": path, "rows": len(rows), "bytes": len(prefix) + len(body)}
+
+
+def remove_snapshot(survey_id: int):
+    """スナップショットを削除（締切後にデータを修正した場合など）"""
+    path = snapshot_path(survey_id)
+    _open_snapshots.pop(path, None)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def open_snapshot(survey_id: int) -> dict | None:
+    """
+    スナップショットをメモリマップで開く（存在しなければNone）
+    - 戻り値: {"header": ..., "buffer": 列データ先頭からの memoryview}
+    """
+    path = snapshot_path(survey_id)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _open_snapshots.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"スナップショットの形式が不正です: {path}")
+    (header_len,) = _HEADER_LEN.unpack_from(mm, len(MAGIC))
+    start = len(MAGIC) + _HEADER_LEN.size
+    header = json.loads(mm[start:start + header_len].decode("utf-8"))
+    data_start = start + header_len + (-(start + header_len) % 8)
+
+    snap = {"header": header, "buffer": memoryview(mm)[data_start:]}
+    _open_snapshots[path] = (mtime, snap)
+    return snap
+
+
+def column(snap: dict, name: str, numpy: bool = False):
+    """
+    列をコピーせずに取り出す
+    数値・カテゴリ列は memoryview（numpy=True なら ndarray）、文字列列は str のリスト
+    """
+    meta = snap["header"]["columns"][name]
+    raw = snap["buffer"][meta["offset"]:meta["offset"] + meta["size"]]
+    if meta["type"] == "text":
+        offsets = column(snap, f"{name}.offsets")
+        data = bytes(raw)
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+    fmt = {"f8": ("d", "<f8"), "i4": ("i", "<i4"), "u4": ("I", "<u4"), "category": ("i", "<i4")}[meta["type"]]
+    if numpy:
+        import numpy as np
+        return np.frombuffer(raw, dtype=fmt[1])
+    if sys.byteorder != "little":
+        swapped = array(fmt[0], raw.tobytes())
+        swapped.byteswap()
+        return swapped
+    return raw.cast(fmt[0])
+
+
+def labels(snap: dict, name: str) -> list:
+    return snap["header"]["columns"][name]["labels"]
+
+
+def iter_responses(snap: dict):
+    """スナップショットの回答を1行ずつ dict で返す（get_responses と同じ並び順）"""
+    numeric = {name: column(snap, name) for name in ["employee_id"] + SCORE_COLUMNS}
+    categories = {name: (column(snap, name), labels(snap, name)) for name in CATEGORY_COLUMNS}
+    texts = {name: column(snap, name) for name in TEXT_COLUMNS}
+    for i in range(snap["header"]["rows"]):
+        row = {name: values[i] for name, values in numeric.items()}
+        if math.isnan(row["extra_answer"]):
+            row["extra_answer"] = None
+        row.update({name: labels_[codes[i]] for name, (codes, labels_) in categories.items()})
+        row.update({name: values[i] for name, values in texts.items()})
+        yield row
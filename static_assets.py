@@ -0,0 +1,241 @@
+"""
+フロントエンド配信モジュール
+React のビルドディレクトリを起動時に1回だけ走査して索引を作り、リクエストごとの
+ファイルシステム参照なしで返す
+
+- gzip / brotli の圧縮版（<ファイル>.gz / .br）を事前に作り、Accept-Encoding で選んで返す
+  （brotli は brotli パッケージがある場合のみ）
+- ファイル名にハッシュを含むバンドル（static/js/main.<hash>.js 等）は1年間の immutable キャッシュ
+- index.html は no-cache + ETag で毎回確認させ、変わっていなければ 304 を返す
+- STATIC_MEMORY_MAX_BYTES 以下のファイルはメモリに保持して返す
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, abort, request, send_file
+
+import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+INDEX_FILE = "index.html"
+# CRA のビルドが付ける8桁以上の16進ハッシュ（main.0ffb2968.js / 453.20359781.chunk.js）
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+DEFAULT_MAX_AGE = 3600
+
+# 圧縮版の拡張子（優先順）と Content-Encoding
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+COMPRESSIBLE_TYPES = (
+    "text/", "application/javascript", "application/json", "application/manifest+json",
+    "image/svg+xml", "image/x-icon", "image/vnd.microsoft.icon",
+)
+# 圧縮しても元の 90% 以上になるファイルは圧縮版を作らない
+MIN_COMPRESSION_RATIO = 0.9
+MIN_COMPRESS_BYTES = 256
+
+# 索引 {相対パス: アセット情報}（load() で差し替える）
+_index = {}
+_index_lock = threading.Lock()
+
+
+def _mimetype(name: str) -> str:
+    if name.endswith(".map"):
+        return "application/json"
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def _compressible(name: str) -> bool:
+    return _mimetype(name).startswith(COMPRESSIBLE_TYPES)
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _available_encodings() -> list[tuple[str, str]]:
+    return [(enc, ext) for enc, ext in ENCODINGS if enc != "br" or brotli is not None]
+
+
+def _source_files(build_dir: str):
+    """ビルドディレクトリ内の元ファイル（圧縮版を除く）を相対パスで返す"""
+    suffixes = tuple(ext for _, ext in ENCODINGS)
+    for root, _, files in os.walk(build_dir):
+        for name in files:
+            if name.endswith(suffixes):
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, build_dir).replace(os.sep, "/"), path
+
+
+# ─── 事前圧縮 ──────────────────────────────────
+
+def precompress(build_dir: str) -> dict:
+    """
+    圧縮できるファイルの gzip / brotli 版を書き出す（元ファイルより古いものは作り直す）
+    - 戻り値: {"written": 書き出した数, "skipped": 効果が小さく作らなかった数, "encodings": [...]}
+    """
+    written = skipped = 0
+    encodings = _available_encodings()
+    for name, path in _source_files(build_dir):
+        if not _compressible(name) or os.path.getsize(path) < MIN_COMPRESS_BYTES:
+            continue
+        mtime = os.path.getmtime(path)
+        data = None
+        for encoding, ext in encodings:
+            target = path + ext
+            if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                continue
+            if data is None:
+                with open(path, "rb") as f:
+                    data = f.read()
+            compressed = _compress(data, encoding)
+            if len(compressed) > len(data) * MIN_COMPRESSION_RATIO:
+                skipped += 1
+                continue
+            # gunicorn の各ワーカーが起動時に同時に書くことがあるので、一時ファイル名はプロセスごとに分ける
+            tmp = f"{target}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(compressed)
+            os.replace(tmp, target)
+            written += 1
+    return {"written": written, "skipped": skipped, "encodings": [enc for enc, _ in encodings]}
+
+
+# ─── 索引 ──────────────────────────────────────
+
+def _build_asset(name: str, path: str, memory_max: int) -> dict:
+    with open(path, "rb") as f:
+        data = f.read()
+    stat = os.stat(path)
+    asset = {
+        "path": path,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "mimetype": _mimetype(name),
+        "etag": hashlib.blake2b(data, digest_size=8).hexdigest(),
+        "immutable": bool(_HASHED_NAME.search(os.path.basename(name))),
+        "body": data if len(data) <= memory_max else None,
+        # {Content-Encoding: {"path": 圧縮版のパス | None, "size", "body": bytes | None}}
+        "variants": {},
+    }
+    for encoding, ext in _available_encodings():
+        variant = path + ext
+        if os.path.exists(variant) and os.path.getmtime(variant) >= stat.st_mtime:
+            size = os.path.getsize(variant)
+            body = None
+            if size <= memory_max:
+                with open(variant, "rb") as f:
+                    body = f.read()
+            asset["variants"][encoding] = {"path": variant, "size": size, "body": body}
+        elif asset["body"] is not None and _compressible(name) and len(data) >= MIN_COMPRESS_BYTES:
+            # 書き出せなかった（読み取り専用など）小さなファイルはメモリ上で圧縮しておく
+            compressed = _compress(data, encoding)
+            if len(compressed) <= len(data) * MIN_COMPRESSION_RATIO:
+                asset["variants"][encoding] = {"path": None, "size": len(compressed), "body": compressed}
+    return asset
+
+
+def load(build_dir: str, compress: bool = None) -> dict:
+    """
+    ビルドディレクトリを走査して索引を作り直す（起動時・デプロイ後に呼ぶ）
+    - compress: 先に precompress を実行する（省略時は config.STATIC_PRECOMPRESS）
+    - 戻り値: stats() と同じ
+    """
+    compress = config.STATIC_PRECOMPRESS if compress is None else compress
+    index = {}
+    if os.path.isdir(build_dir):
+        if compress:
+            try:
+                precompress(build_dir)
+            except OSError as e:
+                print(f"[配信] 圧縮版を書き出せません（メモリ上で圧縮します）: {e}")
+        for name, path in _source_files(build_dir):
+            index[name] = _build_asset(name, path, config.STATIC_MEMORY_MAX_BYTES)
+    global _index
+    with _index_lock:
+        _index = index
+    return stats()
+
+
+def stats() -> dict:
+    """索引の概要（ファイル数・圧縮版の数・メモリに保持しているバイト数）"""
+    index = _index
+    return {
+        "files": len(index),
+        "immutable": sum(1 for a in index.values() if a["immutable"]),
+        "variants": {
+            enc: sum(1 for a in index.values() if enc in a["variants"]) for enc, _ in ENCODINGS
+        },
+        "memory_bytes": sum(
+            len(a["body"] or b"") + sum(len(v["body"] or b"") for v in a["variants"].values())
+            for a in index.values()
+        ),
+    }
+
+
+# ─── 配信 ──────────────────────────────────────
+
+def _negotiate(asset: dict) -> str | None:
+    """Accept-Encoding から返す圧縮形式を選ぶ（q=0 は除外、なければ None）"""
+    accepted = request.accept_encodings
+    best, best_q = None, 0
+    for encoding, _ in ENCODINGS:
+        if encoding in asset["variants"]:
+            q = accepted[encoding]
+            if q > best_q:
+                best, best_q = encoding, q
+    return best
+
+
+def _respond(asset: dict) -> Response:
+    encoding = _negotiate(asset)
+    variant = asset["variants"][encoding] if encoding else asset
+    # 圧縮形式ごとに中身が違うので ETag も分ける
+    etag = f"{asset['etag']}-{encoding}" if encoding else asset["etag"]
+
+    if variant["body"] is not None:
+        response = Response(variant["body"], mimetype=asset["mimetype"])
+        response.set_etag(etag)
+        response.last_modified = asset["mtime"]
+    else:
+        response = send_file(
+            variant["path"], mimetype=asset["mimetype"], etag=etag,
+            last_modified=asset["mtime"], conditional=False, max_age=None,
+        )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if asset["variants"]:
+        response.vary.add("Accept-Encoding")
+
+    cache = response.cache_control
+    cache.no_cache = None
+    if asset["immutable"]:
+        cache.public, cache.max_age, cache.immutable = True, IMMUTABLE_MAX_AGE, True
+    elif asset["path"].endswith(INDEX_FILE):
+        cache.no_cache = True
+    else:
+        cache.public, cache.max_age = True, DEFAULT_MAX_AGE
+    return response.make_conditional(request)
+
+
+def serve(path: str, fallback: bool = True) -> Response:
+    """
+    ビルド内のファイルを返す
+    - fallback: 見つからなければ index.html を返す（SPA のクライアント側ルーティング用）
+    """
+    asset = _index.get(path)
+    if asset is None and fallback:
+        asset = _index.get(INDEX_FILE)
+    if asset is None:
+        abort(404)
+    return _respond(asset)
@@ -5,10 +5,22 @@
 import hashlib
 import hmac
 import secrets
+from collections import namedtuple
 from datetime import datetime, timedelta
 
 import config
 import database as db
+import snapshot
+import tenants
+
+# 回答時にアラートが発生した際に呼ばれるフック（例: アラートメール送信）
+_alert_hooks = []
+
+
+def register_alert_hook(func):
+    """アラート発生時のフックを登録（func(alert: dict)）"""
+    _alert_hooks.append(func)
+    return func
 
 
 def generate_token(employee_id: int, survey_id: int) -> str:
@@ -22,7 +34,7 @@ def generate_token(employee_id: int, survey_id: int) -> str:
     signature = hmac.new(
         config.SECRET_KEY.encode(), payload.encode(), hashlib.sha256
     ).hexdigest()[:12]
-    return f"{random_part}{signature}"
+    return tenants.tag_token(f"{random_part}{signature}")
 
 
 def build_survey_url(token: str) -> str:
@@ -30,35 +42,38 @@ def build_survey_url(token: str) -> str:
     return f"{config.BASE_URL}/survey/{token}"
 
 
+class IssuedToken(namedtuple("IssuedToken", "employee_id name email department token")):
+    """配信準備で発行したトークン（URLは参照時に組み立てる）"""
+    __slots__ = ()
+
+    @property
+    def url(self) -> str:
+        return build_survey_url(self.token)
+
+
 def prepare_survey(survey_id: int) -> dict:
     """
     サーベイの配信準備
-    - 全有効従業員に対してトークンを生成
-    - 戻り値: {"total": 生成数, "tokens": [...]}
+    - 全有効従業員に対してトークンを生成（従業員は1人ずつ読み、保存は1トランザクションにまとめる）
+    - 戻り値: {"total": 生成数, "tokens": [IssuedToken, ...]}
     """
     survey = db.get_survey(survey_id)
     if not survey:
         raise ValueError(f"サーベイID {survey_id} が見つかりません")
 
-    employees = db.get_active_employees()
     expires_at = (
         datetime.strptime(survey["deadline"], "%Y-%m-%d") + timedelta(days=1)
     ).strftime("%Y-%m-%d %H:%M:%S")
 
     tokens = []
-    for emp in employees:
-        token = generate_token(emp["id"], survey_id)
-        token_id = db.save_token(survey_id, emp["id"], token, expires_at)
-        tokens.append({
-            "token_id": token_id,
-            "employee_id": emp["id"],
-            "name": emp["name"],
-            "email": emp["email"],
-            "department": emp["department"],
-            "token": token,
-            "url": build_survey_url(token),
-        })
 
+    def issue():
+        for emp in db.iter_active_employees():
+            token = generate_token(emp.id, survey_id)
+            tokens.append(IssuedToken(emp.id, emp.name, emp.email, emp.department, token))
+            yield emp.id, token
+
+    db.save_tokens(survey_id, issue(), expires_at)
     db.activate_survey(survey_id)
     print(f"[配信準備] {len(tokens)}名分のトークンを生成しました")
     return {"total": len(tokens), "tokens": tokens}
@@ -117,6 +132,11 @@ def submit_response(token: str, work: float, relationships: float,
         interview_request=interview_request,
     )
 
+    if _alert_hooks:
+        alert = db.get_alert_by_response(response_id)
+        if alert:
+            _run_alert_hooks(alert)
+
     return {
         "response_id": response_id,
         "employee_name": info["emp_name"],
@@ -124,15 +144,121 @@ def submit_response(token: str, work: float, relationships: float,
     }
 
 
+def _run_alert_hooks(alert: dict):
+    """フックの失敗で回答送信自体を失敗させない"""
+    for hook in _alert_hooks:
+        try:
+            hook(alert)
+        except Exception as e:
+            print(f"[アラート] フック実行に失敗しました: {e}")
+
+
+def handle_alert(alert_id: int, author: str, note: str,
+                 action_type: str = "memo", status: str = "handled") -> dict:
+    """
+    アラートへの対応を記録
+    対応記録を追加 → アラートに紐付けて状態を更新
+    """
+    if status not in ("acknowledged", "handled"):
+        raise ValueError("対応状況は acknowledged / handled のいずれかを指定してください")
+    alert = db.get_alert(alert_id)
+    if not alert:
+        raise ValueError(f"アラートID {alert_id} が見つかりません")
+
+    note_id = db.add_follow_up_note(
+        employee_id=alert["employee_id"],
+        author=author,
+        note=note,
+        survey_id=alert["survey_id"],
+        action_type=action_type,
+    )
+    db.update_alert_status(alert_id, status, follow_up_note_id=note_id)
+    return {"alert_id": alert_id, "status": status, "follow_up_note_id": note_id}
+
+
+def close_survey(survey_id: int, freeze: bool = None) -> dict:
+    """
+    サーベイを締め切る
+    freeze=True（省略時は config.SNAPSHOT_ON_CLOSE）で回答のスナップショットも作成
+    """
+    if not db.get_survey(survey_id):
+        raise ValueError(f"サーベイID {survey_id} が見つかりません")
+    db.close_survey(survey_id)
+    result = {"survey_id": survey_id, "snapshot": None}
+    if config.SNAPSHOT_ON_CLOSE if freeze is None else freeze:
+        result["snapshot"] = snapshot.write_snapshot(survey_id)
+    return result
+
+
 def get_survey_progress(survey_id: int) -> dict:
-    """サーベイの進捗状況を取得"""
-    stats = db.get_survey_stats(survey_id)
-    unreplied = db.get_unreplied_tokens(survey_id)
+    """サーベイの進捗状況を取得（集計と未回答者一覧を同じスナップショットから読む）"""
+    with db.get_read_db():
+        stats = db.get_survey_stats(survey_id)
+        unreplied = db.get_unreplied_tokens(survey_id)
 
     return {
         **stats,
         "unreplied": [
-            {"name": u["name"], "email": u["email"], "department": u["department"]}
+            {"name": u.name, "email": u.email, "department": u.department}
             for u in unreplied
         ],
     }
+
+
+# ─── ベンチマーク ─────────────────────────────────
+
+def _dict_prepare(survey_id: int, expires_at: str) -> list[dict]:
+    """比較用: 従業員を dict のリストで読み、トークンごとにURL入りの dict を作る従来の実装"""
+    tokens = []
+    for emp in [emp._asdict() for emp in db.get_active_employees()]:
+        token = generate_token(emp["id"], survey_id)
+        tokens.append({
+            "employee_id": emp["id"],
+            "name": emp["name"],
+            "email": emp["email"],
+            "department": emp["department"],
+            "token": token,
+            "url": build_survey_url(token),
+        })
+    db.save_tokens(survey_id, [(t["employee_id"], t["token"]) for t in tokens], expires_at)
+    return tokens
+
+
+def benchmark(n: int = 100_000):
+    """合成データで配信準備のピークメモリを比較（dict のリスト / 軽量レコードの逐次処理）"""
+    import os
+    import tempfile
+    import time
+    import tracemalloc
+
+    original_path = db.DATABASE_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_PATH = os.path.join(tmp, "bench.db")
+        try:
+            db.init_db()
+            db.import_employees_bulk(
+                {"name": f"社員{i}", "email": f"user{i}@example.com", "department": f"{i % 40:02d} 部門"}
+                for i in range(n)
+            )
+            surveys = [db.create_survey(f"2026-0{m}", "bench", f"2026-0{m}-01", f"2026-0{m}-14") for m in (1, 2)]
+            print(f"[ベンチマーク] 従業員 {n:,}名の配信準備")
+
+            for label, func in [
+                ("dict", lambda: _dict_prepare(surveys[0], "2026-01-15 00:00:00")),
+                ("レコード", lambda: prepare_survey(surveys[1])),
+            ]:
+                tracemalloc.start()
+                start = time.perf_counter()
+                result = func()
+                seconds = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                del result
+                print(f"  {label:<6} ピーク {peak / 1024 / 1024:7.1f} MB  {seconds:.2f}s")
+        finally:
+            db.DATABASE_PATH = original_path
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,174 @@
+"""
+マルチテナント管理モジュール
+1つのアプリで複数企業のサーベイを扱う。テナントごとに TENANTS_DIR/<テナントID>/ 配下の
+survey.db・アーカイブ・スナップショット・バックアップを使い、リクエスト単位で切り替える
+
+テナントの判定（先に見つかったものを使う）:
+  1. パスの接頭辞    /t/<テナントID>/api/...（PathPrefixMiddleware が取り除く）
+  2. X-Tenant-ID ヘッダー
+  3. ホスト名         <テナントID>.<TENANT_DOMAIN>
+  4. トークンの接頭辞 <テナントID>.<トークン>（テナント使用中に生成したトークンに付く）
+"""
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import config
+import database as db
+
+_TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9-]{0,62}$")
+PATH_PREFIX = "/t/"
+ENVIRON_KEY = "survey.tenant"
+TOKEN_SEPARATOR = "."
+
+# スキーマを確認済みのテナント（プロセス内で1回だけ init_db する）
+_ready = set()
+_ready_lock = threading.Lock()
+
+# テナントごとのリクエスト指標
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def is_valid_id(tenant_id: str) -> bool:
+    return bool(tenant_id) and bool(_TENANT_ID.match(tenant_id))
+
+
+def tenant_dir(tenant_id: str) -> str:
+    if not is_valid_id(tenant_id):
+        raise ValueError(f"テナントIDが不正です: {tenant_id}")
+    return os.path.join(config.TENANTS_DIR, tenant_id)
+
+
+def exists(tenant_id: str) -> bool:
+    return is_valid_id(tenant_id) and os.path.isdir(tenant_dir(tenant_id))
+
+
+def list_tenants() -> list[str]:
+    if not os.path.isdir(config.TENANTS_DIR):
+        return []
+    return sorted(name for name in os.listdir(config.TENANTS_DIR) if exists(name))
+
+
+def create_tenant(tenant_id: str) -> dict:
+    """テナントを作成してスキーマを初期化"""
+    path = tenant_dir(tenant_id)
+    if os.path.isdir(path):
+        raise ValueError(f"テナント {tenant_id} は既に存在します")
+    os.makedirs(path)
+    with use_tenant(tenant_id):
+        return {"tenant_id": tenant_id, "db_path": db.current_db_path()}
+
+
+def _ensure_schema(tenant_id: str):
+    """初回使用時にテナントのDBを最新スキーマへ移行（以降はプロセス内で省略）"""
+    if tenant_id in _ready:
+        return
+    with _ready_lock:
+        if tenant_id not in _ready:
+            db.init_db()
+            _ready.add(tenant_id)
+
+
+@contextmanager
+def use_tenant(tenant_id: str):
+    """ブロック内のDB操作をテナントのデータディレクトリに向ける"""
+    if not exists(tenant_id):
+        raise ValueError(f"テナント {tenant_id} が見つかりません")
+    with db.use_data_dir(tenant_dir(tenant_id)):
+        _ensure_schema(tenant_id)
+        yield tenant_id
+
+
+def current_tenant() -> str | None:
+    data_dir = db.current_data_dir()
+    return os.path.basename(data_dir) if data_dir else None
+
+
+# ─── トークン ──────────────────────────────────
+
+def tag_token(token: str) -> str:
+    """テナント使用中ならトークンにテナントIDを付ける（回答時にテナントを判定するため）"""
+    tenant_id = current_tenant()
+    return f"{tenant_id}{TOKEN_SEPARATOR}{token}" if tenant_id else token
+
+
+def tenant_from_token(token: str) -> str | None:
+    # 生成するトークン本体は URLセーフBase64 + 16進数なので "." を含まない
+    tenant_id, sep, _ = (token or "").partition(TOKEN_SEPARATOR)
+    return tenant_id if sep and is_valid_id(tenant_id) else None
+
+
+# ─── リクエストからの判定 ───────────────────────────
+
+class PathPrefixMiddleware:
+    """/t/<テナントID>/... の接頭辞を取り除き、テナントIDを environ に記録するWSGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path.startswith(PATH_PREFIX):
+            tenant_id, _, rest = path[len(PATH_PREFIX):].partition("/")
+            if is_valid_id(tenant_id):
+                environ[ENVIRON_KEY] = tenant_id
+                environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + PATH_PREFIX + tenant_id
+                environ["PATH_INFO"] = "/" + rest
+        return self.app(environ, start_response)
+
+
+def resolve(request) -> str | None:
+    """Flask のリクエストからテナントIDを判定（見つからなければ None）"""
+    tenant_id = request.environ.get(ENVIRON_KEY) or request.headers.get("X-Tenant-ID")
+    if tenant_id:
+        return tenant_id
+    if config.TENANT_DOMAIN:
+        host = request.host.split(":", 1)[0]
+        suffix = "." + config.TENANT_DOMAIN
+        if host.endswith(suffix) and host != config.TENANT_DOMAIN:
+            return host[:-len(suffix)]
+    token = (request.view_args or {}).get("token")
+    if token is None and request.is_json:
+        token = (request.get_json(silent=True) or {}).get("token")
+    return tenant_from_token(token) if isinstance(token, str) else None
+
+
+# ─── 指標 ──────────────────────────────────────
+
+def record_request(tenant_id: str, seconds: float, status: int):
+    """テナントごとのリクエスト数・エラー数・処理時間を記録"""
+    with _metrics_lock:
+        m = _metrics.setdefault(tenant_id, {
+            "requests": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0, "last_request_at": None,
+        })
+        m["requests"] += 1
+        m["errors"] += status >= 500
+        m["total_seconds"] += seconds
+        m["max_seconds"] = max(m["max_seconds"], seconds)
+        m["last_request_at"] = datetime.now().isoformat(timespec="seconds")
+
+
+def get_metrics() -> list[dict]:
+    """全テナントの指標（リクエスト数・平均処理時間・待機中の読み取り接続数・DBサイズ）"""
+    pools = db.read_pool_stats()
+    with _metrics_lock:
+        snapshot = {k: dict(v) for k, v in _metrics.items()}
+    result = []
+    for tenant_id in list_tenants():
+        m = snapshot.get(tenant_id, {"requests": 0, "errors": 0, "total_seconds": 0.0,
+                                     "max_seconds": 0.0, "last_request_at": None})
+        db_path = os.path.join(tenant_dir(tenant_id), "survey.db")
+        result.append({
+            "tenant_id": tenant_id,
+            "requests": m["requests"],
+            "errors": m["errors"],
+            "avg_ms": round(m["total_seconds"] / m["requests"] * 1000, 1) if m["requests"] else 0,
+            "max_ms": round(m["max_seconds"] * 1000, 1),
+            "last_request_at": m["last_request_at"],
+            "idle_read_connections": pools.get(db_path),
+            "db_bytes": os.path.getsize(db_path) if os.path.exists(db_path) else 0,
+        })
+    return result
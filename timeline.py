@@ -0,0 +1,128 @@
+"""
+対応タイムラインモジュール
+従業員ごとの回答・アラート・対応記録・メール送信を1本の時系列（新しい順）にまとめて返す
+
+- 種類ごとに (employee_id, 日時) のインデックスで必要な件数だけ読み、UNION ALL で合流する
+- ページ送りはカーソル（最後の項目の 日時・種類・id）より古いものを読むキーセット方式
+  （OFFSET を使わないので、何年分の履歴があってもページごとの読み取り量は一定）
+- アーカイブ済みの回答・アラート・メールログも同じ並びで含める
+"""
+import base64
+import json
+
+import database as db
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# 種類 → (テーブル, 日時の列, 詳細に含める列, アーカイブ対象か)
+# 同じ日時の項目は rank の大きい順（回答 → アラート → 対応記録の発生順を新しい順に並べる）
+SOURCES = {
+    "email": ("email_logs", "sent_at", ["email_type", "status", "error_message"], True),
+    "response": ("responses", "submitted_at",
+                 ["work_satisfaction", "relationships", "health", "extra_answer", "comment", "interview_request"], True),
+    "alert": ("alerts", "created_at", ["response_id", "severity", "dimension", "score", "status"], True),
+    "note": ("follow_up_notes", "created_at", ["author", "note", "action_type"], False),
+}
+KINDS = list(SOURCES)
+_RANK = {kind: i for i, kind in enumerate(KINDS)}
+
+
+def encode_cursor(item: dict) -> str:
+    raw = json.dumps([item["at"], item["kind"], item["id"]], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str, int]:
+    try:
+        at, kind, item_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if kind not in SOURCES:
+            raise ValueError
+        return str(at), kind, int(item_id)
+    except (ValueError, TypeError):
+        raise ValueError("カーソルが不正です") from None
+
+
+def _source_sql(kind: str, schema: str, cursor) -> tuple[str, list]:
+    """1種類 × 1スキーマ分の SELECT（カーソルより古いものを新しい順に）"""
+    table, at, columns, _ = SOURCES[kind]
+    detail = ", ".join(f"'{c}', x.{c}" for c in columns)
+    where, params = ["x.employee_id = ?", f"x.{at} IS NOT NULL"], []
+    if cursor:
+        c_at, c_kind, c_id = cursor
+        # 並びは (日時, 種類, id) の降順。種類は定数なのでカーソルとの大小で条件が決まる
+        if _RANK[kind] < _RANK[c_kind]:
+            where.append(f"x.{at} <= ?")
+            params.append(c_at)
+        elif kind == c_kind:
+            where.append(f"(x.{at}, x.id) < (?, ?)")
+            params += [c_at, c_id]
+        else:
+            where.append(f"x.{at} < ?")
+            params.append(c_at)
+    sql = f"""SELECT * FROM (
+                  SELECT '{kind}' as kind, {_RANK[kind]} as rank, x.id, x.{at} as at, x.survey_id,
+                         json_object({detail}) as detail
+                  FROM {schema}.{table} x
+                  WHERE {" AND ".join(where)}
+                  ORDER BY x.{at} DESC, x.id DESC LIMIT ?)"""
+    return sql, params
+
+
+def get_timeline(employee_id: int, cursor: str = None, limit: int = DEFAULT_LIMIT,
+                 kinds: list[str] = None) -> dict:
+    """
+    従業員の対応タイムライン（新しい順）
+    - cursor: 前のページの next_cursor（省略時は最新から）
+    - kinds: 含める種類（email / response / alert / note、省略時は全て）
+    - 戻り値: {"employee": {...}, "items": [...], "next_cursor": 次ページのカーソル | None}
+    """
+    kinds = kinds or KINDS
+    unknown = [k for k in kinds if k not in SOURCES]
+    if unknown:
+        raise ValueError(f"種類は {', '.join(KINDS)} から指定してください: {', '.join(unknown)}")
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    position = decode_cursor(cursor) if cursor else None
+
+    with db.get_read_db() as conn:
+        employee = conn.execute(
+            "SELECT id, name, email, department, join_year, is_active FROM employees WHERE id = ?",
+            (employee_id,),
+        ).fetchone()
+        if employee is None:
+            raise ValueError(f"従業員ID {employee_id} が見つかりません")
+        schemas = [r["name"] for r in conn.execute("PRAGMA database_list").fetchall()
+                   if r["name"] == "main" or r["name"].startswith("archive_")]
+
+        selects, params = [], []
+        for kind in kinds:
+            for schema in schemas if SOURCES[kind][3] else ["main"]:
+                sql, source_params = _source_sql(kind, schema, position)
+                selects.append(sql)
+                # 各ソースから1件多く読み、次ページの有無を判定する
+                params += [employee_id, *source_params, limit + 1]
+        rows = conn.execute(
+            f"""SELECT t.*, s.year_month
+                FROM ({" UNION ALL ".join(selects)}) t
+                LEFT JOIN surveys s ON s.id = t.survey_id
+                ORDER BY t.at DESC, t.rank DESC, t.id DESC
+                LIMIT ?""",
+            params + [limit + 1],
+        ).fetchall()
+
+    items = [
+        {
+            "kind": r["kind"],
+            "id": r["id"],
+            "at": r["at"],
+            "survey_id": r["survey_id"],
+            "year_month": r["year_month"],
+            **json.loads(r["detail"]),
+        }
+        for r in rows[:limit]
+    ]
+    return {
+        "employee": dict(employee),
+        "items": items,
+        "next_cursor": encode_cursor(items[-1]) if len(rows) > limit else None,
+    }
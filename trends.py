@@ -0,0 +1,132 @@
+"""
+月次推移分析モジュール
+締切時に確定した集計（survey_rollups）から部門・全社の推移と前月比の低下を算出
+"""
+import math
+
+import database as db
+
+
+def _summarize(n: int, total: float, total_sq: float) -> dict:
+    """件数・合計・二乗和から平均と標準偏差を算出"""
+    mean = total / n
+    variance = max(total_sq / n - mean * mean, 0.0)
+    return {"n": n, "mean": round(mean, 2), "sd": round(math.sqrt(variance), 2)}
+
+
+def _group_by_survey(rollups: list[dict]) -> dict:
+    """集計行をサーベイごとに {設問: 統計} へまとめる（year_month順を維持）"""
+    surveys = {}
+    for r in rollups:
+        entry = surveys.setdefault(r["survey_id"], {
+            "survey_id": r["survey_id"],
+            "year_month": r["year_month"],
+            "scores": {},
+        })
+        entry["scores"][r["dimension"]] = _summarize(r["n"], r["total"], r["total_sq"])
+    for entry in surveys.values():
+        means = [s["mean"] for s in entry["scores"].values()]
+        entry["n"] = max(s["n"] for s in entry["scores"].values())
+        entry["overall"] = round(sum(means) / len(means), 2)
+    return surveys
+
+
+def get_trends(department: str = None, since: str = None, until: str = None) -> list[dict]:
+    """
+    部門（省略時は全社）のスコア推移
+    - 戻り値: [{"year_month", "n", "overall", "scores": {設問: {n, mean, sd}}}, ...]
+    """
+    rollups = db.get_rollups(department=department, since=since, until=until)
+    return list(_group_by_survey(rollups).values())
+
+
+def _department_scores(survey_id: int) -> dict:
+    """部門ごとの {設問: 平均} と総合スコア"""
+    depts = {}
+    for r in db.get_department_rollups(survey_id):
+        dept = depts.setdefault(r["department"], {"n": r["n"], "scores": {}})
+        dept["scores"][r["dimension"]] = r["total"] / r["n"]
+    for dept in depts.values():
+        dept["overall"] = sum(dept["scores"].values()) / len(dept["scores"])
+    return depts
+
+
+def get_department_drops(survey_id: int, limit: int = None) -> dict:
+    """
+    前回の締切済みサーベイからの部門別スコア低下
+    低下幅（総合スコア）の大きい順に返す
+    """
+    previous = db.get_previous_closed_survey(survey_id)
+    if not previous:
+        return {"survey_id": survey_id, "previous_survey_id": None, "drops": []}
+
+    current = _department_scores(survey_id)
+    before = _department_scores(previous["id"])
+    drops = []
+    for dept, cur in current.items():
+        prev = before.get(dept)
+        if not prev:
+            continue
+        drops.append({
+            "department": dept,
+            "n": cur["n"],
+            "previous_overall": round(prev["overall"], 2),
+            "overall": round(cur["overall"], 2),
+            "drop": round(prev["overall"] - cur["overall"], 2),
+            "dimension_drops": {
+                key: round(prev["scores"][key] - cur["scores"][key], 2)
+                for key in cur["scores"] if key in prev["scores"]
+            },
+        })
+    drops.sort(key=lambda d: d["drop"], reverse=True)
+    return {
+        "survey_id": survey_id,
+        "previous_survey_id": previous["id"],
+        "previous_year_month": previous["year_month"],
+        "drops": drops[:limit] if limit else drops,
+    }
+
+
+def get_comment_themes(survey_id: int, department: str = None,
+                       limit: int = 20, min_count: int = 2) -> dict:
+    """
+    コメントの頻出キーワードと、前回の締切済みサーベイから増えたテーマ
+    出現率（その語を含むコメント数 / コメント数）の差で上昇幅を測る
+    """
+    current = db.get_comment_terms(survey_id, department=department)
+    previous = db.get_previous_closed_survey(survey_id)
+    before = db.get_comment_terms(previous["id"], department=department) if previous else None
+
+    def share(n: int, total: int) -> float:
+        return n / total * 100 if total else 0.0
+
+    before_counts = {t["term"]: t["n"] for t in before["terms"]} if before else {}
+    rising = []
+    if before:
+        for t in current["terms"]:
+            if t["n"] < min_count:
+                continue
+            now = share(t["n"], current["comment_count"])
+            then = share(before_counts.get(t["term"], 0), before["comment_count"])
+            if now > then:
+                rising.append({
+                    "term": t["term"],
+                    "n": t["n"],
+                    "previous_n": before_counts.get(t["term"], 0),
+                    "share": round(now, 1),
+                    "previous_share": round(then, 1),
+                    "change": round(now - then, 1),
+                })
+        rising.sort(key=lambda r: r["change"], reverse=True)
+
+    return {
+        "survey_id": survey_id,
+        "department": department,
+        "comment_count": current["comment_count"],
+        "previous_survey_id": previous["id"] if previous else None,
+        "top": [
+            {**t, "share": round(share(t["n"], current["comment_count"]), 1)}
+            for t in current["terms"][:limit]
+        ],
+        "rising": rising[:limit],
+    }